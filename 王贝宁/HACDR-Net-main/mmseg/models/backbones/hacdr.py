@@ -3,14 +3,57 @@ import warnings
 
 import torch
 import torch.nn as nn
-from mmcv.cnn import build_activation_layer, build_norm_layer
+import torch.nn.functional as F
+from mmcv.cnn import (build_activation_layer, build_conv_layer,
+                      build_norm_layer)
 from mmcv.cnn.bricks import DropPath
 from mmcv.cnn.utils.weight_init import (constant_init, normal_init,
                                         trunc_normal_init)
 from mmcv.runner import BaseModule
+
 from ..builder import BACKBONES
-from mmcv.ops import ModulatedDeformConv2dPack as DCNv2
 
+try:
+    # registers the compiled op as 'DCNv2' in CONV_LAYERS
+    from mmcv.ops import ModulatedDeformConv2dPack
+except ImportError:
+    ModulatedDeformConv2dPack = None
+
+
+def _bn_scale_shift(bn):
+    """Per-channel ``(scale, shift)`` of a BatchNorm in eval mode."""
+    scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+    shift = bn.bias - bn.running_mean * scale
+    return scale, shift
+
+
+def _fuse_conv_bn(conv, bn):
+    """Fold a BatchNorm that follows ``conv`` into the conv, in place."""
+    scale, shift = _bn_scale_shift(bn)
+    bias = conv.bias if conv.bias is not None else \
+        torch.zeros_like(bn.running_mean)
+    conv.weight.data = conv.weight * scale.view(-1, 1, 1, 1)
+    conv.bias = nn.Parameter(bias * scale + shift)
+
+
+def _fuse_bn_conv(bn, conv):
+    """Fold a BatchNorm that precedes the 1x1 ``conv`` into it, in place."""
+    scale, shift = _bn_scale_shift(bn)
+    weight = conv.weight[:, :, 0, 0]
+    bias = conv.bias if conv.bias is not None else \
+        weight.new_zeros(weight.shape[0])
+    conv.bias = nn.Parameter(bias + weight @ shift)
+    conv.weight.data = conv.weight * scale.view(1, -1, 1, 1)
+
+
+def _scale_conv(conv, scale, shift=None):
+    """Fold ``out * scale + shift`` into the output of ``conv``, in place."""
+    bias = conv.bias if conv.bias is not None else scale.new_zeros(
+        scale.shape)
+    if shift is not None:
+        bias = bias + shift
+    conv.weight.data = conv.weight * scale.view(-1, 1, 1, 1)
+    conv.bias = nn.Parameter(bias * scale)
 
 
 class DFFN(BaseModule):
@@ -132,6 +175,16 @@ class StemConv(BaseModule):
         x = x.flatten(2).transpose(1, 2)
         return x, H, W
 
+    @torch.no_grad()
+    def switch_to_deploy(self):
+        """Fold the BatchNorms into the preceding convs."""
+        layers = list(self.proj)
+        if not isinstance(layers[1], nn.modules.batchnorm._BatchNorm):
+            return
+        _fuse_conv_bn(layers[0], layers[1])
+        _fuse_conv_bn(layers[3], layers[4])
+        self.proj = nn.Sequential(layers[0], layers[2], layers[3])
+
 
 class HAAAttention(BaseModule):
     """
@@ -142,13 +195,17 @@ class HAAAttention(BaseModule):
         paddings (list): The number of
             corresponding padding value in attention module.
             Defaults: [2, [0, 3], [0, 5], [0, 10]].
+        dcn_cfg (dict): Config dict for the deformable convs, e.g.
+            ``dict(type='DCNv2Torch')`` for the pure PyTorch implementation.
+            Default: dict(type='DCNv2').
     """
 
     def __init__(self,
                  channels,
                  kernel_sizes=[5, [1, 7], [1, 11], [1, 21]],
                  paddings=[2, [0, 3], [0, 5], [0, 10]],
-                 optopnal_kernel=0):
+                 optopnal_kernel=0,
+                 dcn_cfg=dict(type='DCNv2')):
         super().__init__()
         # self.conv0 = nn.Conv2d(
         #     channels,
@@ -156,7 +213,8 @@ class HAAAttention(BaseModule):
         #     kernel_size=kernel_sizes[0],
         #     padding=paddings[0],
         #     groups=channels)
-        self.conv0 = DCNv2(
+        self.conv0 = build_conv_layer(
+            dcn_cfg,
             channels,
             channels,
             kernel_size=kernel_sizes[0],
@@ -213,14 +271,16 @@ class HAAAttention(BaseModule):
                 )
 
         self.conv3 = nn.Conv2d(channels, channels, 1)
-        self.conv3_1 = DCNv2(
+        self.conv3_1 = build_conv_layer(
+            dcn_cfg,
             in_channels=channels,
             out_channels=channels,
             kernel_size=tuple([1, 3]),
             padding=[0, 1],
             deform_groups=channels,
         )
-        self.conv3_2 = DCNv2(
+        self.conv3_2 = build_conv_layer(
+            dcn_cfg,
             in_channels=channels,
             out_channels=channels,
             kernel_size=tuple([3, 1]),
@@ -229,14 +289,16 @@ class HAAAttention(BaseModule):
         )
         if optopnal_kernel != 0:
             self.optional = 1
-            self.optional_1 = DCNv2(
+            self.optional_1 = build_conv_layer(
+                dcn_cfg,
                 in_channels=channels,
                 out_channels=channels,
                 kernel_size=tuple([1, optopnal_kernel]),
                 padding=[0, optopnal_kernel / 2],
                 deform_groups=channels,
             )
-            self.optional_2 = DCNv2(
+            self.optional_2 = build_conv_layer(
+                dcn_cfg,
                 in_channels=channels,
                 out_channels=channels,
                 kernel_size=tuple([optopnal_kernel, 1]),
@@ -245,10 +307,98 @@ class HAAAttention(BaseModule):
             )
         else:
             self.optional = None
+        self.deploy = False
+
+    @torch.no_grad()
+    def switch_to_deploy(self, fuse_strips=False):
+        """Re-parameterize the block for inference.
+
+        The plain depthwise strip branches ``conv{i}_1 -> conv{i}_2`` and the
+        identity term are linear, so their sum equals one dense depthwise
+        convolution (``conv_reparam``). The bias of the first strip conv is
+        zero-padded by the second one, which makes its contribution depend
+        on the row near the top/bottom border; it is reproduced exactly by a
+        1-D convolution over the rows (``_row_bias``). The deformable
+        branches are kept.
+
+        Args:
+            fuse_strips (bool): Whether to fuse the strip branches. The fused
+                KxK kernel needs K * K multiply-adds per pixel instead of
+                2 * (7 + 11 + 21), so it only pays off where the kernel
+                launches dominate, e.g. small inputs on GPU. If False, only
+                the copy of the input is dropped. Default: False.
+        """
+        if self.deploy:
+            return
+        self.deploy = True
+        self.conv_reparam = None
+        if not fuse_strips:
+            return
+        branches = []
+        i = 0
+        while hasattr(self, f'conv{i}_1') and hasattr(self, f'conv{i}_2') \
+                and isinstance(getattr(self, f'conv{i}_1'), nn.Conv2d):
+            branches.append((getattr(self, f'conv{i}_1'),
+                             getattr(self, f'conv{i}_2')))
+            i += 1
+        channels = self.conv3.in_channels
+        size = max(max(conv_h.kernel_size[1], conv_v.kernel_size[0])
+                   for conv_h, conv_v in branches)
+        size += 1 - size % 2
+        center = size // 2
+        weight = self.conv3.weight.new_zeros(channels, 1, size, size)
+        weight[:, 0, center, center] = 1
+        row_kernel = weight.new_zeros(channels, 1, size)
+        bias = weight.new_zeros(channels)
+        for conv_h, conv_v in branches:
+            # horizontal (1, k) followed by vertical (k, 1) depthwise conv
+            k_w, p_w = conv_h.kernel_size[1], conv_h.padding[1]
+            k_h, p_h = conv_v.kernel_size[0], conv_v.padding[0]
+            assert conv_h.kernel_size[0] == 1 and conv_v.kernel_size[1] == 1
+            assert conv_h.groups == conv_v.groups == channels
+            w_h = conv_h.weight[:, 0, 0]
+            w_v = conv_v.weight[:, 0, :, 0]
+            y, x = center - p_h, center - p_w
+            weight[:, 0, y:y + k_h, x:x + k_w] += \
+                w_v.unsqueeze(2) * w_h.unsqueeze(1)
+            if conv_h.bias is not None:
+                row_kernel[:, 0, y:y + k_h] += \
+                    conv_h.bias.unsqueeze(1) * w_v
+            if conv_v.bias is not None:
+                bias += conv_v.bias
+
+        conv_reparam = nn.Conv2d(
+            channels,
+            channels,
+            size,
+            padding=center,
+            groups=channels,
+            bias=False).to(weight)
+        conv_reparam.weight.data = weight
+        self.conv_reparam = conv_reparam
+        self.register_buffer('reparam_row_kernel', row_kernel)
+        self.register_buffer('reparam_bias', bias)
+        for i in range(len(branches)):
+            delattr(self, f'conv{i}_1')
+            delattr(self, f'conv{i}_2')
+
+    def _row_bias(self, height):
+        """Bias of the re-parameterized branches, shape (1, C, H, 1)."""
+        ones = self.reparam_bias.new_ones(1, self.reparam_bias.shape[0],
+                                          height)
+        row_bias = F.conv1d(
+            ones,
+            self.reparam_row_kernel,
+            padding=self.reparam_row_kernel.shape[-1] // 2,
+            groups=ones.shape[1])
+        return (row_bias + self.reparam_bias.view(1, -1, 1)).unsqueeze(-1)
 
     def forward(self, x):
         """Forward function."""
 
+        if self.deploy:
+            return self.forward_deploy(x)
+
         u = x.clone()
 
         attn = self.conv0(x)
@@ -279,6 +429,21 @@ class HAAAttention(BaseModule):
 
         return x
 
+    def forward_deploy(self, x):
+        """Forward function after :meth:`switch_to_deploy`."""
+
+        attn = self.conv0(x)
+        if self.conv_reparam is not None:
+            out = self.conv_reparam(attn) + self._row_bias(attn.shape[2])
+        else:
+            out = attn + self.conv0_2(self.conv0_1(attn)) + \
+                self.conv1_2(self.conv1_1(attn)) + \
+                self.conv2_2(self.conv2_1(attn))
+        out = out + self.conv3_2(self.conv3_1(attn))
+        if self.optional is not None:
+            out = out + self.optional_2(self.optional_1(attn))
+        return self.conv3(out) * x
+
 
 class HAASpatialAttention(BaseModule):
     """
@@ -290,30 +455,36 @@ class HAASpatialAttention(BaseModule):
             corresponding padding value in attention module.
         act_cfg (dict): Config dict for activation layer in block.
             Default: dict(type='GELU').
+        dcn_cfg (dict): Config dict for the deformable convs.
+            Default: dict(type='DCNv2').
     """
 
     def __init__(self,
                  in_channels,
                  attention_kernel_sizes=[5, [1, 7], [1, 11], [1, 21]],
                  attention_kernel_paddings=[2, [0, 3], [0, 5], [0, 10]],
-                 act_cfg=dict(type='GELU')):
+                 act_cfg=dict(type='GELU'),
+                 dcn_cfg=dict(type='DCNv2')):
         super().__init__()
         self.proj_1 = nn.Conv2d(in_channels, in_channels, 1)
         self.activation = build_activation_layer(act_cfg)
         self.spatial_gating_unit = HAAAttention(in_channels,
                                                 attention_kernel_sizes,
-                                                attention_kernel_paddings, optopnal_kernel=0)
+                                                attention_kernel_paddings, optopnal_kernel=0,
+                                                dcn_cfg=dcn_cfg)
         self.proj_2 = nn.Conv2d(in_channels, in_channels, 1)
+        self.with_shortcut = True
 
     def forward(self, x):
         """Forward function."""
 
-        shorcut = x.clone()
+        shorcut = x.clone() if self.with_shortcut else None
         x = self.proj_1(x)
         x = self.activation(x)
         x = self.spatial_gating_unit(x)
         x = self.proj_2(x)
-        x = x + shorcut
+        if self.with_shortcut:
+            x = x + shorcut
         return x
 
 
@@ -337,6 +508,8 @@ class HCABlock(BaseModule):
             Default: dict(type='GELU').
         norm_cfg (dict): Config dict for normalization layer.
             Defaults: dict(type='SyncBN', requires_grad=True).
+        dcn_cfg (dict): Config dict for the deformable convs.
+            Default: dict(type='DCNv2').
     """
 
     def __init__(self,
@@ -347,11 +520,13 @@ class HCABlock(BaseModule):
                  drop=0.,
                  drop_path=0.,
                  act_cfg=dict(type='GELU'),
-                 norm_cfg=dict(type='SyncBN', requires_grad=True)):
+                 norm_cfg=dict(type='SyncBN', requires_grad=True),
+                 dcn_cfg=dict(type='DCNv2')):
         super().__init__()
         self.norm1 = build_norm_layer(norm_cfg, channels)[1]
         self.attn = HAASpatialAttention(channels, attention_kernel_sizes,
-                                        attention_kernel_paddings, act_cfg)
+                                        attention_kernel_paddings, act_cfg,
+                                        dcn_cfg)
         self.drop_path = DropPath(
             drop_path) if drop_path > 0. else nn.Identity()
         self.norm2 = build_norm_layer(norm_cfg, channels)[1]
@@ -368,12 +543,49 @@ class HCABlock(BaseModule):
         self.layer_scale_2 = nn.Parameter(
             layer_scale_init_value * torch.ones((channels)),
             requires_grad=True)
+        self.deploy = False
+
+    @torch.no_grad()
+    def switch_to_deploy(self, fuse_strips=False):
+        """Re-parameterize the block for inference.
+
+        ``norm1``/``norm2`` are folded into the 1x1 convs that follow them and
+        the layer scales into the 1x1 convs in front of them. The attention
+        shortcut ``layer_scale_1 * norm1(x)`` becomes a per-channel scale of
+        the residual (``shortcut_scale``), its shift goes into ``proj_2``.
+        Only valid for inference (dropout and drop path are removed).
+
+        Args:
+            fuse_strips (bool): See :meth:`HAAAttention.switch_to_deploy`.
+                Default: False.
+        """
+        if self.deploy:
+            return
+        attn = self.attn
+        attn.spatial_gating_unit.switch_to_deploy(fuse_strips)
+        scale, shift = _bn_scale_shift(self.norm1)
+        _fuse_bn_conv(self.norm1, attn.proj_1)
+        _scale_conv(attn.proj_2, self.layer_scale_1, shift)
+        attn.with_shortcut = False
+        self.register_buffer('shortcut_scale',
+                             (1 + self.layer_scale_1 * scale).view(
+                                 1, -1, 1, 1))
+        _fuse_bn_conv(self.norm2, self.DFFN.fc1)
+        _scale_conv(self.DFFN.fc2, self.layer_scale_2)
+        del self.norm1, self.norm2, self.layer_scale_1, self.layer_scale_2
+        self.drop_path = nn.Identity()
+        self.DFFN.drop = nn.Identity()
+        self.deploy = True
 
     def forward(self, x, H, W):
         """Forward function."""
 
         B, N, C = x.shape
         x = x.permute(0, 2, 1).view(B, C, H, W)
+        if self.deploy:
+            x = x * self.shortcut_scale + self.attn(x)
+            x = x + self.DFFN(x)
+            return x.view(B, C, N).permute(0, 2, 1)
         x = x + self.drop_path(
             self.layer_scale_1.unsqueeze(-1).unsqueeze(-1) *
             self.attn(self.norm1(x)))
@@ -390,7 +602,8 @@ class OverlapPatchEmbed(BaseModule):
                  stride=4,
                  in_channels=3,
                  embed_dim=768,
-                 norm_cfg=dict(type='SyncBN', requires_grad=True)):
+                 norm_cfg=dict(type='SyncBN', requires_grad=True),
+                 dcn_cfg=dict(type='DCNv2')):
         super().__init__()
 
         # self.proj = nn.Conv2d(
@@ -399,7 +612,8 @@ class OverlapPatchEmbed(BaseModule):
         #     kernel_size=patch_size,
         #     stride=stride,
         #     padding=patch_size // 2)
-        self.proj = DCNv2(
+        self.proj = build_conv_layer(
+            dcn_cfg,
             in_channels,
             embed_dim,
             kernel_size=patch_size,
@@ -420,6 +634,13 @@ class OverlapPatchEmbed(BaseModule):
 
         return x, H, W
 
+    @torch.no_grad()
+    def switch_to_deploy(self):
+        """Fold the BatchNorm into the (deformable) projection."""
+        if isinstance(self.norm, nn.modules.batchnorm._BatchNorm):
+            _fuse_conv_bn(self.proj, self.norm)
+            self.norm = nn.Identity()
+
 
 @BACKBONES.register_module()
 class HACDR(BaseModule):
@@ -436,6 +657,7 @@ class HACDR(BaseModule):
                  attention_kernel_paddings=[2, [0, 3], [0, 5], [0, 10]],
                  act_cfg=dict(type='GELU'),
                  norm_cfg=dict(type='BN', requires_grad=True),
+                 dcn_cfg=dict(type='DCNv2'),
                  pretrained=None,
                  init_cfg=None):
         super(HACDR, self).__init__(init_cfg=init_cfg)
@@ -448,6 +670,10 @@ class HACDR(BaseModule):
             self.init_cfg = dict(type='Pretrained', checkpoint=pretrained)
         elif pretrained is not None:
             raise TypeError('pretrained must be a str or None')
+        if dcn_cfg['type'] == 'DCNv2' and ModulatedDeformConv2dPack is None:
+            warnings.warn('mmcv.ops is not available, falling back to the '
+                          'pure PyTorch DCNv2 (DCNv2Torch)')
+            dcn_cfg = dict(dcn_cfg, type='DCNv2Torch')
 
         self.depths = depths
         self.num_stages = num_stages
@@ -466,7 +692,8 @@ class HACDR(BaseModule):
                     stride=4 if i == 0 else 2,
                     in_channels=in_channels if i == 0 else embed_dims[i - 1],
                     embed_dim=embed_dims[i],
-                    norm_cfg=norm_cfg)
+                    norm_cfg=norm_cfg,
+                    dcn_cfg=dcn_cfg)
 
             block = nn.ModuleList([
                 HCABlock(
@@ -477,7 +704,8 @@ class HACDR(BaseModule):
                     drop=drop_rate,
                     drop_path=dpr[cur + j],
                     act_cfg=act_cfg,
-                    norm_cfg=norm_cfg) for j in range(depths[i])
+                    norm_cfg=norm_cfg,
+                    dcn_cfg=dcn_cfg) for j in range(depths[i])
             ])
             norm = nn.LayerNorm(embed_dims[i])
             cur += depths[i]
@@ -505,6 +733,25 @@ class HACDR(BaseModule):
         else:
             super(HACDR, self).init_weights()
 
+    def switch_to_deploy(self, fuse_strips=False):
+        """Re-parameterize the backbone for inference.
+
+        Folds BatchNorms and layer scales into the adjacent convs and,
+        optionally, the linear branches of every :class:`HAAAttention` into
+        one depthwise kernel. Call after loading the weights and before
+        inference; the model can not be trained afterwards.
+
+        Args:
+            fuse_strips (bool): See :meth:`HAAAttention.switch_to_deploy`.
+                Off by default as the dense 21x21 kernel is several times
+                slower than the strip convs on CPU. Default: False.
+        """
+        self.eval()
+        for i in range(self.num_stages):
+            getattr(self, f'patch_embed{i + 1}').switch_to_deploy()
+            for blk in getattr(self, f'block{i + 1}'):
+                blk.switch_to_deploy(fuse_strips)
+
     def forward(self, x):
         """Forward function."""
 
@@ -16,6 +16,20 @@ from mmcv.cnn import xavier_init
 
 
 class M2MRF_Module(nn.Module):
+    """Many-to-many reassembly of patches.
+
+    Each ``size`` x ``size`` patch is encoded by two fully connected layers
+    into a ``size * scale_factor`` x ``size * scale_factor`` patch. As the
+    patches do not overlap, this is a space-to-depth (``pixel_unshuffle``),
+    two grouped 1x1 convs and a depth-to-space (``pixel_shuffle``), which
+    avoids materializing ``nn.Unfold`` columns and the scatter of
+    ``nn.Fold``. The space-to-depth is folded into the first conv when the
+    groups do not straddle input channels. The height and width of the
+    input must be divisible by ``size``.
+
+    Checkpoints of the former ``nn.Conv1d`` layers are converted on loading.
+    """
+
     def __init__(self,
                  scale_factor,
                  encode_channels,
@@ -30,18 +44,15 @@ class M2MRF_Module(nn.Module):
         self.fc_channels = fc_channels
 
         self.size = size
+        self.out_size = int(self.size * self.scale_factor)
         self.groups = groups
 
-        self.unfold_params = dict(kernel_size=self.size,
-                                  dilation=1, padding=0, stride=self.size)
-        self.fold_params = dict(kernel_size=int(self.size * self.scale_factor),
-                                dilation=1, padding=0, stride=int(self.size * scale_factor))
-        self.sample_fc = nn.Conv1d(
+        self.sample_fc = nn.Conv2d(
             self.size * self.size * self.encode_channels,
             self.fc_channels,
             groups=self.groups,
             kernel_size=1)
-        self.sample_fc1 = nn.Conv1d(
+        self.sample_fc1 = nn.Conv2d(
             self.fc_channels,
             int(self.size * self.size * self.scale_factor * self.scale_factor * self.encode_channels),
             groups=self.groups,
@@ -53,13 +64,35 @@ class M2MRF_Module(nn.Module):
             if isinstance(m, nn.Conv2d) or isinstance(m, nn.Conv1d):
                 xavier_init(m, distribution='uniform')
 
+    def _load_from_state_dict(self, state_dict, prefix, local_metadata,
+                              strict, missing_keys, unexpected_keys,
+                              error_msgs):
+        # weights of the Conv1d layers are (out, in, 1)
+        for name in ('sample_fc', 'sample_fc1'):
+            key = f'{prefix}{name}.weight'
+            if key in state_dict and state_dict[key].dim() == 3:
+                state_dict[key] = state_dict[key].unsqueeze(-1)
+        super(M2MRF_Module, self)._load_from_state_dict(
+            state_dict, prefix, local_metadata, strict, missing_keys,
+            unexpected_keys, error_msgs)
+
     def forward(self, x):
-        n, c, h, w = x.shape
-        x = nn.Unfold(**self.unfold_params)(x)
-        x = x.view(n, c * self.size * self.size, -1)
-        x = self.sample_fc(x)
+        if self.encode_channels % self.groups == 0:
+            # the 1x1 conv on the unshuffled patches is a conv with
+            # kernel_size = stride = size, which skips the copy
+            weight = self.sample_fc.weight.view(
+                self.fc_channels, self.encode_channels // self.groups,
+                self.size, self.size)
+            x = F.conv2d(
+                x,
+                weight,
+                self.sample_fc.bias,
+                stride=self.size,
+                groups=self.groups)
+        else:
+            x = self.sample_fc(F.pixel_unshuffle(x, self.size))
         x = self.sample_fc1(x)
-        x = nn.Fold((int(h * self.scale_factor), int(w * self.scale_factor)), **self.fold_params)(x)
+        x = F.pixel_shuffle(x, self.out_size)
         return x
 
 
@@ -699,6 +732,10 @@ class HRNet_M2MRF(nn.Module):
                     kaiming_init(m)
                 elif isinstance(m, (_BatchNorm, nn.GroupNorm)):
                     constant_init(m, 1)
+            # keep the xavier init of the 1x1 convs of M2MRF_Module
+            for m in self.modules():
+                if isinstance(m, M2MRF_Module):
+                    m.init_weights()
 
             if self.zero_init_residual:
                 for m in self.modules():
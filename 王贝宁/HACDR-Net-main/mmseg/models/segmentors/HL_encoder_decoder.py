@@ -7,6 +7,7 @@ from mmseg.core import add_prefix
 from mmseg.ops import resize
 from .. import builder
 from ..builder import SEGMENTORS
+from ..utils import fov_skip_windows, slide_inference_batched
 from .base import BaseSegmentor
 from copy import deepcopy
 
@@ -181,43 +182,41 @@ class HLEncoderDecoder(BaseSegmentor):
         losses.update({"weight_loss": -0.01 * ((HL_map * decode_loss_copy_detach).sum())})
         return losses
 
-    # TODO refactor
     def slide_inference(self, img, img_meta, rescale):
         """Inference by sliding-window with overlap.
 
         If h_crop > h_img or w_crop > w_img, the small patch will be used to
-        decode without padding.
+        decode without padding. ``test_cfg.crop_batch_size`` windows are
+        decoded per forward (default 1).
+
+        With ``test_cfg.fov`` set (e.g. ``dict(threshold=20, margin=16)``),
+        windows entirely outside the field of view of the fundus image get
+        constant background logits without running the network, see
+        :func:`mmseg.models.utils.fov_skip_windows`. The number of windows
+        and of skipped windows of the last call is kept in
+        ``self.slide_stats``.
         """
 
-        h_stride, w_stride = self.test_cfg.stride
-        h_crop, w_crop = self.test_cfg.crop_size
-        batch_size, _, h_img, w_img = img.size()
-        num_classes = self.num_classes
-        h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
-        w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
-        preds = img.new_zeros((batch_size, num_classes, h_img, w_img))
-        count_mat = img.new_zeros((batch_size, 1, h_img, w_img))
-        for h_idx in range(h_grids):
-            for w_idx in range(w_grids):
-                y1 = h_idx * h_stride
-                x1 = w_idx * w_stride
-                y2 = min(y1 + h_crop, h_img)
-                x2 = min(x1 + w_crop, w_img)
-                y1 = max(y2 - h_crop, 0)
-                x1 = max(x2 - w_crop, 0)
-                crop_img = img[:, :, y1:y2, x1:x2]
-                crop_seg_logit = self.encode_decode(crop_img, img_meta)
-                preds += F.pad(crop_seg_logit,
-                               (int(x1), int(preds.shape[3] - x2), int(y1),
-                                int(preds.shape[2] - y2)))
-
-                count_mat[:, :, y1:y2, x1:x2] += 1
-        assert (count_mat == 0).sum() == 0
-        if torch.onnx.is_in_onnx_export():
-            # cast count_mat to constant while exporting to ONNX
-            count_mat = torch.from_numpy(
-                count_mat.cpu().detach().numpy()).to(device=img.device)
-        preds = preds / count_mat
+        keep, skip_logits = None, None
+        if self.test_cfg.get('fov', None) is not None:
+            keep, skip_logits = fov_skip_windows(
+                img,
+                self.num_classes,
+                self.test_cfg.crop_size,
+                self.test_cfg.stride,
+                img_norm_cfg=img_meta[0].get('img_norm_cfg'),
+                **self.test_cfg.fov)
+            self.slide_stats = dict(
+                num_windows=len(keep), num_skipped=keep.count(False))
+        preds = slide_inference_batched(
+            lambda crop_img: self.encode_decode(crop_img, img_meta),
+            img,
+            self.num_classes,
+            crop_size=self.test_cfg.crop_size,
+            stride=self.test_cfg.stride,
+            crop_batch_size=self.test_cfg.get('crop_batch_size', 1),
+            keep=keep,
+            skip_logits=skip_logits)
         if rescale:
             preds = resize(
                 preds,
@@ -3,4 +3,9 @@ from .base import BaseSegmentor
 from .cascade_encoder_decoder import CascadeEncoderDecoder
 from .encoder_decoder import EncoderDecoder
 from .HL_encoder_decoder import HLEncoderDecoder
-__all__ = ['BaseSegmentor', 'EncoderDecoder', 'CascadeEncoderDecoder','HLEncoderDecoder']
+from .segmentor_inference import SegmentorInference, script_segmentor
+
+__all__ = [
+    'BaseSegmentor', 'EncoderDecoder', 'CascadeEncoderDecoder',
+    'HLEncoderDecoder', 'SegmentorInference', 'script_segmentor'
+]
@@ -7,6 +7,8 @@ from mmseg.core import add_prefix
 from mmseg.ops import resize
 from .. import builder
 from ..builder import SEGMENTORS
+from ..utils import (fov_skip_windows, slide_inference_batched, slide_windows,
+                     windows_overlapping)
 from .base import BaseSegmentor
 
 
@@ -154,43 +156,100 @@ class EncoderDecoder(BaseSegmentor):
 
         return losses
 
-    # TODO refactor
     def slide_inference(self, img, img_meta, rescale):
         """Inference by sliding-window with overlap.
 
         If h_crop > h_img or w_crop > w_img, the small patch will be used to
-        decode without padding.
+        decode without padding. ``test_cfg.crop_batch_size`` windows are
+        decoded per forward (default 1).
+
+        With ``test_cfg.fov`` set (e.g. ``dict(threshold=20, margin=16)``),
+        windows entirely outside the field of view of the fundus image get
+        constant background logits without running the network, see
+        :func:`mmseg.models.utils.fov_skip_windows`. The number of windows
+        and of skipped windows of the last call is kept in
+        ``self.slide_stats``.
         """
 
-        h_stride, w_stride = self.test_cfg.stride
-        h_crop, w_crop = self.test_cfg.crop_size
-        batch_size, _, h_img, w_img = img.size()
-        out_channels = self.out_channels
-        h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
-        w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
-        preds = img.new_zeros((batch_size, out_channels, h_img, w_img))
-        count_mat = img.new_zeros((batch_size, 1, h_img, w_img))
-        for h_idx in range(h_grids):
-            for w_idx in range(w_grids):
-                y1 = h_idx * h_stride
-                x1 = w_idx * w_stride
-                y2 = min(y1 + h_crop, h_img)
-                x2 = min(x1 + w_crop, w_img)
-                y1 = max(y2 - h_crop, 0)
-                x1 = max(x2 - w_crop, 0)
-                crop_img = img[:, :, y1:y2, x1:x2]
-                crop_seg_logit = self.encode_decode(crop_img, img_meta)
-                preds += F.pad(crop_seg_logit,
-                               (int(x1), int(preds.shape[3] - x2), int(y1),
-                                int(preds.shape[2] - y2)))
-
-                count_mat[:, :, y1:y2, x1:x2] += 1
-        assert (count_mat == 0).sum() == 0
-        if torch.onnx.is_in_onnx_export():
-            # cast count_mat to constant while exporting to ONNX
-            count_mat = torch.from_numpy(
-                count_mat.cpu().detach().numpy()).to(device=img.device)
-        preds = preds / count_mat
+        keep, skip_logits = None, None
+        if self.test_cfg.get('fov', None) is not None:
+            keep, skip_logits = fov_skip_windows(
+                img,
+                self.out_channels,
+                self.test_cfg.crop_size,
+                self.test_cfg.stride,
+                img_norm_cfg=img_meta[0].get('img_norm_cfg'),
+                **self.test_cfg.fov)
+            self.slide_stats = dict(
+                num_windows=len(keep), num_skipped=keep.count(False))
+        preds = slide_inference_batched(
+            lambda crop_img: self.encode_decode(crop_img, img_meta),
+            img,
+            self.out_channels,
+            crop_size=self.test_cfg.crop_size,
+            stride=self.test_cfg.stride,
+            crop_batch_size=self.test_cfg.get('crop_batch_size', 1),
+            keep=keep,
+            skip_logits=skip_logits)
+        if rescale:
+            # remove padding area
+            resize_shape = img_meta[0]['img_shape'][:2]
+            preds = preds[:, :, :resize_shape[0], :resize_shape[1]]
+            preds = resize(
+                preds,
+                size=img_meta[0]['ori_shape'][:2],
+                mode='bilinear',
+                align_corners=self.align_corners,
+                warning=False)
+        return preds
+
+    def cascade_inference(self, img, img_meta, rescale):
+        """Coarse-to-fine inference.
+
+        The whole image is first decoded at ``test_cfg.coarse_scale``. Only
+        the sliding windows (``test_cfg.crop_size`` / ``test_cfg.stride``)
+        where the coarse lesion probability exceeds ``test_cfg.threshold``
+        are decoded again at full resolution; elsewhere the upsampled coarse
+        logits are kept, and both are averaged where refined and coarse
+        windows overlap. The number of windows and of refined windows of the
+        last call is kept in ``self.cascade_stats``.
+        """
+
+        h_img, w_img = img.shape[2:]
+        coarse_scale = self.test_cfg.get('coarse_scale', 0.5)
+        coarse_img = resize(
+            img,
+            scale_factor=coarse_scale,
+            mode='bilinear',
+            align_corners=self.align_corners)
+        coarse_logit = self.encode_decode(coarse_img, img_meta)
+        if self.out_channels == 1:
+            lesion_prob = coarse_logit.sigmoid()[:, :1]
+        else:
+            lesion_prob = 1 - coarse_logit.softmax(dim=1)[:, :1]
+        windows = slide_windows(
+            h_img, w_img, tuple(int(s) for s in self.test_cfg.crop_size),
+            tuple(int(s) for s in self.test_cfg.stride))
+        keep = windows_overlapping(
+            lesion_prob > self.test_cfg.get('threshold', 0.3), windows,
+            coarse_logit.shape[2] / h_img)
+        self.cascade_stats = dict(
+            num_windows=len(keep), num_refined=keep.count(True))
+
+        coarse_logit = resize(
+            coarse_logit,
+            size=(h_img, w_img),
+            mode='bilinear',
+            align_corners=self.align_corners)
+        preds = slide_inference_batched(
+            lambda crop_img: self.encode_decode(crop_img, img_meta),
+            img,
+            self.out_channels,
+            crop_size=self.test_cfg.crop_size,
+            stride=self.test_cfg.stride,
+            crop_batch_size=self.test_cfg.get('crop_batch_size', 1),
+            keep=keep,
+            skip_logits=coarse_logit)
         if rescale:
             # remove padding area
             resize_shape = img_meta[0]['img_shape'][:2]
@@ -226,7 +285,7 @@ class EncoderDecoder(BaseSegmentor):
         return seg_logit
 
     def inference(self, img, img_meta, rescale):
-        """Inference with slide/whole style.
+        """Inference with slide/whole/cascade style.
 
         Args:
             img (Tensor): The input image of shape (N, 3, H, W).
@@ -241,11 +300,13 @@ class EncoderDecoder(BaseSegmentor):
             Tensor: The output segmentation map.
         """
 
-        assert self.test_cfg.mode in ['slide', 'whole']
+        assert self.test_cfg.mode in ['slide', 'whole', 'cascade']
         ori_shape = img_meta[0]['ori_shape']
         assert all(_['ori_shape'] == ori_shape for _ in img_meta)
         if self.test_cfg.mode == 'slide':
             seg_logit = self.slide_inference(img, img_meta, rescale)
+        elif self.test_cfg.mode == 'cascade':
+            seg_logit = self.cascade_inference(img, img_meta, rescale)
         else:
             seg_logit = self.whole_inference(img, img_meta, rescale)
         if self.out_channels == 1:
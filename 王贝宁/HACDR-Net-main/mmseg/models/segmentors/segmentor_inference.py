@@ -0,0 +1,188 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import copy
+from typing import List, Optional
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class _EncodeDecode(nn.Module):
+    """Backbone, neck and decode head(s) of a segmentor as one module.
+
+    Same computation as :meth:`EncoderDecoder.encode_decode`, but calls the
+    ``forward`` of the decode heads directly instead of ``forward_test`` so
+    that no ``img_metas`` or ``test_cfg`` are involved.
+    """
+
+    def __init__(self, segmentor):
+        super(_EncodeDecode, self).__init__()
+        self.backbone = segmentor.backbone
+        self.neck = segmentor.neck if segmentor.with_neck else None
+        self.decode_head = segmentor.decode_head
+        self.cascade = isinstance(segmentor.decode_head, nn.ModuleList)
+        self.align_corners = segmentor.align_corners
+
+    def forward(self, img):
+        x = self.backbone(img)
+        if self.neck is not None:
+            x = self.neck(x)
+        if self.cascade:
+            out = self.decode_head[0](x)
+            for head in self.decode_head[1:]:
+                out = head(x, out)
+        else:
+            out = self.decode_head(x)
+        return F.interpolate(
+            out,
+            size=img.shape[2:],
+            mode='bilinear',
+            align_corners=self.align_corners)
+
+
+class SegmentorInference(nn.Module):
+    """Tensor-in/tensor-out inference of an :class:`EncoderDecoder`.
+
+    :meth:`EncoderDecoder.inference` depends on ``img_metas``, ONNX export
+    branches and cached numpy window grids, which get in the way of graph
+    capture. This module holds the same sub-modules and only static
+    attributes, so ``torch.compile(module, fullgraph=True)`` captures it
+    without graph breaks and :func:`script_segmentor` exports it to
+    TorchScript. Parameters are shared with the wrapped segmentor.
+
+    Only the plain whole and slide inference is supported: flipping, batched
+    crops and the field-of-view window skipping of ``test_cfg`` are ignored,
+    and the input is expected to be unpadded.
+
+    Args:
+        segmentor (EncoderDecoder): Segmentor to wrap, in eval mode.
+        mode (str, optional): 'whole' or 'slide'. Default: None, which takes
+            ``segmentor.test_cfg.mode``.
+        crop_size (tuple[int], optional): (h, w) of the sliding window.
+            Default: None, which takes ``segmentor.test_cfg.crop_size``.
+        stride (tuple[int], optional): (h, w) stride of the sliding window.
+            Default: None, which takes ``segmentor.test_cfg.stride``.
+        output (str): 'logit' for the raw logits, 'prob' for the softmax (or
+            sigmoid for a single output channel) and 'argmax' for the label
+            map of shape (N, H, W). Default: 'prob'.
+    """
+
+    def __init__(self,
+                 segmentor,
+                 mode=None,
+                 crop_size=None,
+                 stride=None,
+                 output='prob'):
+        super(SegmentorInference, self).__init__()
+        test_cfg = segmentor.test_cfg or dict()
+        if mode is None:
+            mode = test_cfg.get('mode', 'whole')
+        if mode not in ('whole', 'slide'):
+            raise ValueError(f'unsupported inference mode {mode}, expected '
+                             "'whole' or 'slide'")
+        if output not in ('logit', 'prob', 'argmax'):
+            raise ValueError(f'unsupported output {output}, expected '
+                             "'logit', 'prob' or 'argmax'")
+        self.encoder = _EncodeDecode(segmentor)
+        self.slide = mode == 'slide'
+        self.output = output
+        # segmentors such as HLEncoderDecoder only define num_classes
+        self.out_channels = int(
+            getattr(segmentor, 'out_channels', segmentor.num_classes))
+        self.align_corners = bool(segmentor.align_corners)
+        decode_head = segmentor.decode_head
+        if isinstance(decode_head, nn.ModuleList):
+            decode_head = decode_head[-1]
+        threshold = getattr(decode_head, 'threshold', None)
+        self.threshold = 0.3 if threshold is None else float(threshold)
+
+        self.h_crop, self.w_crop = 0, 0
+        self.h_stride, self.w_stride = 0, 0
+        if self.slide:
+            if crop_size is None:
+                crop_size = test_cfg['crop_size']
+            if stride is None:
+                stride = test_cfg['stride']
+            self.h_crop, self.w_crop = (int(s) for s in crop_size)
+            self.h_stride, self.w_stride = (int(s) for s in stride)
+
+    def slide_inference(self, img):
+        """Sliding window logits of ``img`` with shape (N, C, H, W)."""
+        batch_size = img.size(0)
+        h_img, w_img = img.size(2), img.size(3)
+        h_crop, w_crop = self.h_crop, self.w_crop
+        h_stride, w_stride = self.h_stride, self.w_stride
+        h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
+        w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
+        preds = img.new_zeros((batch_size, self.out_channels, h_img, w_img))
+        count_mat = img.new_zeros((1, 1, h_img, w_img))
+        for h_idx in range(h_grids):
+            for w_idx in range(w_grids):
+                y1 = h_idx * h_stride
+                x1 = w_idx * w_stride
+                y2 = min(y1 + h_crop, h_img)
+                x2 = min(x1 + w_crop, w_img)
+                y1 = max(y2 - h_crop, 0)
+                x1 = max(x2 - w_crop, 0)
+                crop_seg_logit = self.encoder(img[:, :, y1:y2, x1:x2])
+                preds[:, :, y1:y2, x1:x2] += crop_seg_logit
+                count_mat[:, :, y1:y2, x1:x2] += 1
+        return preds / count_mat
+
+    def forward(self, img, out_shape: Optional[List[int]] = None):
+        """Segment ``img``.
+
+        Args:
+            img (Tensor): Normalized images with shape (N, 3, H, W).
+            out_shape (list[int], optional): (h, w) to resize the logits to,
+                e.g. the original image size. Default: None.
+
+        Returns:
+            Tensor: Logits or probabilities with shape (N, C, h, w), or the
+                label map with shape (N, h, w), see ``output``.
+        """
+        if self.slide:
+            seg_logit = self.slide_inference(img)
+        else:
+            seg_logit = self.encoder(img)
+        if out_shape is not None:
+            seg_logit = F.interpolate(
+                seg_logit,
+                size=out_shape,
+                mode='bilinear',
+                align_corners=self.align_corners)
+        if self.output == 'logit':
+            return seg_logit
+        if self.out_channels == 1:
+            seg_prob = torch.sigmoid(seg_logit)
+            if self.output == 'argmax':
+                return (seg_prob > self.threshold).squeeze(1).long()
+            return seg_prob
+        if self.output == 'argmax':
+            return seg_logit.argmax(dim=1)
+        return F.softmax(seg_logit, dim=1)
+
+
+def script_segmentor(module, example_img):
+    """Export a :class:`SegmentorInference` to TorchScript.
+
+    Backbones and heads are usually not scriptable, so the encoder is traced
+    on ``example_img`` (a crop in slide mode) and the remaining inference
+    logic is scripted. The sliding window loop and ``out_shape`` thus stay
+    dynamic in the exported module. ``module`` itself is left unchanged.
+
+    Args:
+        module (SegmentorInference): Module to export.
+        example_img (Tensor): Example input of the encoder, with shape
+            (N, 3, H, W).
+
+    Returns:
+        torch.jit.ScriptModule: The scripted module.
+    """
+    module = copy.deepcopy(module).eval()
+    if module.slide:
+        example_img = example_img[:, :, :module.h_crop, :module.w_crop]
+    with torch.no_grad():
+        module.encoder = torch.jit.trace(
+            module.encoder, example_img, check_trace=False)
+    return torch.jit.script(module)
@@ -7,10 +7,15 @@ from .se_layer import SELayer
 from .self_attention_block import SelfAttentionBlock
 from .shape_convert import (nchw2nlc2nchw, nchw_to_nlc, nlc2nchw2nlc,
                             nlc_to_nchw)
+from .sliding_window import (fov_keep_windows, fov_mask, fov_skip_windows,
+                             slide_count_mat, slide_inference_batched,
+                             slide_windows, windows_overlapping)
 from .up_conv_block import UpConvBlock
 
 __all__ = [
     'ResLayer', 'SelfAttentionBlock', 'make_divisible', 'InvertedResidual',
     'UpConvBlock', 'InvertedResidualV3', 'SELayer', 'PatchEmbed',
-    'nchw_to_nlc', 'nlc_to_nchw', 'nchw2nlc2nchw', 'nlc2nchw2nlc'
+    'nchw_to_nlc', 'nlc_to_nchw', 'nchw2nlc2nchw', 'nlc2nchw2nlc',
+    'slide_windows', 'slide_count_mat', 'slide_inference_batched', 'fov_mask',
+    'fov_keep_windows', 'fov_skip_windows', 'windows_overlapping'
 ]
@@ -0,0 +1,243 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+from functools import lru_cache
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+
+@lru_cache(maxsize=16)
+def slide_windows(h_img, w_img, crop_size, stride):
+    """Compute the sliding windows covering an image.
+
+    Windows at the right/bottom border are shifted back so that every window
+    has the same size ``min(crop, img)``, which allows stacking them into a
+    batch.
+
+    Args:
+        h_img (int): Image height.
+        w_img (int): Image width.
+        crop_size (tuple[int]): Window size (h_crop, w_crop).
+        stride (tuple[int]): Window stride (h_stride, w_stride).
+
+    Returns:
+        tuple[tuple[int]]: Windows as (y1, y2, x1, x2), in row-major order.
+    """
+    h_crop, w_crop = crop_size
+    h_stride, w_stride = stride
+    h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
+    w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
+    windows = []
+    for h_idx in range(h_grids):
+        for w_idx in range(w_grids):
+            y1 = h_idx * h_stride
+            x1 = w_idx * w_stride
+            y2 = min(y1 + h_crop, h_img)
+            x2 = min(x1 + w_crop, w_img)
+            y1 = max(y2 - h_crop, 0)
+            x1 = max(x2 - w_crop, 0)
+            windows.append((y1, y2, x1, x2))
+    return tuple(windows)
+
+
+@lru_cache(maxsize=4)
+def slide_count_mat(h_img, w_img, crop_size, stride):
+    """Number of windows covering each pixel, shape (1, 1, h_img, w_img).
+
+    Computed once per input shape with numpy, so it is also a constant when
+    exporting to ONNX.
+    """
+    count_mat = np.zeros((1, 1, h_img, w_img), dtype=np.float32)
+    for y1, y2, x1, x2 in slide_windows(h_img, w_img, crop_size, stride):
+        count_mat[:, :, y1:y2, x1:x2] += 1
+    assert (count_mat == 0).sum() == 0
+    return count_mat
+
+
+def fov_mask(img, img_norm_cfg=None, threshold=20., scale=8, closing=2):
+    """Cheap field-of-view mask of fundus images.
+
+    The image is reduced to cells of ``scale`` x ``scale`` pixels, cells whose
+    mean intensity (max over channels, in [0, 255]) exceeds ``threshold`` are
+    foreground, and a morphological closing fills dark vessels and lesions
+    inside the disc.
+
+    Args:
+        img (Tensor): Input images with shape (N, C, H, W).
+        img_norm_cfg (dict, optional): ``img_norm_cfg`` of the image meta,
+            used to undo the normalization. If None, ``img`` is assumed to be
+            in [0, 255].
+        threshold (float): Intensity threshold. Default: 20.
+        scale (int): Cell size in pixels. Default: 8.
+        closing (int): Radius (in cells) of the closing. Default: 2.
+
+    Returns:
+        Tensor: Bool mask with shape (N, 1, ceil(H / scale), ceil(W / scale)).
+    """
+    if img_norm_cfg is not None:
+        mean = img.new_tensor(img_norm_cfg['mean']).view(1, -1, 1, 1)
+        std = img.new_tensor(img_norm_cfg['std']).view(1, -1, 1, 1)
+        img = img * std + mean
+    intensity = img.amax(dim=1, keepdim=True)
+    mask = (F.avg_pool2d(intensity, scale, ceil_mode=True) > threshold).to(
+        intensity.dtype)
+    if closing > 0:
+        # pad with background so that the closing near the image border
+        # behaves as on an unbounded image
+        kernel, pad = 2 * closing + 1, 2 * closing
+        mask = F.max_pool2d(F.pad(mask, (pad, ) * 4), kernel, 1, closing)
+        mask = -F.max_pool2d(-mask, kernel, 1, closing)
+        mask = mask[:, :, pad:-pad, pad:-pad]
+    return mask > 0
+
+
+def fov_keep_windows(img,
+                     windows,
+                     img_norm_cfg=None,
+                     threshold=20.,
+                     margin=16,
+                     scale=8,
+                     closing=2):
+    """Select the sliding windows that overlap the field of view.
+
+    Args:
+        img (Tensor): Input images with shape (N, C, H, W).
+        windows (tuple[tuple[int]]): Windows from :func:`slide_windows`.
+        img_norm_cfg (dict, optional): See :func:`fov_mask`.
+        threshold (float): See :func:`fov_mask`.
+        margin (int): The FOV is grown by this many pixels so that windows
+            touching the rim of the disc are always decoded. Default: 16.
+        scale (int): See :func:`fov_mask`.
+        closing (int): See :func:`fov_mask`.
+
+    Returns:
+        list[bool]: Whether each window overlaps the FOV of any image in the
+            batch.
+    """
+    mask = fov_mask(img, img_norm_cfg, threshold, scale, closing)
+    return windows_overlapping(
+        mask, windows, 1. / scale, pad=-(-margin // scale))
+
+
+def windows_overlapping(mask, windows, scale, pad=0):
+    """Select the windows that overlap a (low resolution) mask.
+
+    Args:
+        mask (Tensor): Bool mask with shape (N, 1, h, w), a window is selected
+            if it overlaps the mask of any image in the batch.
+        windows (tuple[tuple[int]]): Windows in image coordinates.
+        scale (float): Mask size / image size.
+        pad (int): Grow each window by this many mask pixels. Default: 0.
+
+    Returns:
+        list[bool]: Whether each window overlaps the mask.
+    """
+    mask = mask.any(dim=0)[0].cpu().numpy()
+    keep = []
+    for y1, y2, x1, x2 in windows:
+        cells = mask[max(int(np.floor(y1 * scale)) - pad, 0):
+                     int(np.ceil(y2 * scale)) + pad,
+                     max(int(np.floor(x1 * scale)) - pad, 0):
+                     int(np.ceil(x2 * scale)) + pad]
+        keep.append(bool(cells.any()))
+    return keep
+
+
+def fov_skip_windows(img,
+                     out_channels,
+                     crop_size,
+                     stride,
+                     img_norm_cfg=None,
+                     bg_logit=10.,
+                     **kwargs):
+    """Windows to skip in sliding-window inference of fundus images.
+
+    Args:
+        img (Tensor): Input images with shape (N, C, H, W).
+        out_channels (int): Number of output channels of the segmentor.
+        crop_size (tuple[int]): Window size (h_crop, w_crop).
+        stride (tuple[int]): Window stride (h_stride, w_stride).
+        img_norm_cfg (dict, optional): See :func:`fov_mask`.
+        bg_logit (float): Background logit of the skipped windows, the other
+            classes get 0. With a single output channel (sigmoid) the
+            foreground logit is ``-bg_logit``. Default: 10.
+        kwargs: Other arguments of :func:`fov_keep_windows`.
+
+    Returns:
+        tuple[list[bool], Tensor]: ``keep`` and ``skip_logits`` for
+            :func:`slide_inference_batched`.
+    """
+    windows = slide_windows(img.shape[2], img.shape[3],
+                            tuple(int(s) for s in crop_size),
+                            tuple(int(s) for s in stride))
+    keep = fov_keep_windows(img, windows, img_norm_cfg, **kwargs)
+    if out_channels == 1:
+        skip_logits = img.new_full((1, ), -bg_logit)
+    else:
+        skip_logits = img.new_zeros((out_channels, ))
+        skip_logits[0] = bg_logit
+    return keep, skip_logits
+
+
+def slide_inference_batched(encode_fn,
+                            img,
+                            out_channels,
+                            crop_size,
+                            stride,
+                            crop_batch_size=1,
+                            keep=None,
+                            skip_logits=None):
+    """Sliding-window inference with mini-batched crops.
+
+    Windows are stacked into mini-batches of ``crop_batch_size`` windows and
+    decoded by one call of ``encode_fn`` per mini-batch. The logits of each
+    window are accumulated into the output in place, so no full-image tensor
+    is allocated per window.
+
+    Windows with ``keep`` False are not decoded and contribute
+    ``skip_logits`` instead, either constant logits or a full logit map
+    (e.g. of a coarse pass). Pixels covered only by kept windows get exactly
+    the same logits as without skipping.
+
+    Args:
+        encode_fn (callable): Maps a batch of crops (M, C, h, w) to logits
+            (M, out_channels, h, w).
+        img (Tensor): Input images with shape (N, C, H, W).
+        out_channels (int): Number of output channels of ``encode_fn``.
+        crop_size (tuple[int]): Window size (h_crop, w_crop).
+        stride (tuple[int]): Window stride (h_stride, w_stride).
+        crop_batch_size (int): Number of windows per forward. Default: 1.
+        keep (list[bool], optional): Whether to decode each window. Default:
+            None, decode all windows.
+        skip_logits (Tensor, optional): Logits used for skipped windows, with
+            shape (out_channels, ) or (N, out_channels, H, W). Required if
+            ``keep`` is given.
+
+    Returns:
+        Tensor: Averaged logits with shape (N, out_channels, H, W).
+    """
+    batch_size, _, h_img, w_img = img.size()
+    crop_size = tuple(int(s) for s in crop_size)
+    stride = tuple(int(s) for s in stride)
+    windows = slide_windows(h_img, w_img, crop_size, stride)
+    preds = img.new_zeros((batch_size, out_channels, h_img, w_img))
+    if keep is not None:
+        skip_logits = skip_logits.to(preds)
+        if skip_logits.dim() == 1:
+            skip_logits = skip_logits.view(1, -1, 1, 1).expand_as(preds)
+        for window, decode in zip(windows, keep):
+            if not decode:
+                y1, y2, x1, x2 = window
+                preds[:, :, y1:y2, x1:x2] += skip_logits[:, :, y1:y2, x1:x2]
+        windows = tuple(w for w, decode in zip(windows, keep) if decode)
+    for start in range(0, len(windows), crop_batch_size):
+        chunk = windows[start:start + crop_batch_size]
+        crop_imgs = torch.cat(
+            [img[:, :, y1:y2, x1:x2] for y1, y2, x1, x2 in chunk], dim=0)
+        crop_seg_logits = encode_fn(crop_imgs)
+        for i, (y1, y2, x1, x2) in enumerate(chunk):
+            preds[:, :, y1:y2, x1:x2] += \
+                crop_seg_logits[i * batch_size:(i + 1) * batch_size]
+    count_mat = torch.from_numpy(
+        slide_count_mat(h_img, w_img, crop_size, stride)).to(preds)
+    return preds / count_mat
@@ -1,5 +1,10 @@
 # Copyright (c) OpenMMLab. All rights reserved.
+from .deform_conv import (ModulatedDeformConv2dPackTorch,
+                          modulated_deform_conv2d_torch)
 from .encoding import Encoding
 from .wrappers import Upsample, resize
 
-__all__ = ['Upsample', 'resize', 'Encoding']
+__all__ = [
+    'Upsample', 'resize', 'Encoding', 'ModulatedDeformConv2dPackTorch',
+    'modulated_deform_conv2d_torch'
+]
@@ -0,0 +1,179 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from mmcv.cnn import CONV_LAYERS
+from torch.nn.modules.utils import _pair
+
+
+def modulated_deform_conv2d_torch(input,
+                                  offset,
+                                  mask,
+                                  weight,
+                                  bias=None,
+                                  stride=1,
+                                  padding=0,
+                                  dilation=1,
+                                  groups=1,
+                                  deform_groups=1):
+    """Modulated deformable convolution (DCNv2) in plain PyTorch.
+
+    Follows the semantics of ``mmcv.ops.modulated_deform_conv2d``: the offset
+    of kernel position ``k`` of deform group ``g`` is stored as (dy, dx) in
+    channels ``2 * (g * K + k)`` and ``2 * (g * K + k) + 1`` and its mask in
+    channel ``g * K + k``, with ``K = kh * kw``. Samples are bilinearly
+    interpolated with zeros outside the image.
+
+    All kernel positions and deform groups are sampled by a single
+    ``grid_sample`` call and the convolution is one batched matmul, so the op
+    runs on any device and can be traced for TorchScript and ONNX
+    (GridSample needs opset >= 16).
+
+    Args:
+        input (Tensor): Input with shape (N, C, H, W).
+        offset (Tensor): Offsets with shape (N, 2 * deform_groups * K,
+            H_out, W_out).
+        mask (Tensor): Modulation with shape (N, deform_groups * K, H_out,
+            W_out).
+        weight (Tensor): Weight with shape (C_out, C / groups, kh, kw).
+        bias (Tensor, optional): Bias with shape (C_out, ). Default: None.
+        stride (int | tuple[int]): Default: 1.
+        padding (int | tuple[int]): Default: 0.
+        dilation (int | tuple[int]): Default: 1.
+        groups (int): Number of convolution groups. Default: 1.
+        deform_groups (int): Number of offset groups. Default: 1.
+
+    Returns:
+        Tensor: Output with shape (N, C_out, H_out, W_out).
+    """
+    n, c, h, w = input.shape
+    out_channels, _, kh, kw = weight.shape
+    stride_h, stride_w = _pair(stride)
+    pad_h, pad_w = _pair(padding)
+    dil_h, dil_w = _pair(dilation)
+    h_out, w_out = offset.shape[2:]
+    num_points = kh * kw
+
+    # sampling positions without offsets, shape (K, H_out, W_out)
+    ys = torch.arange(h_out, device=input.device, dtype=input.dtype)
+    xs = torch.arange(w_out, device=input.device, dtype=input.dtype)
+    ky = torch.arange(kh, device=input.device, dtype=input.dtype)
+    kx = torch.arange(kw, device=input.device, dtype=input.dtype)
+    base_y = (ky * dil_h).view(kh, 1, 1, 1) + \
+        (ys * stride_h - pad_h).view(1, 1, h_out, 1)
+    base_x = (kx * dil_w).view(1, kw, 1, 1) + \
+        (xs * stride_w - pad_w).view(1, 1, 1, w_out)
+    base_y = base_y.expand(kh, kw, h_out, w_out).reshape(
+        num_points, h_out, w_out)
+    base_x = base_x.expand(kh, kw, h_out, w_out).reshape(
+        num_points, h_out, w_out)
+
+    offset = offset.view(n, deform_groups, num_points, 2, h_out, w_out)
+    y = base_y + offset[:, :, :, 0]
+    x = base_x + offset[:, :, :, 1]
+    # pixel coordinates to [-1, 1] with align_corners=False
+    grid = torch.stack(((2 * x + 1) / w - 1, (2 * y + 1) / h - 1), dim=-1)
+    grid = grid.view(n * deform_groups, num_points * h_out, w_out, 2)
+    sampled = F.grid_sample(
+        input.reshape(n * deform_groups, c // deform_groups, h, w),
+        grid,
+        mode='bilinear',
+        padding_mode='zeros',
+        align_corners=False)
+
+    # columns (N, groups, C / groups * K, L), channel-major like the weight
+    sampled = sampled.view(n, deform_groups, c // deform_groups, num_points,
+                           h_out * w_out)
+    sampled = sampled * mask.view(n, deform_groups, 1, num_points,
+                                  h_out * w_out)
+    columns = sampled.reshape(n, groups, c // groups * num_points,
+                              h_out * w_out)
+    output = torch.matmul(
+        weight.reshape(groups, out_channels // groups, -1), columns)
+    output = output.reshape(n, out_channels, h_out, w_out)
+    if bias is not None:
+        output = output + bias.view(1, -1, 1, 1)
+    return output
+
+
+@CONV_LAYERS.register_module('DCNv2Torch')
+class ModulatedDeformConv2dPackTorch(nn.Module):
+    """Drop-in replacement of ``mmcv.ops.ModulatedDeformConv2dPack``.
+
+    Same arguments, parameters and state dict keys as the compiled op, so
+    checkpoints can be loaded into either. Built with
+    ``dict(type='DCNv2Torch')`` where a model takes a conv config, e.g. the
+    ``dcn_cfg`` of :class:`HACDR`, to run on hosts without mmcv-full or to
+    export the model.
+
+    Args:
+        in_channels (int): Number of input channels.
+        out_channels (int): Number of output channels.
+        kernel_size (int | tuple[int]): Size of the convolving kernel.
+        stride (int | tuple[int]): Default: 1.
+        padding (int | tuple[int]): Default: 0.
+        dilation (int | tuple[int]): Default: 1.
+        groups (int): Number of convolution groups. Default: 1.
+        deform_groups (int): Number of offset groups. Default: 1.
+        bias (bool): Whether to add a learnable bias. Default: True.
+    """
+
+    def __init__(self,
+                 in_channels,
+                 out_channels,
+                 kernel_size,
+                 stride=1,
+                 padding=0,
+                 dilation=1,
+                 groups=1,
+                 deform_groups=1,
+                 bias=True):
+        super().__init__()
+        assert in_channels % groups == 0 and out_channels % groups == 0
+        assert in_channels % deform_groups == 0
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = tuple(_pair(kernel_size))
+        self.stride = tuple(_pair(stride))
+        self.padding = tuple(_pair(padding))
+        self.dilation = tuple(_pair(dilation))
+        self.groups = groups
+        self.deform_groups = deform_groups
+
+        self.weight = nn.Parameter(
+            torch.Tensor(out_channels, in_channels // groups,
+                         *self.kernel_size))
+        if bias:
+            self.bias = nn.Parameter(torch.Tensor(out_channels))
+        else:
+            self.register_parameter('bias', None)
+        self.conv_offset = nn.Conv2d(
+            in_channels,
+            deform_groups * 3 * self.kernel_size[0] * self.kernel_size[1],
+            kernel_size=self.kernel_size,
+            stride=self.stride,
+            padding=self.padding,
+            dilation=self.dilation,
+            bias=True)
+        self.init_weights()
+
+    def init_weights(self):
+        n = self.in_channels * self.kernel_size[0] * self.kernel_size[1]
+        stdv = 1. / math.sqrt(n)
+        self.weight.data.uniform_(-stdv, stdv)
+        if self.bias is not None:
+            self.bias.data.zero_()
+        self.conv_offset.weight.data.zero_()
+        self.conv_offset.bias.data.zero_()
+
+    def forward(self, x):
+        out = self.conv_offset(x)
+        o1, o2, mask = torch.chunk(out, 3, dim=1)
+        offset = torch.cat((o1, o2), dim=1)
+        mask = torch.sigmoid(mask)
+        return modulated_deform_conv2d_torch(x, offset, mask, self.weight,
+                                             self.bias, self.stride,
+                                             self.padding, self.dilation,
+                                             self.groups, self.deform_groups)
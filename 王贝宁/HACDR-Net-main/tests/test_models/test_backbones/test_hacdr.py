@@ -0,0 +1,115 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import os.path as osp
+import subprocess
+import sys
+
+import pytest
+import torch
+from torch import nn
+
+from mmseg.models.backbones import HACDR
+from mmseg.models.backbones.hacdr import HAAAttention
+
+
+def _randomize(model):
+    # non-trivial BN statistics, layer scales and biases
+    torch.manual_seed(0)
+    for name, p in model.named_parameters():
+        if 'layer_scale' in name or name.endswith('bias'):
+            p.data.uniform_(-0.5, 0.5)
+    for m in model.modules():
+        if isinstance(m, nn.modules.batchnorm._BatchNorm):
+            m.running_mean.uniform_(-0.5, 0.5)
+            m.running_var.uniform_(0.5, 2)
+            m.weight.data.uniform_(0.5, 1.5)
+
+
+def test_haa_attention_deploy():
+    attn = HAAAttention(8, dcn_cfg=dict(type='DCNv2Torch'))
+    _randomize(attn)
+    attn.eval()
+    # odd sizes smaller than the largest strip kernel hit the border terms
+    x = torch.randn(2, 8, 9, 13)
+    with torch.no_grad():
+        expected = attn(x)
+        attn.switch_to_deploy(fuse_strips=True)
+        out = attn(x)
+    assert attn.deploy
+    assert not hasattr(attn, 'conv0_1') and not hasattr(attn, 'conv2_2')
+    assert attn.conv_reparam.kernel_size == (21, 21)
+    assert torch.allclose(out, expected, atol=1e-5)
+
+    # the strip convs are kept by default
+    attn = HAAAttention(8, dcn_cfg=dict(type='DCNv2Torch'))
+    attn.eval()
+    attn.switch_to_deploy()
+    assert attn.deploy and attn.conv_reparam is None
+    assert hasattr(attn, 'conv0_1')
+
+
+@pytest.mark.parametrize('fuse_strips', [False, True])
+def test_hacdr_deploy(fuse_strips):
+    model = HACDR(
+        embed_dims=[8, 16, 32, 64],
+        DFFN_ratios=[2, 2, 2, 2],
+        depths=[1, 2, 1, 1],
+        drop_path_rate=0.1,
+        dcn_cfg=dict(type='DCNv2Torch'))
+    _randomize(model)
+    # non-zero offsets so that the deformable convs are exercised
+    for name, p in model.named_parameters():
+        if 'conv_offset.weight' in name:
+            p.data.normal_(std=0.1)
+    model.eval()
+
+    imgs = torch.randn(1, 3, 64, 96)
+    with torch.no_grad():
+        expected = model(imgs)
+        model.switch_to_deploy(fuse_strips=fuse_strips)
+        outs = model(imgs)
+    assert len(outs) == 4
+    assert outs[0].shape == (1, 8, 16, 24)
+    assert outs[3].shape == (1, 64, 2, 3)
+    for out, ref in zip(outs, expected):
+        assert out.shape == ref.shape
+        assert torch.allclose(out, ref, atol=1e-4, rtol=1e-4)
+    attn = model.block1[0].attn.spatial_gating_unit
+    assert (attn.conv_reparam is not None) == fuse_strips
+    # no BatchNorm left
+    assert not any(
+        isinstance(m, nn.modules.batchnorm._BatchNorm)
+        for m in model.modules())
+
+    # idempotent
+    model.switch_to_deploy()
+    with torch.no_grad():
+        assert torch.allclose(model(imgs)[3], outs[3])
+
+
+def test_hacdr_without_mmcv_ops():
+    # a fresh interpreter in which mmcv.ops cannot be imported, as on hosts
+    # without mmcv-full; the registries cannot be imported twice in-process
+    code = """
+import sys
+import warnings
+
+import torch
+
+sys.modules['mmcv.ops'] = None
+with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter('always')
+    from mmseg.models import build_backbone
+    from mmseg.ops import ModulatedDeformConv2dPackTorch
+    model = build_backbone(
+        dict(type='HACDR', embed_dims=[8, 16, 32, 64], depths=[1, 1, 1, 1]))
+assert any('DCNv2Torch' in str(w.message) for w in caught)
+assert any(
+    isinstance(m, ModulatedDeformConv2dPackTorch) for m in model.modules())
+model.eval()
+with torch.no_grad():
+    outs = model(torch.randn(1, 3, 64, 64))
+assert outs[3].shape == (1, 64, 2, 2)
+"""
+    root = osp.dirname(
+        osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+    subprocess.run([sys.executable, '-c', code], cwd=root, check=True)
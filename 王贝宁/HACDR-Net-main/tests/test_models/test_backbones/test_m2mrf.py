@@ -0,0 +1,102 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from mmseg.models.backbones.m2mrf import (M2MRF, HRNet_M2MRF_A, HRNet_M2MRF_B,
+                                          HRNet_M2MRF_C, HRNet_M2MRF_D,
+                                          M2MRF_Module)
+
+
+def _unfold_reference(module, x):
+    # the former implementation with Unfold, two Conv1d and Fold
+    n, c, h, w = x.shape
+    size, out_size = module.size, module.out_size
+    x = nn.Unfold(kernel_size=size, stride=size)(x)
+    x = F.conv1d(x, module.sample_fc.weight.squeeze(-1),
+                 module.sample_fc.bias, groups=module.groups)
+    x = F.conv1d(x, module.sample_fc1.weight.squeeze(-1),
+                 module.sample_fc1.bias, groups=module.groups)
+    return nn.Fold((int(h * module.scale_factor),
+                    int(w * module.scale_factor)),
+                   kernel_size=out_size,
+                   stride=out_size)(x)
+
+
+# groups=8 straddles the 4 encode channels and uses pixel_unshuffle
+@pytest.mark.parametrize('scale_factor, groups', [(2, 1), (8, 1), (0.5, 1),
+                                                  (0.125, 1), (2, 4), (2, 8)])
+def test_m2mrf_module(scale_factor, groups):
+    torch.manual_seed(0)
+    module = M2MRF_Module(
+        scale_factor, encode_channels=4, fc_channels=16, size=8,
+        groups=groups)
+    for m in module.modules():
+        if isinstance(m, nn.Conv2d):
+            m.bias.data.uniform_(-1, 1)
+    x = torch.randn(2, 4, 16, 24)
+    out = module(x)
+    assert out.shape == (2, 4, int(16 * scale_factor),
+                         int(24 * scale_factor))
+    assert torch.allclose(out, _unfold_reference(module, x), atol=1e-5)
+
+
+def test_m2mrf_load_conv1d_checkpoint():
+    torch.manual_seed(0)
+    m2mrf = M2MRF(2, in_channels=16, out_channels=8, patch_size=4)
+    state_dict = m2mrf.state_dict()
+    # checkpoints of the Conv1d implementation
+    legacy = {
+        k: v.squeeze(-1) if 'sample.sample_fc' in k and v.dim() == 4 else v
+        for k, v in state_dict.items()
+    }
+    assert legacy['sample.sample_fc1.weight'].dim() == 3
+
+    loaded = M2MRF(2, in_channels=16, out_channels=8, patch_size=4)
+    loaded.load_state_dict(legacy)
+    x = torch.randn(1, 16, 10, 6)
+    out = loaded(x)
+    assert out.shape == (1, 8, 20, 12)
+    assert torch.equal(out, m2mrf(x))
+
+
+@pytest.mark.parametrize(
+    'backbone', [HRNet_M2MRF_A, HRNet_M2MRF_B, HRNet_M2MRF_C, HRNet_M2MRF_D])
+def test_hrnet_m2mrf(backbone):
+    extra = dict(
+        stage1=dict(
+            num_modules=1,
+            num_branches=1,
+            block='BOTTLENECK',
+            num_blocks=(1, ),
+            num_channels=(16, )),
+        stage2=dict(
+            num_modules=1,
+            num_branches=2,
+            block='BASIC',
+            num_blocks=(1, 1),
+            num_channels=(16, 32)),
+        stage3=dict(
+            num_modules=1,
+            num_branches=3,
+            block='BASIC',
+            num_blocks=(1, 1, 1),
+            num_channels=(16, 32, 64)),
+        stage4=dict(
+            num_modules=1,
+            num_branches=4,
+            block='BASIC',
+            num_blocks=(1, 1, 1, 1),
+            num_channels=(16, 32, 64, 128)))
+    model = backbone(extra=extra)
+    model.init_weights()
+    model.train()
+
+    imgs = torch.randn(1, 3, 64, 64)
+    feats = model(imgs)
+    assert len(feats) == 4
+    assert feats[0].shape == torch.Size([1, 16, 16, 16])
+    assert feats[1].shape == torch.Size([1, 32, 8, 8])
+    assert feats[2].shape == torch.Size([1, 64, 4, 4])
+    assert feats[3].shape == torch.Size([1, 128, 2, 2])
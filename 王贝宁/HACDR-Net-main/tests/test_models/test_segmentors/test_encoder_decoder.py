@@ -29,6 +29,30 @@ def test_encoder_decoder():
     segmentor = build_segmentor(cfg)
     _segmentor_forward_train_test(segmentor)
 
+    # test slide mode with batched crops
+    cfg.test_cfg = ConfigDict(
+        mode='slide', crop_size=(3, 3), stride=(2, 2), crop_batch_size=4)
+    segmentor = build_segmentor(cfg)
+    _segmentor_forward_train_test(segmentor)
+
+    # test slide mode with field-of-view window skipping
+    cfg.test_cfg = ConfigDict(
+        mode='slide', crop_size=(3, 3), stride=(2, 2), fov=dict(threshold=0.5))
+    segmentor = build_segmentor(cfg)
+    _segmentor_forward_train_test(segmentor)
+    assert segmentor.slide_stats['num_windows'] == 32
+
+    # test cascade mode
+    cfg.test_cfg = ConfigDict(
+        mode='cascade',
+        coarse_scale=0.5,
+        crop_size=(3, 3),
+        stride=(2, 2),
+        threshold=0.5)
+    segmentor = build_segmentor(cfg)
+    _segmentor_forward_train_test(segmentor)
+    assert segmentor.cascade_stats['num_windows'] == 32
+
     # test 1 decode head, 1 aux head
     cfg = ConfigDict(
         type='EncoderDecoder',
@@ -0,0 +1,89 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import pytest
+import torch
+from mmcv import ConfigDict
+
+from mmseg.models import build_segmentor
+from mmseg.models.segmentors import SegmentorInference, script_segmentor
+from .utils import _demo_mm_inputs
+
+
+def _build_segmentor(test_cfg):
+    cfg = ConfigDict(
+        type='EncoderDecoder',
+        backbone=dict(type='ExampleBackbone'),
+        decode_head=dict(type='ExampleDecodeHead'),
+        train_cfg=None,
+        test_cfg=test_cfg)
+    return build_segmentor(cfg).eval()
+
+
+@pytest.mark.parametrize('test_cfg', [
+    dict(mode='whole'),
+    dict(mode='slide', crop_size=(5, 5), stride=(3, 4))
+])
+def test_segmentor_inference(test_cfg):
+    segmentor = _build_segmentor(ConfigDict(test_cfg))
+    mm_inputs = _demo_mm_inputs(input_shape=(2, 3, 10, 13))
+    img, img_metas = mm_inputs['imgs'], mm_inputs['img_metas']
+    with torch.no_grad():
+        expected = segmentor.inference(img, img_metas, rescale=False)
+
+        module = SegmentorInference(segmentor)
+        assert module.slide == (test_cfg['mode'] == 'slide')
+        assert torch.allclose(module(img), expected, atol=1e-6)
+        module.output = 'argmax'
+        assert torch.equal(module(img), expected.argmax(dim=1))
+        module.output = 'logit'
+        seg_logit = module(img, [20, 26])
+        assert seg_logit.shape == (2, 19, 20, 26)
+
+        # graph capture without breaks
+        if hasattr(torch, 'compile'):
+            compiled = torch.compile(module, fullgraph=True, backend='eager')
+            assert torch.allclose(compiled(img, [20, 26]), seg_logit)
+
+        # the sliding window loop stays dynamic in the scripted module
+        scripted = script_segmentor(module, img)
+        assert torch.allclose(scripted(img, [20, 26]), seg_logit, atol=1e-6)
+        larger_img = torch.rand(1, 3, 17, 11)
+        assert torch.allclose(
+            scripted(larger_img), module(larger_img), atol=1e-6)
+
+
+def test_segmentor_inference_binary():
+    segmentor = _build_segmentor(ConfigDict(mode='whole'))
+    segmentor.out_channels = 1
+    segmentor.decode_head.out_channels = 1
+    segmentor.decode_head.threshold = 0.4
+    segmentor.decode_head.conv_seg = torch.nn.Conv2d(3, 1, 1)
+    module = SegmentorInference(segmentor, output='argmax')
+    assert module.threshold == 0.4
+    img = torch.rand(1, 3, 8, 8)
+    with torch.no_grad():
+        seg_prob = segmentor.encode_decode(img, None).sigmoid()
+        assert torch.equal(module(img), (seg_prob > 0.4).squeeze(1).long())
+
+
+def test_segmentor_inference_without_out_channels():
+    # e.g. HLEncoderDecoder only defines num_classes
+    segmentor = _build_segmentor(ConfigDict(mode='whole'))
+    del segmentor.out_channels
+    module = SegmentorInference(segmentor, output='logit')
+    assert module.out_channels == segmentor.num_classes
+    assert module(torch.rand(1, 3, 8, 8)).shape == (1, 19, 8, 8)
+
+
+def test_segmentor_inference_invalid():
+    segmentor = _build_segmentor(
+        ConfigDict(
+            mode='cascade', coarse_scale=0.5, crop_size=(3, 3),
+            stride=(2, 2)))
+    with pytest.raises(ValueError):
+        SegmentorInference(segmentor)
+    with pytest.raises(ValueError):
+        SegmentorInference(segmentor, mode='whole', output='mask')
+    # the mode of test_cfg can be overridden
+    module = SegmentorInference(
+        segmentor, mode='slide', crop_size=(4, 4), stride=(2, 2))
+    assert (module.h_crop, module.w_stride) == (4, 2)
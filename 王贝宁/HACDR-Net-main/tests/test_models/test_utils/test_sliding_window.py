@@ -0,0 +1,185 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from mmseg.models.utils import (fov_keep_windows, fov_mask, fov_skip_windows,
+                                slide_count_mat, slide_inference_batched,
+                                slide_windows, windows_overlapping)
+
+
+def _reference_slide(encode_fn, img, out_channels, crop_size, stride):
+    # the per-window loop with full-image padding used before batching
+    h_stride, w_stride = stride
+    h_crop, w_crop = crop_size
+    batch_size, _, h_img, w_img = img.size()
+    h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
+    w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
+    preds = img.new_zeros((batch_size, out_channels, h_img, w_img))
+    count_mat = img.new_zeros((batch_size, 1, h_img, w_img))
+    for h_idx in range(h_grids):
+        for w_idx in range(w_grids):
+            y1 = h_idx * h_stride
+            x1 = w_idx * w_stride
+            y2 = min(y1 + h_crop, h_img)
+            x2 = min(x1 + w_crop, w_img)
+            y1 = max(y2 - h_crop, 0)
+            x1 = max(x2 - w_crop, 0)
+            crop_seg_logit = encode_fn(img[:, :, y1:y2, x1:x2])
+            preds += F.pad(crop_seg_logit,
+                           (int(x1), int(preds.shape[3] - x2), int(y1),
+                            int(preds.shape[2] - y2)))
+            count_mat[:, :, y1:y2, x1:x2] += 1
+    return preds / count_mat
+
+
+def test_slide_windows():
+    windows = slide_windows(10, 7, (4, 4), (3, 3))
+    # 3 rows x 2 cols, border windows shifted back inside the image
+    assert len(windows) == 6
+    assert windows[0] == (0, 4, 0, 4)
+    assert windows[-1] == (6, 10, 3, 7)
+    assert all(y2 - y1 == 4 and x2 - x1 == 4 for y1, y2, x1, x2 in windows)
+
+    # crop larger than the image: a single window of the image size
+    assert slide_windows(3, 5, (8, 8), (4, 4)) == ((0, 3, 0, 5), )
+
+    count_mat = slide_count_mat(10, 7, (4, 4), (3, 3))
+    assert count_mat.shape == (1, 1, 10, 7)
+    assert count_mat.min() >= 1
+    assert count_mat[0, 0, 3, 3] == 4
+
+
+@pytest.mark.parametrize('crop_batch_size', [1, 2, 3, 16])
+@pytest.mark.parametrize('img_shape', [(2, 3, 17, 23), (1, 3, 5, 6)])
+def test_slide_inference_batched(crop_batch_size, img_shape):
+    torch.manual_seed(0)
+    conv = nn.Conv2d(3, 5, 3, padding=1)
+    calls = []
+
+    def encode_fn(crop_img):
+        calls.append(crop_img.shape[0])
+        return conv(crop_img)
+
+    img = torch.rand(*img_shape)
+    with torch.no_grad():
+        expected = _reference_slide(conv, img, 5, (8, 8), (6, 6))
+        preds = slide_inference_batched(
+            encode_fn, img, 5, (8, 8), (6, 6),
+            crop_batch_size=crop_batch_size)
+
+    assert preds.shape == expected.shape
+    assert torch.allclose(preds, expected, atol=1e-6)
+    num_windows = len(slide_windows(img_shape[2], img_shape[3], (8, 8),
+                                    (6, 6)))
+    assert len(calls) == int(np.ceil(num_windows / crop_batch_size))
+    assert sum(calls) == num_windows * img_shape[0]
+
+
+def _demo_fundus(h=128, w=192, radius=40):
+    # bright disc on a black background, normalized like the fundus configs
+    yy, xx = np.mgrid[:h, :w]
+    disc = (yy - h / 2)**2 + (xx - w / 2)**2 < radius**2
+    rng = np.random.RandomState(0)
+    img = np.where(disc[None], rng.uniform(60, 200, (3, h, w)),
+                   rng.uniform(0, 6, (3, h, w)))
+    img_norm_cfg = dict(
+        mean=[116.513, 56.437, 16.309], std=[80.206, 41.232, 13.293])
+    mean = np.array(img_norm_cfg['mean']).reshape(3, 1, 1)
+    std = np.array(img_norm_cfg['std']).reshape(3, 1, 1)
+    img = torch.FloatTensor((img - mean) / std)[None]
+    return img, img_norm_cfg, torch.from_numpy(disc)
+
+
+def test_fov_mask():
+    img, img_norm_cfg, disc = _demo_fundus()
+    mask = fov_mask(img, img_norm_cfg, scale=8)
+    assert mask.shape == (1, 1, 16, 24)
+    assert mask.dtype == torch.bool
+    # disc centre is inside, image corners are outside
+    assert mask[0, 0, 8, 12]
+    assert not mask[0, 0, 0, 0] and not mask[0, 0, -1, -1]
+    # the closing does not shrink the disc
+    assert mask.sum() >= fov_mask(img, img_norm_cfg, closing=0).sum()
+
+    windows = slide_windows(128, 192, (32, 32), (16, 16))
+    keep = fov_keep_windows(img, windows, img_norm_cfg)
+    assert len(keep) == len(windows)
+    assert not all(keep) and any(keep)
+    # every window touching the disc is kept
+    for (y1, y2, x1, x2), decode in zip(windows, keep):
+        if disc[y1:y2, x1:x2].any():
+            assert decode
+
+
+@pytest.mark.parametrize('out_channels', [1, 5])
+def test_slide_inference_fov_skip(out_channels):
+    torch.manual_seed(0)
+    conv = nn.Conv2d(3, out_channels, 3, padding=1)
+    img, img_norm_cfg, disc = _demo_fundus()
+    crop_size, stride = (32, 32), (16, 16)
+
+    keep, skip_logits = fov_skip_windows(
+        img, out_channels, crop_size, stride, img_norm_cfg, bg_logit=8.)
+    assert skip_logits.shape == (out_channels, )
+    if out_channels == 1:
+        assert skip_logits[0] == -8.
+    else:
+        assert skip_logits[0] == 8. and (skip_logits[1:] == 0).all()
+
+    calls = []
+
+    def encode_fn(crop_img):
+        calls.append(crop_img.shape[0])
+        return conv(crop_img)
+
+    with torch.no_grad():
+        full = slide_inference_batched(conv, img, out_channels, crop_size,
+                                       stride)
+        skipped = slide_inference_batched(
+            encode_fn,
+            img,
+            out_channels,
+            crop_size,
+            stride,
+            keep=keep,
+            skip_logits=skip_logits)
+
+    assert sum(calls) == keep.count(True)
+    # bit-identical inside the field of view
+    assert torch.equal(full[..., disc], skipped[..., disc])
+    # constant background where only skipped windows contribute
+    assert torch.equal(skipped[0, :, 0, 0], skip_logits)
+
+
+def test_windows_overlapping():
+    windows = slide_windows(16, 16, (8, 8), (8, 8))
+    mask = torch.zeros(2, 1, 4, 4, dtype=torch.bool)
+    mask[1, 0, 3, 0] = True
+    # mask at 1/4 resolution, only the bottom-left window overlaps
+    assert windows_overlapping(mask, windows, 0.25) == [
+        False, False, True, False
+    ]
+    assert windows_overlapping(mask, windows, 0.25, pad=1) == [
+        False, False, True, False
+    ]
+    assert windows_overlapping(mask, windows, 0.25, pad=2) == [True] * 4
+
+
+def test_slide_inference_map_skip_logits():
+    torch.manual_seed(0)
+    conv = nn.Conv2d(3, 4, 3, padding=1)
+    img = torch.rand(1, 3, 16, 24)
+    coarse = torch.rand(1, 4, 16, 24)
+    windows = slide_windows(16, 24, (8, 8), (8, 8))
+    keep = [i == 0 for i in range(len(windows))]
+    with torch.no_grad():
+        full = slide_inference_batched(conv, img, 4, (8, 8), (8, 8))
+        preds = slide_inference_batched(
+            conv, img, 4, (8, 8), (8, 8), keep=keep, skip_logits=coarse)
+    # refined window from the network, the rest from the coarse map
+    assert torch.equal(preds[..., :8, :8], full[..., :8, :8])
+    assert torch.equal(preds[..., 8:, :], coarse[..., 8:, :])
+    assert torch.equal(preds[..., :8, 8:], coarse[..., :8, 8:])
@@ -0,0 +1,136 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+import numpy as np
+import pytest
+import torch
+import torch.nn.functional as F
+from mmcv.cnn import build_conv_layer
+
+from mmseg.ops import (ModulatedDeformConv2dPackTorch,
+                       modulated_deform_conv2d_torch)
+
+
+def _bilinear(img, y, x):
+    # sampling of the mmcv CUDA/CPU kernel, zero outside the image
+    h, w = img.shape
+    if not (-1 < y < h and -1 < x < w):
+        return 0.
+    y0, x0 = int(np.floor(y)), int(np.floor(x))
+    value = 0.
+    for yy, wy in ((y0, 1 - (y - y0)), (y0 + 1, y - y0)):
+        for xx, wx in ((x0, 1 - (x - x0)), (x0 + 1, x - x0)):
+            if 0 <= yy < h and 0 <= xx < w:
+                value += wy * wx * img[yy, xx]
+    return value
+
+
+def _reference(input, offset, mask, weight, bias, stride, padding, dilation,
+               groups, deform_groups):
+    # direct loop over outputs and kernel positions, in float64
+    input, offset, mask = input.double(), offset.double(), mask.double()
+    weight = weight.double()
+    n, c, h, w = input.shape
+    out_channels, _, kh, kw = weight.shape
+    h_out, w_out = offset.shape[2:]
+    cg, og = c // groups, out_channels // groups
+    output = torch.zeros(n, out_channels, h_out, w_out, dtype=torch.double)
+    for b in range(n):
+        for ci in range(c):
+            g = ci // (c // deform_groups)
+            img = input[b, ci].numpy()
+            for i in range(h_out):
+                for j in range(w_out):
+                    for ki in range(kh):
+                        for kj in range(kw):
+                            k = ki * kw + kj
+                            dy = offset[b, 2 * (g * kh * kw + k), i, j]
+                            dx = offset[b, 2 * (g * kh * kw + k) + 1, i, j]
+                            y = i * stride - padding + ki * dilation + dy
+                            x = j * stride - padding + kj * dilation + dx
+                            value = _bilinear(img, float(y), float(x)) * \
+                                mask[b, g * kh * kw + k, i, j]
+                            oc = slice(ci // cg * og, (ci // cg + 1) * og)
+                            output[b, oc, i, j] += \
+                                weight[oc, ci % cg, ki, kj] * value
+    if bias is not None:
+        output += bias.double().view(1, -1, 1, 1)
+    return output
+
+
+@pytest.mark.parametrize('groups, deform_groups', [(1, 1), (1, 2), (4, 2),
+                                                   (4, 4)])
+@pytest.mark.parametrize('stride, padding, dilation', [(1, 1, 1), (2, 1, 1),
+                                                       (1, 2, 2)])
+def test_modulated_deform_conv2d_torch(groups, deform_groups, stride,
+                                       padding, dilation):
+    torch.manual_seed(0)
+    n, c, h, w, out_channels, k = 2, 4, 6, 7, 8, 3
+    h_out = (h + 2 * padding - dilation * (k - 1) - 1) // stride + 1
+    w_out = (w + 2 * padding - dilation * (k - 1) - 1) // stride + 1
+    input = torch.randn(n, c, h, w)
+    # large offsets so that samples also fall outside the image
+    offset = torch.randn(n, deform_groups * 2 * k * k, h_out, w_out) * 2
+    mask = torch.rand(n, deform_groups * k * k, h_out, w_out)
+    weight = torch.randn(out_channels, c // groups, k, k)
+    bias = torch.randn(out_channels)
+
+    output = modulated_deform_conv2d_torch(input, offset, mask, weight, bias,
+                                           stride, padding, dilation, groups,
+                                           deform_groups)
+    expected = _reference(input, offset, mask, weight, bias, stride, padding,
+                          dilation, groups, deform_groups)
+    assert output.shape == (n, out_channels, h_out, w_out)
+    assert torch.allclose(output.double(), expected, atol=1e-4)
+
+
+def test_modulated_deform_conv2d_torch_zero_offset():
+    torch.manual_seed(0)
+    input = torch.randn(1, 6, 9, 11)
+    weight = torch.randn(6, 1, 1, 5)
+    offset = input.new_zeros(1, 2 * 5, 9, 11)
+    mask = input.new_ones(1, 5, 9, 11)
+    # without offsets and modulation it is a plain convolution
+    output = modulated_deform_conv2d_torch(
+        input, offset, mask, weight, padding=(0, 2), groups=6)
+    expected = F.conv2d(input, weight, padding=(0, 2), groups=6)
+    assert torch.allclose(output, expected, atol=1e-5)
+
+
+def test_modulated_deform_conv2d_pack_torch():
+    torch.manual_seed(0)
+    conv = build_conv_layer(
+        dict(type='DCNv2Torch'), 4, 8, 3, padding=1, deform_groups=2)
+    assert isinstance(conv, ModulatedDeformConv2dPackTorch)
+    assert set(conv.state_dict()) == {
+        'weight', 'bias', 'conv_offset.weight', 'conv_offset.bias'
+    }
+    assert conv.conv_offset.out_channels == 2 * 3 * 9
+
+    # zero-initialized offsets: sigmoid(0) modulation of a plain conv
+    x = torch.randn(2, 4, 8, 8)
+    expected = F.conv2d(x, conv.weight * 0.5, padding=1) + \
+        conv.bias.view(1, -1, 1, 1)
+    assert torch.allclose(conv(x), expected, atol=1e-5)
+
+    conv.conv_offset.weight.data.normal_(std=0.1)
+    out = conv(x)
+    out.sum().backward()
+    assert out.shape == (2, 8, 8, 8)
+    assert conv.conv_offset.weight.grad.abs().sum() > 0
+
+
+def test_parity_with_mmcv_ops():
+    ops = pytest.importorskip('mmcv.ops')
+    torch.manual_seed(0)
+    conv = ops.ModulatedDeformConv2dPack(
+        8, 8, (1, 3), padding=(0, 1), groups=8, deform_groups=8)
+    conv.conv_offset.weight.data.normal_(std=0.5)
+    conv_torch = ModulatedDeformConv2dPackTorch(
+        8, 8, (1, 3), padding=(0, 1), groups=8, deform_groups=8)
+    conv_torch.load_state_dict(conv.state_dict())
+    x = torch.randn(2, 8, 10, 12)
+    with torch.no_grad():
+        try:
+            expected = conv(x)
+        except RuntimeError:
+            pytest.skip('mmcv.ops was built without CPU support')
+        assert torch.allclose(conv_torch(x), expected, atol=1e-4)
@@ -0,0 +1,192 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Accuracy / latency trade-off of cascade inference.
+
+Runs the test split of a config once with its own ``test_cfg`` (reference)
+and once per cascade setting (``test_cfg.mode='cascade'``), and reports the
+latency, the share of refined windows and the per-class Dice of each run.
+
+Example::
+
+    python tools/benchmark_cascade.py "HACDRNet&DDHANet/HACDR_ddr.py" \
+        work_dirs/HACDR_ddr/latest.pth --thresholds 0.1 0.3 0.5 \
+        --coarse-scales 0.5 --crop-size 640 640 --stride 512 512
+"""
+import argparse
+import copy
+import os.path as osp
+import time
+
+import mmcv
+import numpy as np
+import torch
+from mmcv import Config
+from mmcv.cnn.utils import revert_sync_batchnorm
+from mmcv.runner import load_checkpoint
+
+from mmseg.core.evaluation.metrics import pre_eval_to_metrics
+from mmseg.datasets import build_dataloader, build_dataset
+from mmseg.models import build_segmentor
+from mmseg.utils import build_dp, get_device
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMSeg benchmark cascade inference')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--thresholds',
+        type=float,
+        nargs='+',
+        default=[0.1, 0.3, 0.5],
+        help='lesion probability thresholds of the coarse pass')
+    parser.add_argument(
+        '--coarse-scales',
+        type=float,
+        nargs='+',
+        default=[0.5],
+        help='downscale factors of the coarse pass')
+    parser.add_argument(
+        '--crop-size',
+        type=int,
+        nargs=2,
+        default=[640, 640],
+        help='refinement window size (h, w)')
+    parser.add_argument(
+        '--stride',
+        type=int,
+        nargs=2,
+        default=[512, 512],
+        help='refinement window stride (h, w)')
+    parser.add_argument(
+        '--num-images',
+        type=int,
+        default=None,
+        help='only use the first N test images')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='untimed warmup images')
+    parser.add_argument(
+        '--work-dir',
+        help='if specified, the results will be dumped into the directory '
+        'as json')
+    args = parser.parse_args()
+    return args
+
+
+def run(model, data_loader, dataset, num_images, num_warmup, device):
+    """Run inference, return pre-eval results, latency and refined share."""
+    segmentor = model.module
+    results = []
+    pure_inf_time = 0
+    num_windows = num_refined = 0
+    for i, data in enumerate(data_loader):
+        if num_images is not None and i >= num_images:
+            break
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            result = model(return_loss=False, rescale=True, **data)
+        if device == 'cuda':
+            torch.cuda.synchronize()
+        if i >= num_warmup:
+            pure_inf_time += time.perf_counter() - start_time
+        results.extend(dataset.pre_eval(result, indices=[i]))
+        stats = getattr(segmentor, 'cascade_stats', None)
+        if stats is not None:
+            num_windows += stats['num_windows']
+            num_refined += stats['num_refined']
+    num_timed = max(len(results) - num_warmup, 1)
+    refined = num_refined / num_windows if num_windows else None
+    return results, pure_inf_time / num_timed * 1000, refined
+
+
+def main():
+    args = parse_args()
+
+    cfg = Config.fromfile(args.config)
+    torch.backends.cudnn.benchmark = False
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    cfg.data.test.test_mode = True
+    device = get_device()
+
+    dataset = build_dataset(cfg.data.test)
+    data_loader = build_dataloader(
+        dataset,
+        samples_per_gpu=1,
+        workers_per_gpu=cfg.data.workers_per_gpu,
+        dist=False,
+        shuffle=False)
+
+    model = build_segmentor(cfg.model, test_cfg=cfg.get('test_cfg'))
+    load_checkpoint(model, args.checkpoint, map_location='cpu')
+    if device == 'cpu':
+        model = revert_sync_batchnorm(model)
+    model = build_dp(model, device)
+    model.eval()
+    segmentor = model.module
+    reference_cfg = copy.deepcopy(segmentor.test_cfg)
+
+    settings = [('reference', reference_cfg)]
+    for coarse_scale in args.coarse_scales:
+        for threshold in args.thresholds:
+            test_cfg = copy.deepcopy(reference_cfg)
+            test_cfg.update(
+                mode='cascade',
+                coarse_scale=coarse_scale,
+                threshold=threshold,
+                crop_size=tuple(args.crop_size),
+                stride=tuple(args.stride))
+            settings.append(
+                (f'cascade s={coarse_scale} t={threshold}', test_cfg))
+
+    class_names = dataset.CLASSES
+    rows = []
+    for name, test_cfg in settings:
+        segmentor.test_cfg = test_cfg
+        segmentor.__dict__.pop('cascade_stats', None)
+        results, latency, refined = run(model, data_loader, dataset,
+                                        args.num_images, args.num_warmup,
+                                        device)
+        dice = pre_eval_to_metrics(results, ['mDice'])['Dice'] * 100
+        rows.append(dict(name=name, latency=latency, refined=refined,
+                         dice=dice))
+        print(f'{name}: {latency:.1f} ms / img')
+
+    reference = rows[0]
+    header = f"{'setting':<28}{'ms/img':>9}{'speedup':>9}{'refined':>9}" + \
+        ''.join(f'{c:>9}' for c in class_names) + f"{'mDice':>9}"
+    print('\nDice (%); cascade rows show the change versus the reference')
+    print(header)
+    for row in rows:
+        refined = '-' if row['refined'] is None else \
+            f"{row['refined'] * 100:.0f}%"
+        line = f"{row['name']:<28}{row['latency']:>9.1f}" \
+            f"{reference['latency'] / row['latency']:>8.2f}x{refined:>9}"
+        for value, ref in zip(row['dice'], reference['dice']):
+            line += f'{value:>9.2f}' if row is reference else \
+                f'{value - ref:>+9.2f}'
+        mdice = np.nanmean(row['dice'])
+        line += f'{mdice:>9.2f}' if row is reference else \
+            f"{mdice - np.nanmean(reference['dice']):>+9.2f}"
+        print(line)
+
+    if args.work_dir is not None:
+        mmcv.mkdir_or_exist(osp.abspath(args.work_dir))
+        timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime())
+        json_file = osp.join(args.work_dir, f'cascade_{timestamp}.json')
+        summary = [
+            dict(
+                setting=row['name'],
+                latency_ms=round(row['latency'], 2),
+                refined=row['refined'],
+                dice={c: round(float(v), 2)
+                      for c, v in zip(class_names, row['dice'])})
+            for row in rows
+        ]
+        mmcv.dump(summary, json_file, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""CPU latency of eager, ``torch.compile`` and TorchScript inference.
+
+Builds the segmentor of a config, wraps it in :class:`SegmentorInference`
+and times the eager module, the module compiled with
+``torch.compile(fullgraph=True)`` and the TorchScript export of
+:func:`script_segmentor`. The maximum absolute difference of the outputs to
+eager mode is reported as well.
+
+Example::
+
+    python tools/benchmark_compile.py "HACDRNet&DDHANet/HACDR_ddr.py" \
+        --shape 1024 1024 --cfg-options model.backbone.dcn_cfg.type=DCNv2Torch
+
+    python tools/benchmark_compile.py \
+        configs/hrnet/fcn_hr18_512x1024_40k_cityscapes.py --shape 1024 1024 \
+        --cfg-options model.backbone.type=HRNet_M2MRF_A
+"""
+import argparse
+import os.path as osp
+import time
+import warnings
+
+import torch
+from mmcv import Config, DictAction
+from mmcv.cnn.utils import revert_sync_batchnorm
+from mmcv.runner import load_checkpoint
+
+from mmseg.models import build_segmentor
+from mmseg.models.segmentors import SegmentorInference, script_segmentor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMSeg benchmark eager, compiled and scripted inference '
+        'on CPU')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs='+',
+        default=[1024, 1024],
+        help='input image size')
+    parser.add_argument(
+        '--mode',
+        choices=['whole', 'slide'],
+        default=None,
+        help='inference mode, defaults to the mode of the test config')
+    parser.add_argument(
+        '--output',
+        choices=['logit', 'prob', 'argmax'],
+        default='prob',
+        help='output of the inference module')
+    parser.add_argument(
+        '--repeat', type=int, default=10, help='number of timed forwards')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='untimed warmup forwards')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    parser.add_argument(
+        '--compile-backend',
+        default='inductor',
+        help='backend of torch.compile')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='Override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    args = parser.parse_args()
+    return args
+
+
+def measure(module, img, repeat, num_warmup):
+    """Return the output and the mean latency (ms) of ``module``."""
+    with torch.no_grad():
+        for _ in range(num_warmup):
+            out = module(img)
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            out = module(img)
+        elapsed = time.perf_counter() - start_time
+    return out, elapsed / repeat * 1000
+
+
+def main():
+    args = parse_args()
+
+    if len(args.shape) == 1:
+        input_shape = (1, 3, args.shape[0], args.shape[0])
+    elif len(args.shape) == 2:
+        input_shape = (1, 3) + tuple(args.shape)
+    else:
+        raise ValueError('invalid input shape')
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    cfg = Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    model = build_segmentor(cfg.model, test_cfg=cfg.get('test_cfg'))
+    if args.checkpoint is not None and osp.exists(args.checkpoint):
+        load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model = revert_sync_batchnorm(model)
+    model.eval()
+    mode = args.mode
+    if mode is None:
+        mode = (model.test_cfg or dict()).get('mode', 'whole')
+        if mode not in ('whole', 'slide'):
+            warnings.warn(f'test_cfg.mode={mode!r} is not supported, '
+                          "falling back to 'whole' inference")
+            mode = 'whole'
+    module = SegmentorInference(model, mode=mode, output=args.output)
+
+    torch.manual_seed(0)
+    img = torch.randn(input_shape)
+    results = dict()
+    ref, results['eager'] = measure(module, img, args.repeat,
+                                    args.num_warmup)
+    # the first call of the compiled module includes the compilation
+    if hasattr(torch, 'compile'):
+        compiled = torch.compile(
+            module, fullgraph=True, backend=args.compile_backend)
+        results['compile'] = measure(compiled, img, args.repeat,
+                                     max(args.num_warmup, 1))
+    results['script'] = measure(
+        script_segmentor(module, img), img, args.repeat, args.num_warmup)
+
+    print(f'input shape: {input_shape}, mode: '
+          f"{'slide' if module.slide else 'whole'}, "
+          f'threads: {torch.get_num_threads()}')
+    print(f"{'':<10}{'ms/img':>10}{'speedup':>10}{'max diff':>12}")
+    eager_time = results.pop('eager')
+    print(f"{'eager':<10}{eager_time:>10.1f}{1:>10.2f}{0:>12.2e}")
+    for name, (out, latency) in results.items():
+        max_diff = (out.float() - ref.float()).abs().max().item()
+        print(f'{name:<10}{latency:>10.1f}{eager_time / latency:>10.2f}'
+              f'{max_diff:>12.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""CPU latency of a backbone before and after ``switch_to_deploy``.
+
+Builds the segmentor of a config, optionally loads a checkpoint, and times
+the backbone forward in eval mode, then re-parameterizes the backbone
+(e.g. :meth:`HACDR.switch_to_deploy`) and times it again. The maximum
+absolute difference of the backbone outputs is reported as well.
+
+Example::
+
+    python tools/benchmark_deploy.py "HACDRNet&DDHANet/HACDR_ddr.py" \
+        --checkpoint work_dirs/HACDR_ddr/latest.pth --shape 1024 1024
+"""
+import argparse
+import os.path as osp
+import time
+
+import torch
+from mmcv import Config
+from mmcv.cnn.utils import revert_sync_batchnorm
+from mmcv.runner import load_checkpoint
+
+from mmseg.models import build_segmentor
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMSeg benchmark re-parameterized backbone on CPU')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument(
+        '--shape',
+        type=int,
+        nargs='+',
+        default=[1024, 1024],
+        help='input image size')
+    parser.add_argument(
+        '--repeat', type=int, default=10, help='number of timed forwards')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='untimed warmup forwards')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    parser.add_argument(
+        '--fuse-strips',
+        action='store_true',
+        help='also fuse the strip convs of the attention into one kernel')
+    args = parser.parse_args()
+    return args
+
+
+def measure(backbone, img, repeat, num_warmup):
+    """Return the outputs and the mean latency (ms) of ``backbone``."""
+    with torch.no_grad():
+        for _ in range(num_warmup):
+            outs = backbone(img)
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            outs = backbone(img)
+        elapsed = time.perf_counter() - start_time
+    return outs, elapsed / repeat * 1000
+
+
+def main():
+    args = parse_args()
+
+    if len(args.shape) == 1:
+        input_shape = (1, 3, args.shape[0], args.shape[0])
+    elif len(args.shape) == 2:
+        input_shape = (1, 3) + tuple(args.shape)
+    else:
+        raise ValueError('invalid input shape')
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+
+    cfg = Config.fromfile(args.config)
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    model = build_segmentor(cfg.model, test_cfg=cfg.get('test_cfg'))
+    if args.checkpoint is not None and osp.exists(args.checkpoint):
+        load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model = revert_sync_batchnorm(model)
+    model.eval()
+    backbone = model.backbone
+    if not hasattr(backbone, 'switch_to_deploy'):
+        raise TypeError(f'{type(backbone).__name__} does not support '
+                        'switch_to_deploy')
+
+    torch.manual_seed(0)
+    img = torch.randn(input_shape)
+    outs, eager_time = measure(backbone, img, args.repeat, args.num_warmup)
+    num_params = sum(p.numel() for p in backbone.parameters())
+    backbone.switch_to_deploy(fuse_strips=args.fuse_strips)
+    deploy_outs, deploy_time = measure(backbone, img, args.repeat,
+                                       args.num_warmup)
+    deploy_params = sum(p.numel() for p in backbone.parameters())
+    max_diff = max((out - ref).abs().max().item()
+                   for out, ref in zip(deploy_outs, outs))
+
+    print(f'input shape: {input_shape}, threads: {torch.get_num_threads()}')
+    print(f"{'':<10}{'ms/img':>10}{'params':>12}")
+    print(f"{'eager':<10}{eager_time:>10.1f}{num_params:>12,}")
+    print(f"{'deploy':<10}{deploy_time:>10.1f}{deploy_params:>12,}")
+    print(f'speedup: {eager_time / deploy_time:.2f}x, '
+          f'max abs diff: {max_diff:.2e}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Latency and peak memory of the ``HRNet_M2MRF_A`` - ``D`` backbones.
+
+Builds each variant with the ``extra`` stages of the backbone in a config
+(HRNetV2-W18 by default) and times the backbone forward in eval mode for
+every input size. On GPU the peak memory is ``torch.cuda.max_memory_allocated``
+of the forward; on CPU every measurement runs in a fresh process and the
+peak memory is the growth of the maximum resident set size during the
+forwards.
+
+Example::
+
+    python tools/benchmark_m2mrf.py --sizes 1024 1536 2048 --threads 4
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import time
+
+import torch
+from mmcv import Config
+from mmcv.cnn.utils import revert_sync_batchnorm
+
+from mmseg.models import build_backbone
+
+VARIANTS = ['HRNet_M2MRF_A', 'HRNet_M2MRF_B', 'HRNet_M2MRF_C', 'HRNet_M2MRF_D']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMSeg benchmark the M2MRF backbones')
+    parser.add_argument(
+        '--config',
+        default='configs/_base_/models/fcn_hr18.py',
+        help='config whose model.backbone.extra defines the stages')
+    parser.add_argument(
+        '--variants',
+        nargs='+',
+        choices=VARIANTS,
+        default=VARIANTS,
+        help='backbones to benchmark')
+    parser.add_argument(
+        '--sizes',
+        type=int,
+        nargs='+',
+        default=[1024, 2048],
+        help='square input sizes')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='number of timed forwards')
+    parser.add_argument(
+        '--num-warmup', type=int, default=1, help='untimed warmup forwards')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    parser.add_argument(
+        '--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    args = parser.parse_args()
+    return args
+
+
+def _max_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(extra, variant, size, repeat, num_warmup, device, threads=None):
+    """Return the mean latency (ms) and the peak memory (MB) of a forward."""
+    if threads is not None:
+        torch.set_num_threads(threads)
+    backbone = build_backbone(dict(type=variant, extra=extra))
+    backbone = revert_sync_batchnorm(backbone).to(device)
+    backbone.eval()
+    img = torch.randn(1, 3, size, size, device=device)
+    if device.startswith('cuda'):
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        base_memory = torch.cuda.memory_allocated()
+    else:
+        base_memory = _max_rss_mb()
+    with torch.no_grad():
+        for _ in range(num_warmup):
+            backbone(img)
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+        start_time = time.perf_counter()
+        for _ in range(repeat):
+            backbone(img)
+        if device.startswith('cuda'):
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start_time
+    if device.startswith('cuda'):
+        peak_memory = (torch.cuda.max_memory_allocated() - base_memory) / 2**20
+    else:
+        peak_memory = _max_rss_mb() - base_memory
+    return elapsed / repeat * 1000, peak_memory
+
+
+def main():
+    args = parse_args()
+    cfg = Config.fromfile(args.config)
+    extra = cfg.model.backbone.extra.to_dict()
+
+    print(f'device: {args.device}, threads: '
+          f'{args.threads or torch.get_num_threads()}')
+    print(f"{'backbone':<16}{'size':>6}{'ms/img':>10}{'peak MB':>10}")
+    for variant in args.variants:
+        for size in args.sizes:
+            measure_args = (extra, variant, size, args.repeat,
+                            args.num_warmup, args.device, args.threads)
+            if args.device.startswith('cuda'):
+                latency, peak_memory = measure(*measure_args)
+            else:
+                # a fresh process per measurement for the max RSS
+                with mp.get_context('spawn').Pool(1) as pool:
+                    latency, peak_memory = pool.apply(measure, measure_args)
+            print(f'{variant:<16}{size:>6}{latency:>10.1f}'
+                  f'{peak_memory:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
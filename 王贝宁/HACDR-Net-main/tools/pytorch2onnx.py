@@ -18,7 +18,7 @@ from mmseg.apis import show_result_pyplot
 from mmseg.apis.inference import LoadImage
 from mmseg.datasets.pipelines import Compose
 from mmseg.models import build_segmentor
-from mmseg.ops import resize
+from mmseg.ops import ModulatedDeformConv2dPackTorch, resize
 
 torch.manual_seed(3)
 
@@ -151,6 +151,11 @@ def pytorch2onnx(model,
     """
     model.cpu().eval()
     test_mode = model.test_cfg.mode
+    if opset_version < 16 and any(
+            isinstance(m, ModulatedDeformConv2dPackTorch)
+            for m in model.modules()):
+        raise ValueError('DCNv2Torch needs GridSample, please export with '
+                         '--opset-version 16 or higher')
 
     if isinstance(model.decode_head, nn.ModuleList):
         num_classes = model.decode_head[-1].num_classes
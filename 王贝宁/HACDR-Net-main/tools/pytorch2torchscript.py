@@ -1,15 +1,18 @@
 # Copyright (c) OpenMMLab. All rights reserved.
 import argparse
+import warnings
 
 import mmcv
 import numpy as np
 import torch
 import torch._C
 import torch.serialization
+from mmcv import DictAction
 from mmcv.runner import load_checkpoint
 from torch import nn
 
 from mmseg.models import build_segmentor
+from mmseg.models.segmentors import SegmentorInference, script_segmentor
 
 torch.manual_seed(3)
 
@@ -90,10 +93,17 @@ def pytorch2libtorch(model,
                      input_shape,
                      show=False,
                      output_file='tmp.pt',
-                     verify=False):
+                     verify=False,
+                     mode=None,
+                     output='logit',
+                     script=False):
     """Export Pytorch model to TorchScript model and verify the outputs are
     same between Pytorch and TorchScript.
 
+    The segmentor is wrapped in :class:`SegmentorInference`, so the exported
+    module maps a tensor of images to a tensor of logits, probabilities or
+    labels, in whole or slide mode.
+
     Args:
         model (nn.Module): Pytorch model we want to export.
         input_shape (tuple): Use this input shape to construct
@@ -103,6 +113,14 @@ def pytorch2libtorch(model,
             output TorchScript model. Default: `tmp.pt`.
         verify (bool): Whether compare the outputs between
             Pytorch and TorchScript. Default: False.
+        mode (str, optional): 'whole' or 'slide'. Default: None, which takes
+            the mode of ``model.test_cfg``, or 'whole' if that mode (e.g.
+            'cascade') is not supported by :class:`SegmentorInference`.
+        output (str): 'logit', 'prob' or 'argmax'. Default: 'logit'.
+        script (bool): Only trace the encoder and script the inference
+            logic, so that the sliding window loop follows the input size.
+            Otherwise the whole module is traced for ``input_shape``.
+            Default: False.
     """
     if isinstance(model.decode_head, nn.ModuleList):
         num_classes = model.decode_head[-1].num_classes
@@ -111,21 +129,43 @@ def pytorch2libtorch(model,
 
     mm_inputs = _demo_mm_inputs(input_shape, num_classes)
 
-    imgs = mm_inputs.pop('imgs')
+    imgs = mm_inputs.pop('imgs').detach()
 
-    # replace the original forword with forward_dummy
-    model.forward = model.forward_dummy
     model.eval()
-    traced_model = torch.jit.trace(
-        model,
-        example_inputs=imgs,
-        check_trace=verify,
-    )
+    if mode is None:
+        mode = (model.test_cfg or dict()).get('mode', 'whole')
+        if mode not in ('whole', 'slide'):
+            warnings.warn(f'test_cfg.mode={mode!r} can not be exported, '
+                          "falling back to 'whole' inference")
+            mode = 'whole'
+    module = SegmentorInference(model, mode=mode, output=output)
+    if script:
+        exported_model = script_segmentor(module, imgs)
+    else:
+        with torch.no_grad():
+            exported_model = torch.jit.trace(
+                module,
+                example_inputs=imgs,
+                check_trace=False,
+            )
 
     if show:
-        print(traced_model.graph)
-
-    traced_model.save(output_file)
+        print(exported_model.graph)
+
+    if verify:
+        with torch.no_grad():
+            pytorch_result = module(imgs)
+            torchscript_result = exported_model(imgs)
+        if output == 'argmax':
+            assert torch.equal(pytorch_result, torchscript_result), \
+                'The outputs are different between Pytorch and TorchScript'
+        else:
+            assert torch.allclose(
+                pytorch_result, torchscript_result, atol=1e-4), \
+                'The outputs are different between Pytorch and TorchScript'
+        print('The outputs are same between Pytorch and TorchScript')
+
+    exported_model.save(output_file)
     print('Successfully exported TorchScript model: {}'.format(output_file))
 
 
@@ -139,12 +179,35 @@ def parse_args():
     parser.add_argument(
         '--verify', action='store_true', help='verify the TorchScript model')
     parser.add_argument('--output-file', type=str, default='tmp.pt')
+    parser.add_argument(
+        '--mode',
+        choices=['whole', 'slide'],
+        default=None,
+        help='inference mode, defaults to the mode of the test config')
+    parser.add_argument(
+        '--output',
+        choices=['logit', 'prob', 'argmax'],
+        default='logit',
+        help='output of the exported model')
+    parser.add_argument(
+        '--script',
+        action='store_true',
+        help='script the inference logic around the traced encoder instead '
+        'of tracing everything for the given shape')
     parser.add_argument(
         '--shape',
         type=int,
         nargs='+',
         default=[512, 512],
         help='input image size (height, width)')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='Override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file, e.g. '
+        'model.backbone.dcn_cfg.type=DCNv2Torch to trace HACDR without '
+        'the compiled mmcv ops.')
     args = parser.parse_args()
     return args
 
@@ -164,6 +227,8 @@ if __name__ == '__main__':
         raise ValueError('invalid input shape')
 
     cfg = mmcv.Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
     cfg.model.pretrained = None
 
     # build the model and load checkpoint
@@ -182,4 +247,7 @@ if __name__ == '__main__':
         input_shape,
         show=args.show,
         output_file=args.output_file,
-        verify=args.verify)
+        verify=args.verify,
+        mode=args.mode,
+        output=args.output,
+        script=args.script)
@@ -0,0 +1,433 @@
+# Copyright (c) OpenMMLab. All rights reserved.
+"""Post-training static INT8 quantization of a segmentor for CPU inference.
+
+The segmentor is split into the largest sub-modules that FX can trace
+(e.g. the attention and DFFN of every HACDR block, or the branches of an
+HRNet), and each of them is quantized with FX graph mode quantization.
+Modules that can not be traced or quantized (the control flow of the
+backbones, deformable convs, norms between units) stay in FP32, so any
+mmseg model can be quantized without changes.
+
+Observers are calibrated on the first ``--calib-images`` images of the test
+split. Sensitive layers stay in FP32:
+
+* modules matching ``--fallback`` (regular expressions on module names,
+  by default the final classifier ``conv_seg``);
+* depthwise convs other than 3x3, e.g. the 1xk / kx1 strips of HACDR, which
+  have no fast INT8 kernel and are several times slower than in FP32;
+* with ``--min-sqnr``, every quantized unit whose output SQNR versus FP32,
+  on the same input, is below the threshold.
+
+The FP32 and INT8 models are then evaluated on the test split and the Dice
+of every class (EX/HE/SE/MA for the DR datasets) and the latency of both are
+reported. Small lesions such as MA are the first to suffer from the
+quantization error, so check the per-class deltas, not only mDice.
+
+Example::
+
+    python tools/quantize.py "HACDRNet&DDHANet/HACDR_ddr.py" \
+        work_dirs/HACDR_ddr/latest.pth --calib-images 32 --min-sqnr 20 \
+        --out work_dirs/HACDR_ddr/int8.pth
+"""
+import argparse
+import copy
+import os.path as osp
+import re
+import time
+
+import mmcv
+import numpy as np
+import torch
+from mmcv import Config, DictAction
+from mmcv.cnn.utils import revert_sync_batchnorm
+from mmcv.runner import load_checkpoint
+from torch import nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.fx.custom_config import PrepareCustomConfig
+from torch.ao.quantization.fx.tracer import QuantizationTracer
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+from mmseg.core.evaluation.metrics import pre_eval_to_metrics
+from mmseg.datasets import build_dataloader, build_dataset
+from mmseg.models import build_segmentor
+from mmseg.ops import ModulatedDeformConv2dPackTorch
+from mmseg.utils import build_dp
+
+try:
+    from mmcv.ops import ModulatedDeformConv2dPack
+except ImportError:
+    ModulatedDeformConv2dPack = None
+
+# modules kept in FP32 inside the quantized units
+FLOAT_MODULES = tuple(
+    m for m in (ModulatedDeformConv2dPack, ModulatedDeformConv2dPackTorch)
+    if m is not None)
+QUANTIZABLE_MODULES = (nn.Conv2d, nn.Linear)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='MMSeg post-training INT8 quantization on CPU')
+    parser.add_argument('config', help='test config file path')
+    parser.add_argument('checkpoint', help='checkpoint file')
+    parser.add_argument('--out', help='output file of the quantized model')
+    parser.add_argument(
+        '--calib-images',
+        type=int,
+        default=32,
+        help='number of test images used for calibration')
+    parser.add_argument(
+        '--num-images',
+        type=int,
+        default=None,
+        help='only evaluate the first N test images')
+    parser.add_argument(
+        '--fallback',
+        nargs='*',
+        default=[r'conv_seg$'],
+        help='regular expressions of module names kept in FP32')
+    parser.add_argument(
+        '--min-sqnr',
+        type=float,
+        default=None,
+        help='keep quantized units whose SQNR (dB) is below this in FP32')
+    parser.add_argument(
+        '--sensitivity-images',
+        type=int,
+        default=4,
+        help='number of calibration images used to measure the SQNR')
+    parser.add_argument(
+        '--backend',
+        default='fbgemm',
+        choices=['fbgemm', 'x86', 'qnnpack'],
+        help='quantized engine, qnnpack for ARM hosts')
+    parser.add_argument(
+        '--switch-to-deploy',
+        action='store_true',
+        help='re-parameterize the backbone before quantization if supported')
+    parser.add_argument(
+        '--threads', type=int, default=None, help='torch CPU threads')
+    parser.add_argument(
+        '--num-warmup', type=int, default=2, help='untimed warmup images')
+    parser.add_argument(
+        '--cfg-options',
+        nargs='+',
+        action=DictAction,
+        help='override some settings in the used config, the key-value pair '
+        'in xxx=yyy format will be merged into config file.')
+    parser.add_argument(
+        '--work-dir',
+        help='if specified, the results will be dumped into the directory '
+        'as json')
+    args = parser.parse_args()
+    return args
+
+
+def is_traceable(module):
+    """Whether FX quantization can trace ``module``."""
+    tracer = QuantizationTracer([], list(FLOAT_MODULES))
+    try:
+        tracer.trace(module)
+    except Exception:
+        return False
+    return True
+
+
+def find_units(module, prefix='', children_only=False):
+    """Find the largest traceable sub-modules with quantizable layers.
+
+    Args:
+        module (nn.Module): Module to search.
+        prefix (str): Name of ``module``.
+        children_only (bool): Only search below ``module``. Default: False.
+
+    Returns:
+        list[str]: Names of the units, in module order.
+    """
+    if isinstance(module, FLOAT_MODULES) or not any(
+            isinstance(m, QUANTIZABLE_MODULES) and not isinstance(
+                m, FLOAT_MODULES) for m in module.modules()):
+        return []
+    if not children_only and is_traceable(module):
+        return [prefix]
+    units = []
+    for name, child in module.named_children():
+        units += find_units(child, f'{prefix}.{name}' if prefix else name)
+    return units
+
+
+def is_slow_int8(module):
+    """Depthwise convs without a fast INT8 kernel (only 3x3 has one)."""
+    return isinstance(module, nn.Conv2d) and module.groups > 1 and \
+        module.groups == module.in_channels and \
+        tuple(module.kernel_size) != (3, 3)
+
+
+def set_submodule(model, name, module):
+    parent_name, _, child_name = name.rpartition('.')
+    parent = model.get_submodule(parent_name) if parent_name else model
+    setattr(parent, child_name, module)
+
+
+def _zeros_like(inputs):
+    if isinstance(inputs, torch.Tensor):
+        return torch.zeros_like(inputs)
+    if isinstance(inputs, (list, tuple)):
+        return type(inputs)(_zeros_like(i) for i in inputs)
+    raise TypeError(f'unsupported input type {type(inputs)}')
+
+
+def capture_inputs(model, names, data):
+    """Example inputs of the units that run during inference.
+
+    Returns:
+        dict: Example inputs of each unit that ran, None for the units whose
+            inputs are not (nested lists of) tensors.
+    """
+    inputs = {}
+    handles = []
+
+    def hook(name):
+
+        def _hook(module, args):
+            if name not in inputs:
+                try:
+                    inputs[name] = _zeros_like(tuple(args)) if args else None
+                except TypeError:
+                    inputs[name] = None
+
+        return _hook
+
+    for name in names:
+        module = model.module.get_submodule(name)
+        handles.append(module.register_forward_pre_hook(hook(name)))
+    with torch.no_grad():
+        model(return_loss=False, rescale=True, **data)
+    for handle in handles:
+        handle.remove()
+    return inputs
+
+
+def prepare_units(model, fallback, backend, data):
+    """Insert observers into the units, return the prepared unit names.
+
+    Units that can not be prepared are split into their children.
+    """
+    segmentor = model.module
+    prepared = []
+    custom_config = PrepareCustomConfig().set_non_traceable_module_classes(
+        list(FLOAT_MODULES))
+    pending = [n for n in find_units(segmentor)
+               if not any(re.search(p, n) for p in fallback)]
+    while pending:
+        # units that are not called at test time, or only through other
+        # methods (e.g. ``decode_head.forward_test``), are not replaced but
+        # searched further, unused ones (auxiliary heads) end up empty
+        example_inputs = capture_inputs(model, pending, data)
+        names, pending = pending, []
+        for name in names:
+            if name in example_inputs and _prepare_unit(
+                    segmentor, name, example_inputs[name], fallback, backend,
+                    custom_config):
+                prepared.append(name)
+                continue
+            pending += [
+                n for n in find_units(
+                    segmentor.get_submodule(name), name, children_only=True)
+                if not any(re.search(p, n) for p in fallback)
+            ]
+    return prepared
+
+
+def _prepare_unit(segmentor, name, inputs, fallback, backend, custom_config):
+    if inputs is None:
+        return False
+    unit = segmentor.get_submodule(name)
+    qconfig_mapping = get_default_qconfig_mapping(backend)
+    for sub_name, module in unit.named_modules():
+        if not sub_name:
+            continue
+        if is_slow_int8(module) or any(
+                re.search(p, f'{name}.{sub_name}') for p in fallback):
+            qconfig_mapping.set_module_name(sub_name, None)
+    try:
+        observed = prepare_fx(
+            unit,
+            qconfig_mapping,
+            inputs,
+            prepare_custom_config=custom_config)
+    except Exception:
+        return False
+    set_submodule(segmentor, name, observed)
+    return True
+
+
+def measure_sqnr(model, quantized, names, data_loader, num_images):
+    """SQNR (dB) of every quantized unit on the FP32 inputs of the unit."""
+    stats = {name: [0., 0.] for name in names}
+    handles = []
+
+    def hook(name):
+        unit = quantized.get_submodule(name)
+
+        def _hook(module, args, output):
+            ref = torch.cat([o.flatten() for o in _flatten(output)])
+            out = torch.cat([o.flatten() for o in _flatten(unit(*args))])
+            stats[name][0] += ref.pow(2).sum().item()
+            stats[name][1] += (ref - out).pow(2).sum().item()
+
+        return _hook
+
+    for name in names:
+        handles.append(
+            model.module.get_submodule(name).register_forward_hook(
+                hook(name)))
+    with torch.no_grad():
+        for i, data in enumerate(data_loader):
+            if i >= num_images:
+                break
+            model(return_loss=False, rescale=True, **data)
+    for handle in handles:
+        handle.remove()
+    return {
+        name: 10 * np.log10(signal / max(noise, 1e-20))
+        for name, (signal, noise) in stats.items()
+    }
+
+
+def _flatten(output):
+    if isinstance(output, torch.Tensor):
+        return [output]
+    return [t for o in output for t in _flatten(o)]
+
+
+def run(model, data_loader, dataset, num_images, num_warmup):
+    """Run inference, return pre-eval results and latency (ms / img)."""
+    results = []
+    pure_inf_time = 0
+    for i, data in enumerate(data_loader):
+        if num_images is not None and i >= num_images:
+            break
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            result = model(return_loss=False, rescale=True, **data)
+        if i >= num_warmup:
+            pure_inf_time += time.perf_counter() - start_time
+        results.extend(dataset.pre_eval(result, indices=[i]))
+    num_timed = max(len(results) - num_warmup, 1)
+    return results, pure_inf_time / num_timed * 1000
+
+
+def main():
+    args = parse_args()
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.backends.quantized.engine = args.backend
+
+    cfg = Config.fromfile(args.config)
+    if args.cfg_options is not None:
+        cfg.merge_from_dict(args.cfg_options)
+    cfg.model.pretrained = None
+    cfg.model.train_cfg = None
+    cfg.data.test.test_mode = True
+
+    dataset = build_dataset(cfg.data.test)
+    data_loader = build_dataloader(
+        dataset,
+        samples_per_gpu=1,
+        workers_per_gpu=cfg.data.workers_per_gpu,
+        dist=False,
+        shuffle=False)
+
+    model = build_segmentor(cfg.model, test_cfg=cfg.get('test_cfg'))
+    load_checkpoint(model, args.checkpoint, map_location='cpu')
+    model = revert_sync_batchnorm(model)
+    model.eval()
+    if args.switch_to_deploy and hasattr(model.backbone, 'switch_to_deploy'):
+        model.backbone.switch_to_deploy()
+    quantized = copy.deepcopy(model)
+    model = build_dp(model, 'cpu')
+    quantized = build_dp(quantized, 'cpu')
+    segmentor = quantized.module
+
+    prepared = prepare_units(quantized, args.fallback, args.backend,
+                             next(iter(data_loader)))
+    print(f'calibrating {len(prepared)} units on {args.calib_images} images')
+    with torch.no_grad():
+        for i, data in enumerate(data_loader):
+            if i >= args.calib_images:
+                break
+            quantized(return_loss=False, rescale=True, **data)
+    for name in prepared:
+        set_submodule(segmentor, name,
+                      convert_fx(segmentor.get_submodule(name)))
+
+    sqnr = measure_sqnr(model, segmentor, prepared, data_loader,
+                        min(args.sensitivity_images, args.calib_images))
+    print(f"\n{'unit':<48}{'SQNR (dB)':>10}")
+    for name in prepared:
+        print(f'{name:<48}{sqnr[name]:>10.1f}')
+    fallback_units = []
+    if args.min_sqnr is not None:
+        fallback_units = [n for n in prepared if sqnr[n] < args.min_sqnr]
+        for name in fallback_units:
+            set_submodule(segmentor, name,
+                          copy.deepcopy(model.module.get_submodule(name)))
+        print(f'{len(fallback_units)} units below {args.min_sqnr} dB kept '
+              'in FP32')
+    quantized_units = [n for n in prepared if n not in fallback_units]
+
+    rows = []
+    for name, m in (('fp32', model), ('int8', quantized)):
+        results, latency = run(m, data_loader, dataset, args.num_images,
+                               args.num_warmup)
+        dice = pre_eval_to_metrics(results, ['mDice'])['Dice'] * 100
+        rows.append(dict(name=name, latency=latency, dice=dice))
+        print(f'{name}: {latency:.1f} ms / img')
+
+    fp32, int8 = rows
+    class_names = dataset.CLASSES
+    print(f"\n{'class':<12}{'FP32':>9}{'INT8':>9}{'delta':>9}")
+    for c, ref, value in zip(class_names, fp32['dice'], int8['dice']):
+        print(f'{c:<12}{ref:>9.2f}{value:>9.2f}{value - ref:>+9.2f}')
+    mdice = [np.nanmean(row['dice']) for row in rows]
+    print(f"{'mDice':<12}{mdice[0]:>9.2f}{mdice[1]:>9.2f}"
+          f'{mdice[1] - mdice[0]:>+9.2f}')
+    speedup = fp32['latency'] / int8['latency']
+    print(f"\nlatency: {fp32['latency']:.1f} -> {int8['latency']:.1f} "
+          f'ms / img ({speedup:.2f}x), {len(quantized_units)} units in INT8')
+
+    if args.out is not None:
+        mmcv.mkdir_or_exist(osp.dirname(osp.abspath(args.out)))
+        # the whole module, load with torch.load(args.out, weights_only=False)
+        torch.save(segmentor, args.out)
+        print(f'quantized model saved to {args.out}')
+
+    if args.work_dir is not None:
+        mmcv.mkdir_or_exist(osp.abspath(args.work_dir))
+        timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime())
+        json_file = osp.join(args.work_dir, f'quantize_{timestamp}.json')
+        mmcv.dump(
+            dict(
+                config=args.config,
+                checkpoint=args.checkpoint,
+                backend=args.backend,
+                calib_images=args.calib_images,
+                quantized_units=quantized_units,
+                fallback_units=fallback_units,
+                sqnr={n: round(float(v), 2)
+                      for n, v in sqnr.items()},
+                latency_ms=dict(
+                    fp32=round(fp32['latency'], 2),
+                    int8=round(int8['latency'], 2)),
+                dice={
+                    c: dict(fp32=round(float(a), 2), int8=round(float(b), 2))
+                    for c, a, b in zip(class_names, fp32['dice'],
+                                       int8['dice'])
+                }),
+            json_file,
+            indent=4)
+
+
+if __name__ == '__main__':
+    main()
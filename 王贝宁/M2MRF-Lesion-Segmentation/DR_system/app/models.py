@@ -1,5 +1,5 @@
 from .extensions import db
-from sqlalchemy import Enum
+from sqlalchemy import Enum, event, insert
 import enum
 
 # 定义角色枚举
@@ -7,6 +7,19 @@ class UserRole(enum.Enum):
     patient = 'patient'
     doctor = 'doctor'
 
+# 分割任务状态
+class JobStatus(enum.Enum):
+    queued = 'queued'
+    done = 'done'
+    failed = 'failed'
+
+# 病灶类型：硬性渗出、出血、软性渗出、微动脉瘤
+class LesionType(enum.Enum):
+    EX = 'EX'
+    HE = 'HE'
+    SE = 'SE'
+    MA = 'MA'
+
 class User(db.Model):
     __tablename__ = 'User'
     user_id = db.Column(db.Integer, primary_key=True)
@@ -40,17 +53,107 @@ class Doctor(db.Model):
 
 class Diagnose(db.Model):
     __tablename__ = 'Diagnose'
+    __table_args__ = (
+        # 医生端列表/统计：按医生、审核状态筛选，按日期排序
+        db.Index('idx_diagnose_doctor_confirmed_date', 'doctor_id', 'confirmed', 'diagnose_date', 'diagnosis_id'),
+        # 患者端报告列表
+        db.Index('idx_diagnose_patient_date', 'patient_id', 'diagnose_date', 'diagnosis_id'),
+    )
     diagnosis_id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('Patient.patient_id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('Doctor.doctor_id'), nullable=False)
     diagnosis_time = db.Column(db.DateTime, server_default=db.func.now())
-    image_path = db.Column(db.String(255))
+    image_path = db.Column(db.String(255), index=True)  # 内容寻址存储中的相对路径，用于引用计数
     confirmed = db.Column(db.Boolean, default=False)
     diagnose_date = db.Column(db.Date, nullable=False)
+    # 冗余的病灶数量，随 Lesion 的增删在同一事务内维护，列表接口无需再关联 Lesion 表计数
+    lesion_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # 版本号，记录每次修改（审核、病灶增删）后加一，用于生成 ETag
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     lesions = db.relationship('Lesion', backref='diagnosis', cascade="all, delete")
+    jobs = db.relationship('SegmentationJob', backref='diagnosis', cascade="all, delete")
 
 class Lesion(db.Model):
     __tablename__ = 'Lesion'
+    __table_args__ = (
+        # 按病灶类型筛选、汇总（如某患者的出血总面积）
+        db.Index('idx_lesion_diagnosis_type', 'diagnosis_id', 'lesion_type', 'area'),
+    )
     lesion_id = db.Column(db.Integer, primary_key=True)
     diagnosis_id = db.Column(db.Integer, db.ForeignKey('Diagnose.diagnosis_id'), nullable=False)
+    # 以下几何信息由分割结果计算，旧数据为空
+    lesion_type = db.Column(Enum(LesionType))
+    area = db.Column(db.Integer)  # 像素数
+    bbox_x = db.Column(db.Integer)
+    bbox_y = db.Column(db.Integer)
+    bbox_w = db.Column(db.Integer)
+    bbox_h = db.Column(db.Integer)
+    centroid_x = db.Column(db.Float)
+    centroid_y = db.Column(db.Float)
+    # 外接矩形内掩码的游程编码，见 services/lesion_geometry.py
+    mask_rle = db.Column(db.LargeBinary(length=2 ** 24 - 1))
+
+class SegmentationJob(db.Model):
+    __tablename__ = 'SegmentationJob'
+    job_id = db.Column(db.Integer, primary_key=True)
+    diagnosis_id = db.Column(db.Integer, db.ForeignKey('Diagnose.diagnosis_id'), nullable=False)
+    status = db.Column(Enum(JobStatus), nullable=False, default=JobStatus.queued)
+    image_path = db.Column(db.String(255), nullable=False)
+    mask_path = db.Column(db.String(255))
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+    finished_at = db.Column(db.DateTime)
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'SchemaMigration'
+    # 已执行的 migrations/*.sql 文件，由 migrate.py 维护
+    filename = db.Column(db.String(255), primary_key=True)
+    applied_at = db.Column(db.DateTime, server_default=db.func.now())
+
+class HealthAdvice(db.Model):
+    __tablename__ = 'HealthAdvice'
+    # 健康建议缓存，按归一化的病灶特征（及模型、提示词版本）的哈希作为主键
+    profile_key = db.Column(db.String(64), primary_key=True)
+    profile = db.Column(db.String(255), nullable=False)
+    model = db.Column(db.String(64), nullable=False)
+    advice = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, server_default=db.func.now())
+
+
+def _change_lesion_count(connection, diagnosis_id, delta):
+    table = Diagnose.__table__
+    connection.execute(
+        table.update()
+        .where(table.c.diagnosis_id == diagnosis_id)
+        .values(lesion_count=table.c.lesion_count + delta, version=table.c.version + 1)
+    )
+
+
+@event.listens_for(Diagnose, 'before_update')
+def _diagnose_updated(mapper, connection, target):
+    # 在 SQL 中自增，不会覆盖其他会话（如分割回调写入病灶时）的并发自增
+    target.version = Diagnose.version + 1
+
+
+@event.listens_for(Lesion, 'after_insert')
+def _lesion_inserted(mapper, connection, target):
+    _change_lesion_count(connection, target.diagnosis_id, 1)
+
+
+@event.listens_for(Lesion, 'after_delete')
+def _lesion_deleted(mapper, connection, target):
+    _change_lesion_count(connection, target.diagnosis_id, -1)
+
+
+def add_lesions(diagnosis_id, rows):
+    """
+    批量写入一个诊断的病灶，并在同一事务中更新 Diagnose.lesion_count
+    （批量 INSERT 不会触发上面的 ORM 事件，所以计数在这里一次性加上）
+    :param diagnosis_id: 诊断编号
+    :param rows: 病灶字段字典列表（不含 diagnosis_id）
+    """
+    if not rows:
+        return
+    db.session.execute(insert(Lesion), [dict(row, diagnosis_id=diagnosis_id) for row in rows])
+    _change_lesion_count(db.session.connection(), diagnosis_id, len(rows))
@@ -2,9 +2,18 @@ from .user_routes import user_bp  # 导入所有蓝图
 from .auth_routes import auth_bp
 from .auth_routes import doctor_bp
 from .auth_routes import patient_bp
+from .job_routes import job_bp
+from .system_routes import system_bp, metrics_bp
+from .image_routes import image_bp
+from .export_routes import export_bp
 
 def register_routes(app):
     app.register_blueprint(user_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(doctor_bp)
     app.register_blueprint(patient_bp)
+    app.register_blueprint(job_bp)
+    app.register_blueprint(system_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(image_bp)
+    app.register_blueprint(export_bp)
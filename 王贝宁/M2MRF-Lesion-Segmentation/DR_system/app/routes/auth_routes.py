@@ -1,16 +1,29 @@
 # app/routes/auth_routes.py
-from flask import Blueprint, request, jsonify
-from ..models import db, User, Doctor, Patient, Diagnose, Lesion, UserRole
+from flask import Blueprint, request, jsonify, current_app
+from ..models import db, User, Doctor, Patient, Diagnose, Lesion, LesionType, SegmentationJob, UserRole
+from ..services.upload_service import save_stream, save_base64
+from ..services.renditions import renditions, image_key
+from ..services.image_store import STORE_PREFIX, image_gc
+from ..services.segment_service import segment_queue, create_job
+from ..services.gpt_service import FALLBACK_ADVICE, gpt_service
+from ..services.events import event_broker, doctor_channel
+from ..services.cache import TTLCache
+from ..services.pagination import filter_diagnoses, keyset_page
+from ..services.http_cache import make_etag, is_not_modified, conditional_json
 from flasgger.utils import swag_from
 from datetime import datetime, date
-from sqlalchemy import func
+from sqlalchemy import func, case, and_
 from werkzeug.utils import secure_filename
-import os
-import uuid
+from werkzeug.datastructures import MultiDict
 import base64
+import os
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+# 报告详情缓存：diagnosis_id -> (version, etag, 报告字典)，每次请求先核对数据库中的 version，
+# 本进程内审核/退回时也主动失效
+_report_cache = TTLCache(maxsize=4096, ttl=300)
+
 @auth_bp.route('/login', methods=['POST'])
 @swag_from({
     'tags': ['Auth'],
@@ -65,6 +78,9 @@ def login():
 @swag_from({
     'tags': ['Auth'],
     'summary': '提交诊断报告',
+    'description': '推荐使用 multipart/form-data（image 文件字段）或 application/octet-stream（字段放在查询参数中）流式上传；'
+                   'application/json + base64 仅为兼容旧前端保留。',
+    'consumes': ['multipart/form-data', 'application/octet-stream', 'application/json'],
     'parameters': [
         {
             'name': 'body',
@@ -76,7 +92,8 @@ def login():
                     'doctor_id': {'type': 'integer'},
                     'image_path': {'type': 'string'},  # base64编码的图片数据
                     'diagnose_date': {'type': 'string', 'format': 'date-time'},
-                    'confirmed': {'type': 'boolean'}
+                    'confirmed': {'type': 'boolean'},
+                    'segment': {'type': 'boolean'}  # 为 true 时提交后台分割任务，通过 /api/jobs/<job_id> 查询结果
                 },
                 'required': ['patient_id', 'doctor_id', 'image_path']
             }
@@ -88,59 +105,117 @@ def login():
         },
         400: {
             'description': '参数错误'
+        },
+        503: {
+            'description': '未配置分割模型'
         }
     }
 })
 def submit_diagnosis():
     try:
-        data = request.get_json()
-        
+        # 创建保存图片的文件夹
+        UPLOAD_FOLDER = os.path.join(current_app.config['UPLOAD_FOLDER'], 'diagnosis')
+
+        if request.mimetype == 'application/json':
+            # 兼容旧的 base64-in-JSON 提交方式
+            data = request.get_json()
+            image_field = 'image_path'
+        elif request.mimetype == 'multipart/form-data':
+            data = request.form.to_dict()
+            image_field = 'image'
+        else:
+            # application/octet-stream：请求体即图片，其余字段放在查询参数中
+            data = request.args.to_dict()
+            image_field = None
+
         # 验证必要字段
-        required_fields = ['patient_id', 'doctor_id', 'image_path']
+        required_fields = ['patient_id', 'doctor_id']
         for field in required_fields:
             if field not in data:
                 return jsonify({'error': f'缺少必要字段: {field}'}), 400
-        
-        # 创建保存图片的文件夹
-        UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'uploads', 'diagnosis')
-        if not os.path.exists(UPLOAD_FOLDER):
-            os.makedirs(UPLOAD_FOLDER)
-        
-        # 生成唯一的文件名
-        filename = f"{uuid.uuid4()}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        
-        # 解码base64图片数据并保存
+        # 表单和查询参数中的值都是字符串，在写入图片之前转换并校验
         try:
-            image_data = data['image_path'].split(',')[1]  # 移除 "data:image/jpeg;base64," 前缀
-            image_bytes = base64.b64decode(image_data)
-            with open(filepath, 'wb') as f:
-                f.write(image_bytes)
+            patient_id = int(data['patient_id'])
+            doctor_id = int(data['doctor_id'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'patient_id 和 doctor_id 必须是整数'}), 400
+        try:
+            diagnose_date = datetime.fromisoformat(data['diagnose_date']) if 'diagnose_date' in data else datetime.now()
+        except (TypeError, ValueError):
+            return jsonify({'error': 'diagnose_date 必须是 ISO 8601 格式的时间'}), 400
+
+        segment = _parse_bool(data.get('segment', False))
+        if segment and not segment_queue.available:
+            return jsonify({'error': '未配置分割模型'}), 503
+
+        # 分块写入图片并计算哈希
+        try:
+            if image_field == 'image_path':
+                if 'image_path' not in data:
+                    return jsonify({'error': '缺少必要字段: image_path'}), 400
+                relpath, image_hash, _ = save_base64(data['image_path'], UPLOAD_FOLDER)
+            elif image_field == 'image':
+                if 'image' not in request.files:
+                    return jsonify({'error': '缺少必要字段: image'}), 400
+                relpath, image_hash, _ = save_stream(request.files['image'].stream, UPLOAD_FOLDER)
+            else:
+                relpath, image_hash, _ = save_stream(request.stream, UPLOAD_FOLDER)
         except Exception as e:
             return jsonify({'error': f'图片保存失败: {str(e)}'}), 400
-        
+
         # 创建诊断记录
         diagnosis = Diagnose(
-            patient_id=data['patient_id'],
-            doctor_id=data['doctor_id'],
-            image_path=os.path.join('uploads', 'diagnosis', filename),  # 存储相对路径
-            diagnose_date=datetime.now() if 'diagnose_date' not in data else datetime.fromisoformat(data['diagnose_date']),
-            confirmed=data.get('confirmed', False)
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            image_path=os.path.join(STORE_PREFIX, relpath),  # 存储相对路径，相同图片共享同一文件
+            diagnose_date=diagnose_date,
+            confirmed=_parse_bool(data.get('confirmed', False))
         )
-        
+
         db.session.add(diagnosis)
+        job = None
+        if segment:
+            # 分割任务与诊断记录同一事务写入，不会出现有记录却没有任务的情况
+            db.session.flush()
+            job = create_job(diagnosis)
         db.session.commit()
-        
-        return jsonify({
+        _invalidate_doctor_stats(diagnosis.doctor_id)
+        if diagnosis.confirmed:
+            # 直接以已审核状态提交的报告不进入待审核列表，只更新统计
+            _publish(diagnosis.doctor_id, 'confirmed', {
+                'diagnosis_ids': [diagnosis.diagnosis_id],
+                'stats': _confirmed_stats_delta([diagnosis], pending=0)
+            })
+        else:
+            _publish(diagnosis.doctor_id, 'created', {'cases': [_serialize_case(
+                _doctor_case_query(diagnosis.doctor_id).filter(Diagnose.diagnosis_id == diagnosis.diagnosis_id).one()
+            )]})
+        # 缩略图、预览图和瓦片在后台生成
+        renditions.schedule(image_hash)
+
+        result = {
             'message': '诊断报告提交成功',
-            'diagnosis_id': diagnosis.diagnosis_id
-        })
-        
+            'diagnosis_id': diagnosis.diagnosis_id,
+            'image_hash': image_hash
+        }
+        if job is not None:
+            # 分割在后台工作进程中进行，不阻塞请求线程
+            segment_queue.submit(job)
+            result['job_id'] = job.job_id
+        return jsonify(result)
+
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
+def _parse_bool(value):
+    # 表单和查询参数中的布尔值是字符串
+    if isinstance(value, str):
+        return value.lower() in ('true', '1', 'yes')
+    return bool(value)
+
+
 @auth_bp.route('/diagnosis/<int:diagnosis_id>', methods=['GET'])
 @swag_from({
     'tags': ['Auth'],
@@ -157,6 +232,9 @@ def submit_diagnosis():
         200: {
             'description': '获取成功'
         },
+        304: {
+            'description': '报告未修改（If-None-Match 命中）'
+        },
         404: {
             'description': '报告不存在'
         }
@@ -164,47 +242,118 @@ def submit_diagnosis():
 })
 def get_diagnosis_detail(diagnosis_id):
     try:
-        # 查询诊断记录
-        diagnosis = db.session.query(
-            Diagnose,
-            Patient.name.label('patient_name'),
-            Patient.patient_id,
-            Doctor.name.label('doctor_name'),
-            Doctor.doctor_id
-        ).join(
-            Patient, Diagnose.patient_id == Patient.patient_id
-        ).join(
-            Doctor, Diagnose.doctor_id == Doctor.doctor_id
-        ).filter(
-            Diagnose.diagnosis_id == diagnosis_id
-        ).first()
-
-        if not diagnosis:
+        # 缓存不在 worker 之间共享，其他 worker 上的审核、退回只能通过版本号发现：
+        # 先按主键查当前 version，与缓存条目一致时才使用缓存
+        version = db.session.query(Diagnose.version).filter(Diagnose.diagnosis_id == diagnosis_id).scalar()
+        if version is None:
+            _report_cache.pop(diagnosis_id)
             return jsonify({'error': '报告不存在'}), 404
 
-        # 生成报告编号
-        report_id = f"R{diagnosis.Diagnose.diagnose_date.strftime('%Y%m%d')}{diagnosis.Diagnose.diagnosis_id:03d}"
+        cached = _report_cache.get(diagnosis_id)
+        if cached is None or cached[0] != version:
+            cached = _load_report(diagnosis_id)
+            if cached is None:
+                return jsonify({'error': '报告不存在'}), 404
+            _report_cache.set(diagnosis_id, cached)
 
-        # 格式化日期和时间
-        check_date = diagnosis.Diagnose.diagnose_date.strftime('%Y-%m-%d')
-        check_time = diagnosis.Diagnose.diagnose_date.strftime('%H:%M:%S')
-
-        return jsonify({
-            'report_id': report_id,
-            'patient_name': diagnosis.patient_name,
-            'patient_id': diagnosis.patient_id,
-            'doctor_name': diagnosis.doctor_name,
-            'doctor_id': diagnosis.doctor_id,
-            'check_date': check_date,
-            'check_time': check_time,
-            'status': '已审核' if diagnosis.Diagnose.confirmed else '待审核',
-            'image_path': diagnosis.Diagnose.image_path
-        })
+        _, etag, report = cached
+        return conditional_json(report, etag)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _load_report(diagnosis_id):
+    """
+    查询并序列化报告详情
+    :return: (version, etag, 报告字典)，报告不存在时返回 None
+    """
+    # 查询诊断记录
+    diagnosis = db.session.query(
+        Diagnose,
+        Patient.name.label('patient_name'),
+        Patient.patient_id,
+        Doctor.name.label('doctor_name'),
+        Doctor.doctor_id
+    ).join(
+        Patient, Diagnose.patient_id == Patient.patient_id
+    ).join(
+        Doctor, Diagnose.doctor_id == Doctor.doctor_id
+    ).filter(
+        Diagnose.diagnosis_id == diagnosis_id
+    ).first()
+
+    if not diagnosis:
+        return None
+
+    # 生成报告编号
+    report_id = f"R{diagnosis.Diagnose.diagnose_date.strftime('%Y%m%d')}{diagnosis.Diagnose.diagnosis_id:03d}"
+
+    # 格式化日期和时间
+    check_date = diagnosis.Diagnose.diagnose_date.strftime('%Y-%m-%d')
+    check_time = diagnosis.Diagnose.diagnose_date.strftime('%H:%M:%S')
+
+    version = diagnosis.Diagnose.version
+    etag = make_etag('diagnosis', diagnosis_id, version)
+    return version, etag, {
+        'report_id': report_id,
+        'patient_name': diagnosis.patient_name,
+        'patient_id': diagnosis.patient_id,
+        'doctor_name': diagnosis.doctor_name,
+        'doctor_id': diagnosis.doctor_id,
+        'check_date': check_date,
+        'check_time': check_time,
+        'status': '已审核' if diagnosis.Diagnose.confirmed else '待审核',
+        'image_path': diagnosis.Diagnose.image_path
+    }
+
+
+@auth_bp.route('/diagnosis/<int:diagnosis_id>/advice', methods=['GET'])
+@swag_from({
+    'tags': ['Auth'],
+    'summary': '获取诊断报告的健康建议',
+    'description': '相同病灶特征的建议只生成一次；尚未生成时在后台生成并返回 202，前端稍后重试；'
+                   '生成失败后的一段时间内返回 503 且不再重新生成，前端停止轮询',
+    'parameters': [
+        {
+            'name': 'diagnosis_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '健康建议'
+        },
+        202: {
+            'description': '建议正在生成'
+        },
+        404: {
+            'description': '报告不存在'
+        },
+        503: {
+            'description': '建议生成失败，稍后再试'
+        }
+    }
+})
+def get_health_advice(diagnosis_id):
+    try:
+        diagnosis = db.session.query(Diagnose.lesion_count).filter(Diagnose.diagnosis_id == diagnosis_id).first()
+        if not diagnosis:
+            return jsonify({'error': '报告不存在'}), 404
+
+        status, advice = gpt_service.advice_or_schedule({'lesion_count': diagnosis.lesion_count})
+        if status == 'pending':
+            return jsonify({'status': 'pending'}), 202, {'Retry-After': '2'}
+        if status == 'failed':
+            retry_after = str(current_app.config['GPT_FAILURE_TTL'])
+            return jsonify({'status': 'failed', 'health_advice': FALLBACK_ADVICE}), 503, {'Retry-After': retry_after}
+        return jsonify({'status': 'ready', 'health_advice': advice})
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @auth_bp.route('/diagnosis/<int:diagnosis_id>/confirm', methods=['PUT'])
 @swag_from({
     'tags': ['Auth'],
@@ -232,8 +381,16 @@ def confirm_diagnosis(diagnosis_id):
         if not diagnosis:
             return jsonify({'error': '报告不存在'}), 404
 
+        was_pending = not diagnosis.confirmed
         diagnosis.confirmed = True
         db.session.commit()
+        _invalidate_doctor_stats(diagnosis.doctor_id)
+        _report_cache.pop(diagnosis_id)
+        if was_pending:
+            _publish(diagnosis.doctor_id, 'confirmed', {
+                'diagnosis_ids': [diagnosis_id],
+                'stats': _confirmed_stats_delta([diagnosis], pending=1)
+            })
 
         return jsonify({
             'message': '审核状态已更新',
@@ -272,18 +429,20 @@ def delete_diagnosis(diagnosis_id):
         if not diagnosis:
             return jsonify({'error': '报告不存在'}), 404
 
-        # 删除图片文件
-        if diagnosis.image_path:
-            try:
-                image_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), diagnosis.image_path)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            except Exception as e:
-                print(f"删除图片文件失败: {str(e)}")
+        image_paths = [diagnosis.image_path] + [job.mask_path for job in diagnosis.jobs]
+        doctor_id = diagnosis.doctor_id
+        pending = 0 if diagnosis.confirmed else 1
 
         # 删除数据库记录
         db.session.delete(diagnosis)
         db.session.commit()
+        _invalidate_doctor_stats(doctor_id)
+        _report_cache.pop(diagnosis_id)
+        _publish(doctor_id, 'returned', {'diagnosis_ids': [diagnosis_id], 'pending': pending})
+
+        # 图片可能被其他记录共享，由后台垃圾回收在引用计数归零后删除
+        for image_path in image_paths:
+            image_gc.schedule(image_path)
 
         return jsonify({
             'message': '报告已退回',
@@ -295,161 +454,574 @@ def delete_diagnosis(diagnosis_id):
         return jsonify({'error': str(e)}), 500
 
 
-# Doctor APIs
-doctor_bp = Blueprint('doctor', __name__, url_prefix='/api/doctor')
+# 单次批量操作最多处理的报告数
+BULK_MAX = 1000
 
-@doctor_bp.route('/stats', methods=['GET'])
+BULK_PARAMETERS = [
+    {
+        'name': 'body',
+        'in': 'body',
+        'required': True,
+        'schema': {
+            'type': 'object',
+            'properties': {
+                'diagnosis_ids': {'type': 'array', 'items': {'type': 'integer'}},
+                'doctor_id': {'type': 'integer', 'description': '可选，只处理该医生的报告'}
+            },
+            'required': ['diagnosis_ids']
+        }
+    }
+]
+
+
+def _bulk_ids(data):
+    """
+    校验批量请求中的报告编号和可选的 doctor_id
+    :return: (去重后的编号列表, 错误信息)
+    """
+    ids = (data or {}).get('diagnosis_ids')
+    if not isinstance(ids, list) or not ids:
+        return None, '缺少必要字段: diagnosis_ids'
+    if len(ids) > BULK_MAX:
+        return None, f'单次最多处理 {BULK_MAX} 份报告'
+    if data.get('doctor_id') is not None:
+        try:
+            int(data['doctor_id'])
+        except (TypeError, ValueError):
+            return None, 'doctor_id 必须是整数'
+    try:
+        return sorted({int(i) for i in ids}), None
+    except (TypeError, ValueError):
+        return None, 'diagnosis_ids 必须是整数列表'
+
+
+def _group_by_doctor(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.doctor_id, []).append(row)
+    return groups
+
+
+def _bulk_query(ids, data):
+    query = Diagnose.query.filter(Diagnose.diagnosis_id.in_(ids))
+    if data.get('doctor_id') is not None:
+        query = query.filter(Diagnose.doctor_id == int(data['doctor_id']))
+    return query
+
+
+@auth_bp.route('/diagnosis/bulk_confirm', methods=['PUT'])
 @swag_from({
-    'tags': ['Doctor'],
-    'summary': '医生诊断统计',
+    'tags': ['Auth'],
+    'summary': '批量审核诊断报告',
+    'parameters': BULK_PARAMETERS,
+    'responses': {
+        200: {
+            'description': '审核成功，返回实际更新的报告编号'
+        },
+        400: {
+            'description': '参数错误'
+        }
+    }
+})
+def bulk_confirm_diagnosis():
+    try:
+        data = request.get_json(silent=True) or {}
+        ids, error = _bulk_ids(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        # 只取待审核的记录，一条 UPDATE ... WHERE diagnosis_id IN (...) 完成审核
+        rows = _bulk_query(ids, data).filter(Diagnose.confirmed == False).with_entities(
+            Diagnose.diagnosis_id, Diagnose.doctor_id, Diagnose.diagnose_date, Diagnose.lesion_count
+        ).all()
+        updated_ids = [row.diagnosis_id for row in rows]
+        if updated_ids:
+            Diagnose.query.filter(Diagnose.diagnosis_id.in_(updated_ids)).update(
+                {Diagnose.confirmed: True, Diagnose.version: Diagnose.version + 1},
+                synchronize_session=False
+            )
+        db.session.commit()
+
+        for doctor_id, doctor_rows in _group_by_doctor(rows).items():
+            _invalidate_doctor_stats(doctor_id)
+            _publish(doctor_id, 'confirmed', {
+                'diagnosis_ids': [row.diagnosis_id for row in doctor_rows],
+                'stats': _confirmed_stats_delta(doctor_rows, pending=len(doctor_rows))
+            })
+        for diagnosis_id in updated_ids:
+            _report_cache.pop(diagnosis_id)
+
+        return jsonify({
+            'message': f'已审核 {len(updated_ids)} 份报告',
+            'diagnosis_ids': updated_ids
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/diagnosis/bulk_return', methods=['POST'])
+@swag_from({
+    'tags': ['Auth'],
+    'summary': '批量退回（删除）诊断报告',
+    'parameters': BULK_PARAMETERS,
+    'responses': {
+        200: {
+            'description': '退回成功，返回实际删除的报告编号'
+        },
+        400: {
+            'description': '参数错误'
+        }
+    }
+})
+def bulk_return_diagnosis():
+    try:
+        data = request.get_json(silent=True) or {}
+        ids, error = _bulk_ids(data)
+        if error:
+            return jsonify({'error': error}), 400
+
+        rows = _bulk_query(ids, data).with_entities(
+            Diagnose.diagnosis_id, Diagnose.doctor_id, Diagnose.image_path, Diagnose.confirmed
+        ).all()
+        deleted_ids = [row.diagnosis_id for row in rows]
+        image_paths = {row.image_path for row in rows}
+
+        if deleted_ids:
+            image_paths.update(
+                row.mask_path for row in
+                db.session.query(SegmentationJob.mask_path).filter(SegmentationJob.diagnosis_id.in_(deleted_ids))
+            )
+            # 批量 DELETE 不经过 ORM 级联，子表记录在同一事务内先删除
+            Lesion.query.filter(Lesion.diagnosis_id.in_(deleted_ids)).delete(synchronize_session=False)
+            SegmentationJob.query.filter(SegmentationJob.diagnosis_id.in_(deleted_ids)).delete(synchronize_session=False)
+            Diagnose.query.filter(Diagnose.diagnosis_id.in_(deleted_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+        for doctor_id, doctor_rows in _group_by_doctor(rows).items():
+            _invalidate_doctor_stats(doctor_id)
+            _publish(doctor_id, 'returned', {
+                'diagnosis_ids': [row.diagnosis_id for row in doctor_rows],
+                'pending': sum(1 for row in doctor_rows if not row.confirmed)
+            })
+        for diagnosis_id in deleted_ids:
+            _report_cache.pop(diagnosis_id)
+
+        # 图片由后台垃圾回收在引用计数归零后删除，不阻塞请求
+        for image_path in image_paths:
+            image_gc.schedule(image_path)
+
+        return jsonify({
+            'message': f'已退回 {len(deleted_ids)} 份报告',
+            'diagnosis_ids': deleted_ids
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@auth_bp.route('/diagnosis/<int:diagnosis_id>/lesions', methods=['GET'])
+@swag_from({
+    'tags': ['Auth'],
+    'summary': '获取诊断报告的病灶列表（类型、面积、外接矩形）',
     'parameters': [
         {
-            'name': 'doctor_id',
-            'in': 'query',
+            'name': 'diagnosis_id',
+            'in': 'path',
             'type': 'integer',
             'required': True
+        },
+        {
+            'name': 'lesion_type',
+            'in': 'query',
+            'type': 'string',
+            'enum': [t.value for t in LesionType],
+            'required': False
+        },
+        {
+            'name': 'include_mask',
+            'in': 'query',
+            'type': 'boolean',
+            'required': False,
+            'description': '为 true 时返回外接矩形内掩码的游程编码（base64）'
         }
     ],
-    'responses': {200: {'description': '统计信息'}}
+    'responses': {
+        200: {
+            'description': '病灶列表'
+        },
+        400: {
+            'description': '病灶类型无效'
+        }
+    }
 })
-def doctor_stats():
-    doctor_id = request.args.get('doctor_id', type=int)
+def get_diagnosis_lesions(diagnosis_id):
+    try:
+        include_mask = _parse_bool(request.args.get('include_mask', False))
+        columns = [
+            Lesion.lesion_id, Lesion.lesion_type, Lesion.area,
+            Lesion.bbox_x, Lesion.bbox_y, Lesion.bbox_w, Lesion.bbox_h,
+            Lesion.centroid_x, Lesion.centroid_y
+        ]
+        if include_mask:
+            columns.append(Lesion.mask_rle)
+        query = db.session.query(*columns).filter(Lesion.diagnosis_id == diagnosis_id)
+
+        lesion_type = request.args.get('lesion_type')
+        if lesion_type:
+            if lesion_type not in LesionType.__members__:
+                return jsonify({'error': f'无效的病灶类型: {lesion_type}'}), 400
+            query = query.filter(Lesion.lesion_type == LesionType[lesion_type])
+
+        result = []
+        for row in query.order_by(Lesion.lesion_id):
+            lesion = {
+                'lesion_id': row.lesion_id,
+                'lesion_type': row.lesion_type.value if row.lesion_type else None,
+                'area': row.area,
+                'bbox': [row.bbox_x, row.bbox_y, row.bbox_w, row.bbox_h] if row.bbox_w is not None else None,
+                'centroid': [row.centroid_x, row.centroid_y] if row.centroid_x is not None else None
+            }
+            if include_mask:
+                lesion['mask_rle'] = base64.b64encode(row.mask_rle).decode('ascii') if row.mask_rle else None
+            result.append(lesion)
+        return jsonify(result)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+# Doctor APIs
+doctor_bp = Blueprint('doctor', __name__, url_prefix='/api/doctor')
+
+# 医生统计缓存，提交/审核/退回报告时主动失效，TTL 兜底跨日和多进程的情况
+_stats_cache = TTLCache(maxsize=1024, ttl=30)
+
+
+def _doctor_stats(doctor_id):
+    """用一次条件聚合查询计算医生首页的全部统计数字"""
     today = date.today()
+    cached = _stats_cache.get((doctor_id, today))
+    if cached is not None:
+        return cached
+
     month_start = today.replace(day=1)
+    confirmed = Diagnose.confirmed == True
 
-    total_today = Diagnose.query.filter_by(doctor_id=doctor_id, confirmed=True).filter(func.date(Diagnose.diagnose_date) == today).count()
-    pending = Diagnose.query.filter_by(doctor_id=doctor_id, confirmed=False).count()
-    confirmed_this_month = Diagnose.query.filter(Diagnose.doctor_id == doctor_id, Diagnose.confirmed == True, Diagnose.diagnose_date >= month_start).count()
+    def count_if(*conditions):
+        return func.coalesce(func.sum(case((and_(*conditions), 1), else_=0)), 0)
 
-    abnormal = Diagnose.query.filter(
-        Diagnose.doctor_id == doctor_id,
-        Diagnose.confirmed == True,
-        Diagnose.diagnosis_id.in_(
-            db.session.query(Lesion.diagnosis_id).distinct()
-        )
-    ).count()
+    row = db.session.query(
+        count_if(confirmed, func.date(Diagnose.diagnose_date) == today).label('today_confirmed'),
+        count_if(Diagnose.confirmed == False).label('pending'),
+        count_if(confirmed, Diagnose.lesion_count > 0).label('abnormal_cases'),
+        count_if(confirmed, Diagnose.diagnose_date >= month_start).label('confirmed_this_month')
+    ).filter(Diagnose.doctor_id == doctor_id).one()
 
-    return jsonify({
-        'today_confirmed': total_today,
-        'pending': pending,
-        'abnormal_cases': abnormal,
-        'confirmed_this_month': confirmed_this_month
-    })
+    stats = {key: int(value) for key, value in row._mapping.items()}
+    _stats_cache.set((doctor_id, today), stats)
+    return stats
 
 
-@doctor_bp.route('/pending_cases', methods=['GET'])
-@swag_from({'tags': ['Doctor'], 'summary': '获取待处理病例列表'})
-def pending_cases():
-    doctor_id = request.args.get('doctor_id', type=int)
-    results = (
+def _invalidate_doctor_stats(doctor_id):
+    _stats_cache.pop((doctor_id, date.today()))
+
+
+def _publish(doctor_id, event, data):
+    # 推送给该医生打开的工作台 / 待审核列表，客户端据此增量更新
+    event_broker.publish(doctor_channel(doctor_id), event, data)
+
+
+def _confirmed_stats_delta(rows, pending):
+    """
+    confirmed 事件携带的统计增量，口径与 _doctor_stats 一致，客户端无需知道报告日期
+    :param rows: 新审核的报告，需要 diagnose_date 和 lesion_count
+    :param pending: 其中原本处于待审核状态的数量
+    """
+    today = date.today()
+    month_start = today.replace(day=1)
+    dates = [row.diagnose_date.date() if isinstance(row.diagnose_date, datetime) else row.diagnose_date
+             for row in rows]
+    return {
+        'pending': -pending,
+        'today_confirmed': sum(1 for d in dates if d == today),
+        'confirmed_this_month': sum(1 for d in dates if d >= month_start),
+        'abnormal_cases': sum(1 for row in rows if row.lesion_count > 0)
+    }
+
+
+# 首页只展示最新的一批待处理病例，总数见 stats.pending
+DASHBOARD_PENDING_LIMIT = 10
+
+# 列表分页参数（三个列表接口共用）
+LIST_PARAMETERS = [
+    {'name': 'confirmed', 'in': 'query', 'type': 'string', 'enum': ['true', 'false']},
+    {'name': 'date_from', 'in': 'query', 'type': 'string', 'format': 'date'},
+    {'name': 'date_to', 'in': 'query', 'type': 'string', 'format': 'date'},
+    {'name': 'limit', 'in': 'query', 'type': 'integer', 'description': '每页条数，传入后返回 {items, next_cursor}；不传 limit 和 cursor 时返回最新的至多 500 条记录的数组'},
+    {'name': 'cursor', 'in': 'query', 'type': 'string', 'description': '上一页返回的 next_cursor'}
+]
+
+
+def _doctor_case_query(doctor_id):
+    return (
         db.session.query(
             Patient.name.label('patient_name'),
             Diagnose.diagnosis_id,
             Diagnose.diagnose_date,
-            func.count(Lesion.lesion_id).label('lesion_count'),
+            Diagnose.lesion_count,
             Diagnose.confirmed
         ).join(Patient, Diagnose.patient_id == Patient.patient_id)
-         .outerjoin(Lesion, Diagnose.diagnosis_id == Lesion.diagnosis_id)
-         .filter(Diagnose.doctor_id == doctor_id, Diagnose.confirmed == False)
-         .group_by(Diagnose.diagnosis_id, Patient.name, Diagnose.diagnose_date, Diagnose.confirmed)
-         .order_by(Diagnose.diagnose_date.desc()).all()
+         .filter(Diagnose.doctor_id == doctor_id)
     )
 
-    return jsonify([
-    {
+
+def _serialize_case(row):
+    return {
         "patient_name": row.patient_name,
         "diagnosis_id": row.diagnosis_id,
         "diagnose_date": row.diagnose_date.strftime('%Y-%m-%d') if row.diagnose_date else None,
         "lesion_count": row.lesion_count,
         "confirmed": row.confirmed
     }
-    for row in results
-    ])
 
 
-@doctor_bp.route('/recent', methods=['GET'])
-@swag_from({'tags': ['Doctor'], 'summary': '获取今日已确认的最近诊断记录'})
-def recent_diagnoses():
-    doctor_id = request.args.get('doctor_id', type=int)
+def _pending_cases(doctor_id, args):
+    query = filter_diagnoses(_doctor_case_query(doctor_id), args).filter(Diagnose.confirmed == False)
+    return keyset_page(query, args, _serialize_case)
+
+
+def _recent_diagnoses(doctor_id):
     today = date.today()
     diagnoses = (
         db.session.query(
             Patient.name.label('patient_name'),
-            func.date_format(Diagnose.diagnosis_time, '%H:%i:%s').label('diagnosis_time_only')
+            Diagnose.diagnosis_time
         ).join(Patient, Diagnose.patient_id == Patient.patient_id)
          .filter(Diagnose.doctor_id == doctor_id, Diagnose.confirmed == True, func.date(Diagnose.diagnosis_time) == today)
          .order_by(Diagnose.diagnosis_time.desc())
          .limit(3)
          .all()
     )
-    return jsonify([dict(row._mapping) for row in diagnoses])
+    # 在 Python 中格式化时间，避免依赖 MySQL 的 date_format，SQLite 配置档下同样可用
+    return [{
+        'patient_name': row.patient_name,
+        'diagnosis_time_only': row.diagnosis_time.strftime('%H:%M:%S') if row.diagnosis_time else None
+    } for row in diagnoses]
 
 
-@doctor_bp.route('/history', methods=['GET'])
-@swag_from({'tags': ['Doctor'], 'summary': '获取诊断历史（全部、待审核、已审核）'})
-def diagnosis_history():
+@doctor_bp.route('/dashboard', methods=['GET'])
+@swag_from({
+    'tags': ['Doctor'],
+    'summary': '医生首页数据（统计、待处理病例、今日最近诊断）一次返回',
+    'parameters': [
+        {
+            'name': 'doctor_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': True
+        }
+    ],
+    'responses': {200: {'description': '包含 stats、pending_cases、recent 三部分'}}
+})
+def doctor_dashboard():
     doctor_id = request.args.get('doctor_id', type=int)
-    confirmed = request.args.get('confirmed')  # true/false/null
+    return jsonify({
+        'stats': _doctor_stats(doctor_id),
+        'pending_cases': _pending_cases(doctor_id, MultiDict({'limit': DASHBOARD_PENDING_LIMIT}))['items'],
+        'recent': _recent_diagnoses(doctor_id)
+    })
 
-    query = (
-        db.session.query(
-            Patient.name.label('patient_name'),
-            Diagnose.diagnosis_id,
-            Diagnose.diagnose_date,
-            func.count(Lesion.lesion_id).label('lesion_count'),
-            Diagnose.confirmed
-        ).join(Patient, Diagnose.patient_id == Patient.patient_id)
-         .outerjoin(Lesion, Diagnose.diagnosis_id == Lesion.diagnosis_id)
-         .filter(Diagnose.doctor_id == doctor_id)
-         .group_by(Diagnose.diagnosis_id, Patient.name, Diagnose.diagnose_date, Diagnose.confirmed)
-         .order_by(Diagnose.diagnose_date.desc())
-    )
 
-    if confirmed == 'true':
-        query = query.filter(Diagnose.confirmed == True)
-    elif confirmed == 'false':
-        query = query.filter(Diagnose.confirmed == False)
+@doctor_bp.route('/stats', methods=['GET'])
+@swag_from({
+    'tags': ['Doctor'],
+    'summary': '医生诊断统计',
+    'parameters': [
+        {
+            'name': 'doctor_id',
+            'in': 'query',
+            'type': 'integer',
+            'required': True
+        }
+    ],
+    'responses': {200: {'description': '统计信息'}}
+})
+def doctor_stats():
+    doctor_id = request.args.get('doctor_id', type=int)
+    return jsonify(_doctor_stats(doctor_id))
+
 
-    return jsonify([
-    {
-        "patient_name": row.patient_name,
-        "diagnosis_id": row.diagnosis_id,
-        "diagnose_date": row.diagnose_date.strftime('%Y-%m-%d') if row.diagnose_date else None,
-        "lesion_count": row.lesion_count,
-        "confirmed": row.confirmed
-    }
-    for row in query.all()
-])
+@doctor_bp.route('/pending_cases', methods=['GET'])
+@swag_from({
+    'tags': ['Doctor'],
+    'summary': '获取待处理病例列表',
+    'parameters': [{'name': 'doctor_id', 'in': 'query', 'type': 'integer', 'required': True}] + LIST_PARAMETERS,
+    'responses': {200: {'description': '病例列表'}, 400: {'description': '游标无效'}}
+})
+def pending_cases():
+    doctor_id = request.args.get('doctor_id', type=int)
+    try:
+        return jsonify(_pending_cases(doctor_id, request.args))
+    except ValueError:
+        return jsonify({'error': '无效的分页游标'}), 400
+
+
+@doctor_bp.route('/recent', methods=['GET'])
+@swag_from({'tags': ['Doctor'], 'summary': '获取今日已确认的最近诊断记录'})
+def recent_diagnoses():
+    doctor_id = request.args.get('doctor_id', type=int)
+    return jsonify(_recent_diagnoses(doctor_id))
+
+
+@doctor_bp.route('/history', methods=['GET'])
+@swag_from({
+    'tags': ['Doctor'],
+    'summary': '获取诊断历史（全部、待审核、已审核）',
+    'parameters': [{'name': 'doctor_id', 'in': 'query', 'type': 'integer', 'required': True}] + LIST_PARAMETERS,
+    'responses': {200: {'description': '病例列表'}, 400: {'description': '游标无效'}}
+})
+def diagnosis_history():
+    doctor_id = request.args.get('doctor_id', type=int)
+    query = filter_diagnoses(_doctor_case_query(doctor_id), request.args)
+    try:
+        return jsonify(keyset_page(query, request.args, _serialize_case))
+    except ValueError:
+        return jsonify({'error': '无效的分页游标'}), 400
 
 
 # Patient APIs
 patient_bp = Blueprint('patient', __name__, url_prefix='/api/patient')
 
+# 事件连接数已满时建议客户端等待的秒数
+EVENTS_RETRY_AFTER = 10
+
+@doctor_bp.route('/events', methods=['GET'])
+@swag_from({
+    'tags': ['Doctor'],
+    'summary': '待审核病例的实时事件流（Server-Sent Events）',
+    'description': '事件：created（新提交的待审核病例，data.cases 为病例行）、'
+                   'confirmed（data.diagnosis_ids，data.stats 为首页统计的增量）、'
+                   'returned（data.diagnosis_ids，data.pending 为其中待审核的数量）、'
+                   'updated（分割完成后的病灶数量）、reset（需重新拉取完整列表）',
+    'produces': ['text/event-stream'],
+    'parameters': [{'name': 'doctor_id', 'in': 'query', 'type': 'integer', 'required': True}],
+    'responses': {
+        200: {'description': '事件流'},
+        400: {'description': '缺少 doctor_id'},
+        503: {'description': '本进程事件连接数已满，按 Retry-After 稍后重连'}
+    }
+})
+def doctor_events():
+    doctor_id = request.args.get('doctor_id', type=int)
+    if doctor_id is None:
+        return jsonify({'error': '缺少必要字段: doctor_id'}), 400
+    body = event_broker.stream(doctor_channel(doctor_id))
+    if body is None:
+        return jsonify({'error': '事件连接数已满'}), 503, {'Retry-After': str(EVENTS_RETRY_AFTER)}
+    return current_app.response_class(
+        body,
+        mimetype='text/event-stream',
+        # 关闭代理缓冲，事件立即送达
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @patient_bp.route('/reports', methods=['GET'])
-@swag_from({'tags': ['Patient'], 'summary': '获取我的报告'})
+@swag_from({
+    'tags': ['Patient'],
+    'summary': '获取我的报告',
+    'parameters': [{'name': 'patient_id', 'in': 'query', 'type': 'integer', 'required': True}] + LIST_PARAMETERS,
+    'responses': {200: {'description': '报告列表'}, 304: {'description': '报告列表未变化'}, 400: {'description': '游标无效'}}
+})
 def patient_reports():
     patient_id = request.args.get('patient_id', type=int)
 
-    results = (
+    # 新增、删除报告会改变条数或最大编号，审核、病灶变化会改变版本号之和；
+    # 只做一次走索引的聚合查询，客户端缓存仍有效时直接返回 304
+    count, version_sum, max_id = filter_diagnoses(
+        db.session.query(
+            func.count(Diagnose.diagnosis_id),
+            func.coalesce(func.sum(Diagnose.version), 0),
+            func.max(Diagnose.diagnosis_id)
+        ).filter(Diagnose.patient_id == patient_id),
+        request.args
+    ).one()
+    etag = make_etag('reports', request.query_string.decode('utf-8'), count, version_sum, max_id)
+    if is_not_modified(etag):
+        return conditional_json(None, etag)
+
+    query = (
         db.session.query(
             Diagnose.diagnose_date.label('report_date'),
-            func.count(Lesion.lesion_id).label('lesion_count'),
+            Diagnose.lesion_count,
             Diagnose.confirmed.label('is_confirmed'),
             Doctor.name.label('doctor_name'),
             Diagnose.image_path.label('report_image'),
             Diagnose.diagnosis_id
-        ).outerjoin(Lesion, Diagnose.diagnosis_id == Lesion.diagnosis_id)
-         .join(Doctor, Diagnose.doctor_id == Doctor.doctor_id)
+        ).join(Doctor, Diagnose.doctor_id == Doctor.doctor_id)
          .filter(Diagnose.patient_id == patient_id)
-         .group_by(Diagnose.diagnosis_id, Diagnose.diagnose_date, Diagnose.confirmed, Doctor.name, Diagnose.image_path)
-         .order_by(Diagnose.diagnose_date.desc()).all()
     )
+    query = filter_diagnoses(query, request.args)
 
-    return jsonify([{
-        "report_date": row.report_date.strftime('%Y-%m-%d') if row.report_date else None,
-        "lesion_count": row.lesion_count,
-        "is_confirmed": row.is_confirmed,
-        "doctor_name": row.doctor_name,
-        "report_image": row.report_image,
-        "diagnosis_id": row.diagnosis_id
-    } for row in results])
+    def serialize(row):
+        return {
+            "report_date": row.report_date.strftime('%Y-%m-%d') if row.report_date else None,
+            "lesion_count": row.lesion_count,
+            "is_confirmed": row.is_confirmed,
+            "doctor_name": row.doctor_name,
+            "report_image": row.report_image,
+            "report_thumbnail": f"api/images/{image_key(row.report_image)}/thumbnail.jpg" if row.report_image else None,
+            "diagnosis_id": row.diagnosis_id
+        }
+
+    try:
+        return conditional_json(
+            keyset_page(query, request.args, serialize, key=lambda row: (row.report_date, row.diagnosis_id)),
+            etag
+        )
+    except ValueError:
+        return jsonify({'error': '无效的分页游标'}), 400
+
+
+
+@patient_bp.route('/lesion_summary', methods=['GET'])
+@swag_from({
+    'tags': ['Patient'],
+    'summary': '按病灶类型汇总患者的病灶数量和总面积',
+    'parameters': [
+        {'name': 'patient_id', 'in': 'query', 'type': 'integer', 'required': True},
+        {'name': 'date_from', 'in': 'query', 'type': 'string', 'format': 'date', 'required': False},
+        {'name': 'date_to', 'in': 'query', 'type': 'string', 'format': 'date', 'required': False},
+        {'name': 'confirmed', 'in': 'query', 'type': 'boolean', 'required': False}
+    ],
+    'responses': {200: {'description': '各类型病灶的数量、总面积和涉及的报告数'}}
+})
+def patient_lesion_summary():
+    patient_id = request.args.get('patient_id', type=int)
+    try:
+        # 直接在 SQL 中聚合，走 Diagnose(patient_id, ...) 和 Lesion(diagnosis_id, lesion_type, area) 索引
+        query = filter_diagnoses(
+            db.session.query(
+                Lesion.lesion_type,
+                func.count(Lesion.lesion_id).label('lesion_count'),
+                func.coalesce(func.sum(Lesion.area), 0).label('total_area'),
+                func.count(func.distinct(Lesion.diagnosis_id)).label('diagnosis_count')
+            ).join(Diagnose, Lesion.diagnosis_id == Diagnose.diagnosis_id)
+             .filter(Diagnose.patient_id == patient_id, Lesion.lesion_type.isnot(None)),
+            request.args
+        ).group_by(Lesion.lesion_type)
+
+        return jsonify([
+            {
+                'lesion_type': row.lesion_type.value,
+                'lesion_count': row.lesion_count,
+                'total_area': int(row.total_area),
+                'diagnosis_count': row.diagnosis_count
+            } for row in query
+        ])
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,50 @@
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from ..services.export_service import export_query, iter_export_zip
+from flasgger.utils import swag_from
+from datetime import datetime
+import os
+
+export_bp = Blueprint('export', __name__, url_prefix='/api/export')
+
+
+@export_bp.route('/reports', methods=['GET'])
+@swag_from({
+    'tags': ['Export'],
+    'summary': '以 ZIP 流式导出医生或患者的全部报告（JSON）及原始眼底图',
+    'produces': ['application/zip'],
+    'parameters': [
+        {'name': 'doctor_id', 'in': 'query', 'type': 'integer', 'required': False},
+        {'name': 'patient_id', 'in': 'query', 'type': 'integer', 'required': False},
+        {'name': 'date_from', 'in': 'query', 'type': 'string', 'format': 'date', 'required': False},
+        {'name': 'date_to', 'in': 'query', 'type': 'string', 'format': 'date', 'required': False},
+        {'name': 'confirmed', 'in': 'query', 'type': 'string', 'enum': ['true', 'false'], 'required': False}
+    ],
+    'responses': {
+        200: {
+            'description': 'ZIP 归档：reports/<诊断编号>.json、images/<图片哈希>.jpg、manifest.json'
+        },
+        400: {
+            'description': '缺少 doctor_id 或 patient_id'
+        }
+    }
+})
+def export_reports():
+    doctor_id = request.args.get('doctor_id', type=int)
+    patient_id = request.args.get('patient_id', type=int)
+    if doctor_id is None and patient_id is None:
+        return jsonify({'error': '缺少必要参数: doctor_id 或 patient_id'}), 400
+
+    upload_root = os.path.dirname(current_app.config['UPLOAD_FOLDER'])
+    owner = f'doctor{doctor_id}' if doctor_id is not None else f'patient{patient_id}'
+    filename = f"reports_{owner}_{datetime.now().strftime('%Y%m%d%H%M%S')}.zip"
+
+    # 边查询边写出，响应开始后才执行查询，整个归档不会驻留内存
+    response = Response(
+        stream_with_context(iter_export_zip(export_query(request.args), upload_root)),
+        mimetype='application/zip'
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    # 关闭反向代理（nginx）的响应缓冲
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
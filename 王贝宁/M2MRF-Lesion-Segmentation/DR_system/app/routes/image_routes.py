@@ -0,0 +1,120 @@
+from flask import Blueprint, jsonify, send_file
+from ..services.renditions import renditions, valid_key, VARIANTS
+from ..services.image_store import IMMUTABLE_MAX_AGE
+from flasgger.utils import swag_from
+import os
+
+image_bp = Blueprint('image', __name__, url_prefix='/api/images')
+
+
+def _send_immutable(path, etag, mimetype):
+    # 派生图内容由 key（原图哈希）唯一决定，永不变化
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=IMMUTABLE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+@image_bp.route('/<key>/<variant>.jpg', methods=['GET'])
+@swag_from({
+    'tags': ['Image'],
+    'summary': '获取眼底图的缩略图或预览图',
+    'parameters': [
+        {
+            'name': 'key',
+            'in': 'path',
+            'type': 'string',
+            'required': True,
+            'description': '图片哈希（image_hash）'
+        },
+        {
+            'name': 'variant',
+            'in': 'path',
+            'type': 'string',
+            'enum': list(VARIANTS),
+            'required': True
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'JPEG 图片'
+        },
+        304: {
+            'description': '未修改'
+        },
+        404: {
+            'description': '图片不存在'
+        }
+    }
+})
+def get_rendition(key, variant):
+    if variant not in VARIANTS or not valid_key(key):
+        return jsonify({'error': '图片不存在'}), 404
+    try:
+        path = renditions.ensure_variant(key, variant)
+        if not path:
+            return jsonify({'error': '图片不存在'}), 404
+        return _send_immutable(path, f"{key}-{variant}", 'image/jpeg')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@image_bp.route('/<key>.dzi', methods=['GET'])
+@swag_from({
+    'tags': ['Image'],
+    'summary': '获取 Deep Zoom 瓦片金字塔描述文件',
+    'parameters': [
+        {
+            'name': 'key',
+            'in': 'path',
+            'type': 'string',
+            'required': True
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'DZI XML'
+        },
+        202: {
+            'description': '瓦片正在生成，请稍后重试'
+        },
+        404: {
+            'description': '图片不存在'
+        }
+    }
+})
+def get_dzi(key):
+    if not valid_key(key) or not os.path.exists(renditions.original_path(key)):
+        return jsonify({'error': '图片不存在'}), 404
+    if not renditions.pyramid_ready(key):
+        renditions.schedule(key)
+        return jsonify({'status': 'pending'}), 202, {'Retry-After': '2'}
+    return _send_immutable(renditions.dzi_path(key), f"{key}-dzi", 'application/xml')
+
+
+@image_bp.route('/<key>_files/<int:level>/<int:col>_<int:row>.jpg', methods=['GET'])
+@swag_from({
+    'tags': ['Image'],
+    'summary': '获取 Deep Zoom 瓦片',
+    'parameters': [
+        {'name': 'key', 'in': 'path', 'type': 'string', 'required': True},
+        {'name': 'level', 'in': 'path', 'type': 'integer', 'required': True},
+        {'name': 'col', 'in': 'path', 'type': 'integer', 'required': True},
+        {'name': 'row', 'in': 'path', 'type': 'integer', 'required': True}
+    ],
+    'responses': {
+        200: {
+            'description': 'JPEG 瓦片'
+        },
+        404: {
+            'description': '瓦片不存在'
+        }
+    }
+})
+def get_tile(key, level, col, row):
+    if not valid_key(key):
+        return jsonify({'error': '瓦片不存在'}), 404
+    path = renditions.tile_path(key, level, col, row)
+    if not os.path.exists(path):
+        return jsonify({'error': '瓦片不存在'}), 404
+    return _send_immutable(path, f"{key}-{level}-{col}-{row}", 'image/jpeg')
@@ -0,0 +1,83 @@
+from flask import Blueprint, jsonify, send_from_directory, current_app
+from ..models import SegmentationJob, JobStatus
+from flasgger.utils import swag_from
+import os
+
+job_bp = Blueprint('job', __name__, url_prefix='/api/jobs')
+
+
+@job_bp.route('/<int:job_id>', methods=['GET'])
+@swag_from({
+    'tags': ['Job'],
+    'summary': '查询分割任务状态',
+    'parameters': [
+        {
+            'name': 'job_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '任务状态（queued/done/failed）'
+        },
+        404: {
+            'description': '任务不存在'
+        }
+    }
+})
+def get_job(job_id):
+    job = SegmentationJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+
+    result = {
+        'job_id': job.job_id,
+        'diagnosis_id': job.diagnosis_id,
+        'status': job.status.value,
+        'created_at': job.created_at.strftime('%Y-%m-%d %H:%M:%S') if job.created_at else None,
+        'finished_at': job.finished_at.strftime('%Y-%m-%d %H:%M:%S') if job.finished_at else None
+    }
+    if job.status == JobStatus.done:
+        result['lesion_count'] = job.diagnosis.lesion_count
+        result['mask_path'] = job.mask_path
+    elif job.status == JobStatus.failed:
+        result['error'] = job.error
+
+    return jsonify(result)
+
+
+@job_bp.route('/<int:job_id>/result', methods=['GET'])
+@swag_from({
+    'tags': ['Job'],
+    'summary': '获取分割结果掩码（PNG，像素值为病灶类别）',
+    'parameters': [
+        {
+            'name': 'job_id',
+            'in': 'path',
+            'type': 'integer',
+            'required': True
+        }
+    ],
+    'responses': {
+        200: {
+            'description': '分割结果图片'
+        },
+        404: {
+            'description': '任务不存在'
+        },
+        409: {
+            'description': '任务尚未完成'
+        }
+    }
+})
+def get_job_result(job_id):
+    job = SegmentationJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.status != JobStatus.done:
+        return jsonify({'error': '任务尚未完成', 'status': job.status.value}), 409
+
+    root = os.path.dirname(current_app.config['UPLOAD_FOLDER'])
+    return send_from_directory(root, job.mask_path, mimetype='image/png')
@@ -0,0 +1,48 @@
+from flask import Blueprint, jsonify, current_app
+from ..extensions import db
+from ..services.db_pool import pool_stats
+from ..services.metrics import request_metrics
+from flasgger.utils import swag_from
+
+system_bp = Blueprint('system', __name__, url_prefix='/api/system')
+# Prometheus 默认抓取 /metrics，不加 /api 前缀
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@system_bp.route('/db_pool', methods=['GET'])
+@swag_from({
+    'tags': ['System'],
+    'summary': '数据库连接池状态（当前 worker 进程）',
+    'responses': {
+        200: {
+            'description': '配置档、连接池大小、已取出连接数、取连接等待时间和超时次数'
+        }
+    }
+})
+def db_pool_status():
+    result = pool_stats.snapshot(db.engine.pool)
+    result['profile'] = current_app.config.get('PROFILE')
+    result['pool_class'] = type(db.engine.pool).__name__
+    return jsonify(result)
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+@swag_from({
+    'tags': ['System'],
+    'summary': 'Prometheus 指标（当前 worker 进程）',
+    'produces': ['text/plain'],
+    'responses': {
+        200: {
+            'description': '各路由的请求数、延迟、SQL 条数与耗时、响应大小直方图，以及连接池状态'
+        }
+    }
+})
+def metrics():
+    lines = request_metrics.render()
+    pool = pool_stats.snapshot(db.engine.pool)
+    for key, value in pool.items():
+        kind = 'counter' if key in ('checkouts', 'timeouts', 'wait_seconds_total') else 'gauge'
+        name = f'dr_db_pool_{key}' + ('_total' if key in ('checkouts', 'timeouts') else '')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n', 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
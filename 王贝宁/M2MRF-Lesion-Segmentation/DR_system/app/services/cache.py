@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    进程内的 LRU 缓存，条目可设置过期时间。
+    多个 gunicorn worker 之间不共享，因此只用于可以容忍短暂不一致、且会被主动失效的数据。
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        :param maxsize: 最多缓存的条目数，超出时淘汰最久未使用的条目
+        :param ttl: 过期秒数，None 表示只靠主动失效
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,92 @@
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from ..config import engine_options
+from ..extensions import db
+
+
+class PoolStats:
+    """连接池取连接的次数、等待时间和超时次数（进程内累计）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.wait_seconds_total = 0.0
+            self.wait_seconds_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def snapshot(self, pool=None):
+        with self._lock:
+            result = {
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+                'wait_seconds_avg': round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+        if isinstance(pool, QueuePool):
+            result.update({
+                'pool_size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+            })
+        return result
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录每次取连接等待时间的 QueuePool"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.record(time.perf_counter() - start, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - start)
+        return conn
+
+
+def configure_engine(app):
+    """
+    根据配置档设置 SQLALCHEMY_ENGINE_OPTIONS，需在 db.init_app 之前调用
+    """
+    options = engine_options(app.config)
+    if 'pool_size' in options:
+        options['poolclass'] = InstrumentedQueuePool
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', options)
+
+
+def init_engine(app):
+    """db.init_app 之后调用：为 SQLite 打开 WAL 和外键约束"""
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == 'sqlite':
+            @event.listens_for(engine, 'connect')
+            def _sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                # WAL 允许读写并发，压测时避免 database is locked
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA foreign_keys=ON')
+                cursor.close()
@@ -0,0 +1,124 @@
+import json
+import queue
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+
+class EventBroker:
+    """
+    进程内的发布/订阅，供 Server-Sent Events 推送诊断记录的增量变化。
+    每个医生一个频道，订阅者各自持有一个有界队列；消费过慢的订阅者被丢弃并收到 reset 事件，
+    客户端收到 reset 后重新拉取完整列表。
+    只在当前进程内广播：多 worker 部署时，事件只送达连接在同一 worker 上的客户端。
+    每个连接建立时先发送 reset，连接在 EVENT_STREAM_TIMEOUT 后结束并由 EventSource 重连，
+    因此其他 worker 上发布的事件最迟在一个超时周期后通过重新拉取体现出来。
+    每个连接在整个周期内占用一个 gthread 线程，所以每个进程最多 EVENT_MAX_SUBSCRIBERS 个连接，
+    其余线程留给普通请求。
+    """
+
+    def __init__(self, app=None, maxsize=100):
+        self.app = None
+        self.maxsize = maxsize
+        self._channels = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('EVENT_STREAM_TIMEOUT', 60)     # 单个连接最长保持秒数，之后由客户端自动重连
+        app.config.setdefault('EVENT_STREAM_HEARTBEAT', 15)   # 心跳间隔，防止代理断开空闲连接
+        app.config.setdefault('EVENT_MAX_SUBSCRIBERS', 4)     # 每个进程同时保持的连接数上限
+        self.app = app
+        app.extensions['event_broker'] = self
+
+    def subscribe(self, channel, limit=None):
+        """
+        :param limit: 本进程订阅者总数上限，None 表示不限
+        :return: 订阅者队列；已达上限时返回 None
+        """
+        subscriber = queue.Queue(maxsize=self.maxsize)
+        with self._lock:
+            if limit is not None and sum(len(subscribers) for subscribers in self._channels.values()) >= limit:
+                return None
+            self._channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def subscriber_count(self, channel=None):
+        with self._lock:
+            if channel is not None:
+                return len(self._channels.get(channel, ()))
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def publish(self, channel, event, data):
+        """
+        向频道内所有订阅者发送事件，不阻塞发布方
+        :param channel: 频道，如 ('doctor', doctor_id)
+        :param event: 事件名
+        :param data: 可 JSON 序列化的数据
+        """
+        message = (event, data)
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # 清空积压，只留下 reset，客户端据此重新拉取
+                self.unsubscribe(channel, subscriber)
+                _drain(subscriber)
+                subscriber.put_nowait(('reset', {}))
+
+    def stream(self, channel):
+        """
+        生成 text/event-stream 格式的响应体，在超时后结束，由 EventSource 自动重连
+        :return: 响应体；本进程连接数已达 EVENT_MAX_SUBSCRIBERS 时返回 None
+        """
+        timeout = self.app.config['EVENT_STREAM_TIMEOUT']
+        heartbeat = self.app.config['EVENT_STREAM_HEARTBEAT']
+        subscriber = self.subscribe(channel, limit=self.app.config['EVENT_MAX_SUBSCRIBERS'])
+        if subscriber is None:
+            return None
+
+        def generate():
+            deadline = time.monotonic() + timeout
+            # 告诉浏览器断线后 1 秒重连；连接（含重连）建立时先让客户端重新拉取，
+            # 补上断开期间以及其他 worker 上发布的事件
+            yield 'retry: 1000\n\n'
+            yield 'event: reset\ndata: {}\n\n'
+            while time.monotonic() < deadline:
+                try:
+                    event, data = subscriber.get(timeout=min(heartbeat, max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n'
+                if event == 'reset':
+                    return
+
+        # 响应关闭时取消订阅，生成器尚未开始迭代（连接在发送前断开）时也会执行
+        return ClosingIterator(generate(), lambda: self.unsubscribe(channel, subscriber))
+
+
+def _drain(subscriber):
+    try:
+        while True:
+            subscriber.get_nowait()
+    except queue.Empty:
+        pass
+
+
+def doctor_channel(doctor_id):
+    return ('doctor', int(doctor_id))
+
+
+event_broker = EventBroker()
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+import zipfile
+
+from ..extensions import db
+from ..models import Diagnose, Doctor, Patient
+from .pagination import filter_diagnoses
+from .renditions import image_key
+
+# 读取图片、向客户端输出的块大小
+CHUNK_SIZE = 64 * 1024
+# 每次从数据库取出的行数（MySQL 上使用服务端游标）
+FETCH_SIZE = 500
+
+
+class _StreamBuffer:
+    """
+    供 ZipFile 写入的只写缓冲区。不支持 seek，ZipFile 会改用数据描述符写每个条目，
+    生成器每写完一块就取走缓冲内容，内存占用与归档大小无关。
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_query(args):
+    """
+    导出范围：patient_id 或 doctor_id（至少一个），可加列表页的日期、审核状态筛选
+    """
+    query = db.session.query(
+        Diagnose.diagnosis_id,
+        Diagnose.diagnose_date,
+        Diagnose.confirmed,
+        Diagnose.lesion_count,
+        Diagnose.image_path,
+        Patient.patient_id,
+        Patient.name.label('patient_name'),
+        Doctor.doctor_id,
+        Doctor.name.label('doctor_name')
+    ).join(Patient, Diagnose.patient_id == Patient.patient_id
+    ).join(Doctor, Diagnose.doctor_id == Doctor.doctor_id)
+
+    if args.get('patient_id', type=int) is not None:
+        query = query.filter(Diagnose.patient_id == args.get('patient_id', type=int))
+    if args.get('doctor_id', type=int) is not None:
+        query = query.filter(Diagnose.doctor_id == args.get('doctor_id', type=int))
+    query = filter_diagnoses(query, args)
+    return query.order_by(Diagnose.diagnose_date, Diagnose.diagnosis_id).execution_options(
+        stream_results=True, yield_per=FETCH_SIZE
+    )
+
+
+def _report(row, image_name):
+    return {
+        'report_id': f"R{row.diagnose_date.strftime('%Y%m%d')}{row.diagnosis_id:03d}",
+        'diagnosis_id': row.diagnosis_id,
+        'patient_id': row.patient_id,
+        'patient_name': row.patient_name,
+        'doctor_id': row.doctor_id,
+        'doctor_name': row.doctor_name,
+        'check_date': row.diagnose_date.strftime('%Y-%m-%d'),
+        'status': '已审核' if row.confirmed else '待审核',
+        'lesion_count': row.lesion_count,
+        'image': image_name
+    }
+
+
+def iter_export_zip(query, upload_root):
+    """
+    逐条生成 ZIP 归档的字节块：reports/<诊断编号>.json 和 images/<图片 key>.jpg。
+    多份报告共用同一张图片时只写入一次。
+    :param query: export_query 返回的查询
+    :param upload_root: uploads 目录的上一级（Diagnose.image_path 相对于此目录）
+    """
+    buffer = _StreamBuffer()
+    written_images = set()
+    now = time.localtime()[:6]
+
+    with zipfile.ZipFile(buffer, mode='w', allowZip64=True) as archive:
+        count = 0
+        for row in query:
+            image_name = None
+            key = image_key(row.image_path)
+            image_file = os.path.join(upload_root, row.image_path) if row.image_path else None
+            if key and image_file and os.path.exists(image_file):
+                image_name = f'images/{key}.jpg'
+                if image_name not in written_images:
+                    written_images.add(image_name)
+                    # 图片已是 JPEG，不再压缩
+                    info = zipfile.ZipInfo(image_name, date_time=now)
+                    info.compress_type = zipfile.ZIP_STORED
+                    with archive.open(info, mode='w', force_zip64=True) as dest, open(image_file, 'rb') as src:
+                        while True:
+                            chunk = src.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            dest.write(chunk)
+                            yield buffer.drain()
+
+            info = zipfile.ZipInfo(f'reports/{row.diagnosis_id}.json', date_time=now)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, json.dumps(_report(row, image_name), ensure_ascii=False, indent=2))
+            count += 1
+            yield buffer.drain()
+
+        info = zipfile.ZipInfo('manifest.json', date_time=now)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        archive.writestr(info, json.dumps({
+            'report_count': count,
+            'image_count': len(written_images),
+            'exported_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }, ensure_ascii=False, indent=2))
+    # 关闭时写入中央目录
+    yield buffer.drain()
@@ -1,13 +1,172 @@
+import hashlib
+import json
 import os
-import openai
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from flask import current_app
 
-class GPTService:
-    def __init__(self):
-        self.api_key = os.getenv('OPENAI_API_KEY')
-        if not self.api_key:
+from .cache import TTLCache
+
+SYSTEM_PROMPT = "你是一个专业的眼科医生，请根据患者的眼底图像分析结果，给出专业的健康建议。"
+FALLBACK_ADVICE = "暂时无法生成健康建议，请稍后再试。"
+# 提示词模板有变化时加一，使旧的缓存建议失效
+PROMPT_VERSION = 1
+
+
+class OpenAIBackend:
+    """调用 OpenAI ChatCompletion 接口"""
+
+    def __init__(self, config):
+        import openai
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
             raise ValueError("OpenAI API key not found in environment variables")
-        openai.api_key = self.api_key
+        openai.api_key = api_key
+        self.openai = openai
+        self.model = config['GPT_MODEL']
+        self.timeout = config['GPT_TIMEOUT']
+
+    def complete(self, prompt):
+        response = self.openai.ChatCompletion.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=500,
+            request_timeout=self.timeout
+        )
+        return response.choices[0].message.content.strip()
+
+
+class StubBackend:
+    """本地桩实现，不访问网络，用于离线开发和压测；GPT_STUB_DELAY 模拟接口耗时"""
+
+    def __init__(self, config):
+        self.model = 'stub'
+        self.delay = config['GPT_STUB_DELAY']
+
+    def complete(self, prompt):
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[stub] {prompt.splitlines()[0]} 请定期复查，控制血糖、血压。"
+
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'stub': StubBackend,
+}
+
+
+def normalize_profile(lesion_info):
+    """
+    把病灶信息归一化为生成建议所依据的特征，特征相同的报告共用同一条建议
+    :param lesion_info: 病灶信息字典，包含病灶数量等
+    :return: 归一化后的字典
+    """
+    lesion_info = lesion_info or {}
+    return {'lesion_count': max(0, int(lesion_info.get('lesion_count') or 0))}
+
+
+class GPTService:
+    """
+    健康建议生成服务。
+    建议按病灶特征缓存（进程内 LRU + HealthAdvice 表），未命中时在有并发上限的线程池中生成，
+    相同特征的并发请求合并为一次接口调用。
+    生成失败的特征在 GPT_FAILURE_TTL 秒内不再重新提交，轮询方直接得到失败状态。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._backend = None
+        self._executor = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._cache = TTLCache(maxsize=1024)
+        self._failures = TTLCache(maxsize=1024)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('GPT_BACKEND', 'openai')
+        app.config.setdefault('GPT_MODEL', 'gpt-3.5-turbo')
+        app.config.setdefault('GPT_TIMEOUT', 20)          # 单次调用超时秒数
+        app.config.setdefault('GPT_MAX_RETRIES', 2)       # 失败后的重试次数
+        app.config.setdefault('GPT_MAX_CONCURRENCY', 4)   # 同时进行的接口调用数
+        app.config.setdefault('GPT_FAILURE_TTL', 60)      # 生成失败后暂停重试的秒数
+        app.config.setdefault('GPT_STUB_DELAY', 0.0)
+        self.app = app
+        self._backend = None
+        self._cache.clear()
+        self._failures.ttl = app.config['GPT_FAILURE_TTL']
+        self._failures.clear()
+        app.extensions['gpt_service'] = self
+
+    @property
+    def backend(self):
+        # 首次使用时再创建，未配置 API key 不影响应用启动
+        if self._backend is None:
+            self._backend = BACKENDS[self.app.config['GPT_BACKEND']](self.app.config)
+        return self._backend
+
+    def profile_key(self, profile):
+        raw = json.dumps(
+            [self.app.config['GPT_BACKEND'], self.app.config['GPT_MODEL'], PROMPT_VERSION, profile],
+            sort_keys=True
+        )
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def cached_advice(self, lesion_info):
+        """
+        只查缓存，不调用接口
+        :return: 建议文本；未生成过时返回 None
+        """
+        profile = normalize_profile(lesion_info)
+        return self._lookup(self.profile_key(profile))
+
+    def submit(self, lesion_info):
+        """
+        在后台生成建议，相同特征的进行中请求共用同一个 Future
+        :return: concurrent.futures.Future，结果为建议文本；最近生成失败时为已完成的失败 Future
+        """
+        profile = normalize_profile(lesion_info)
+        key = self.profile_key(profile)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            error = self._failures.get(key)
+            if error is not None:
+                future = Future()
+                future.set_exception(RuntimeError(error))
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['GPT_MAX_CONCURRENCY'],
+                    thread_name_prefix='gpt'
+                )
+            future = self._executor.submit(self._generate, key, profile)
+            self._inflight[key] = future
+        future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def advice_or_schedule(self, lesion_info):
+        """
+        报告页面使用：有缓存直接返回，否则登记后台生成并立即返回
+        :return: (status, advice)，status 为 'ready'、'pending' 或 'failed'；
+                 最近生成失败时不重新提交，advice 为 None
+        """
+        advice = self.cached_advice(lesion_info)
+        if advice is not None:
+            return 'ready', advice
+        future = self.submit(lesion_info)
+        if not future.done():
+            return 'pending', None
+        if future.exception() is not None:
+            return 'failed', None
+        return 'ready', future.result()
 
     def generate_health_advice(self, lesion_info):
         """
@@ -15,28 +174,71 @@ class GPTService:
         :param lesion_info: 病灶信息字典，包含病灶类型、数量等
         :return: 生成的健康建议
         """
+        advice = self.cached_advice(lesion_info)
+        if advice is not None:
+            return advice
+        config = self.app.config
         try:
-            # 构建提示词
-            prompt = self._build_prompt(lesion_info)
-            
-            # 调用GPT API
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的眼科医生，请根据患者的眼底图像分析结果，给出专业的健康建议。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=500
+            return self.submit(lesion_info).result(
+                timeout=config['GPT_TIMEOUT'] * (config['GPT_MAX_RETRIES'] + 1)
             )
-            
-            # 提取生成的建议
-            advice = response.choices[0].message.content.strip()
-            return advice
-            
         except Exception as e:
             current_app.logger.error(f"GPT API调用失败: {str(e)}")
-            return "暂时无法生成健康建议，请稍后再试。"
+            return FALLBACK_ADVICE
+
+    def _lookup(self, key):
+        advice = self._cache.get(key)
+        if advice is not None:
+            return advice
+        from ..models import HealthAdvice
+        row = HealthAdvice.query.get(key)
+        if row is None:
+            return None
+        self._cache.set(key, row.advice)
+        return row.advice
+
+    def _forget(self, key, future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            # 与移出 _inflight 在同一把锁内记下失败，轮询方不会在两者之间重新提交
+            if not future.cancelled() and future.exception() is not None:
+                self._failures.set(key, str(future.exception()))
+
+    def _generate(self, key, profile):
+        # 在线程池中执行
+        from ..extensions import db
+        from ..models import HealthAdvice
+        with self.app.app_context():
+            # 其他进程可能已经生成过
+            advice = self._lookup(key)
+            if advice is not None:
+                return advice
+
+            prompt = self._build_prompt(profile)
+            retries = self.app.config['GPT_MAX_RETRIES']
+            for attempt in range(retries + 1):
+                try:
+                    advice = self.backend.complete(prompt)
+                    break
+                except Exception as e:
+                    if attempt == retries:
+                        self.app.logger.error(f"GPT API调用失败: {str(e)}")
+                        raise
+                    time.sleep(2 ** attempt)
+
+            try:
+                db.session.merge(HealthAdvice(
+                    profile_key=key,
+                    profile=json.dumps(profile, sort_keys=True),
+                    model=self.backend.model,
+                    advice=advice
+                ))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"健康建议保存失败: {str(e)}")
+            self._cache.set(key, advice)
+            return advice
 
     def _build_prompt(self, lesion_info):
         """
@@ -46,13 +248,16 @@ class GPTService:
         """
         if not lesion_info or lesion_info.get('lesion_count', 0) == 0:
             return "患者眼底图像未检测到病灶，请给出日常护眼建议。"
-        
+
         prompt = f"患者眼底图像检测到{lesion_info['lesion_count']}个病灶。"
-        
+
         prompt += "\n请根据以上信息，给出专业的健康建议，包括：\n"
         prompt += "1. 对当前情况的简要说明\n"
         prompt += "2. 具体的治疗建议\n"
         prompt += "3. 日常注意事项\n"
         prompt += "4. 建议的复查时间"
-        
-        return prompt 
\ No newline at end of file
+
+        return prompt
+
+
+gpt_service = GPTService()
@@ -0,0 +1,28 @@
+import hashlib
+
+from flask import request, jsonify, current_app
+
+
+def make_etag(*parts):
+    """由若干字段（如记录编号、版本号、查询参数）生成 ETag"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def is_not_modified(etag):
+    """请求的 If-None-Match 是否与当前 ETag 一致"""
+    return request.if_none_match.contains(etag)
+
+
+def conditional_json(payload, etag):
+    """
+    带 ETag 的 JSON 响应；客户端缓存仍有效时返回 304，不再发送响应体
+    报告属于患者隐私数据，只允许浏览器私有缓存，每次使用前须重新验证
+    """
+    if is_not_modified(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
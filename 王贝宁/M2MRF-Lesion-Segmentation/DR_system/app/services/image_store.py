@@ -0,0 +1,222 @@
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+
+from ..extensions import db
+from ..models import Diagnose, SegmentationJob
+
+# 按内容哈希寻址的图片存储：uploads/diagnosis/ab/cd/abcd....jpg
+# 同一张图片只保存一份，引用计数由 Diagnose.image_path 的行数决定
+STORE_PREFIX = os.path.join('uploads', 'diagnosis')
+TMP_DIR = 'tmp'
+# 分割结果掩码：uploads/masks/<job_id>.png，由 SegmentationJob.mask_path 引用
+MASK_PREFIX = os.path.join('uploads', 'masks')
+_SHARD = re.compile(r'^[0-9a-f]{2}$')
+_BLOB = re.compile(r'^diagnosis/([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})\.jpg$')
+# 内容寻址的文件永不变化，浏览器可缓存一年
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def shard_path(digest, ext='.jpg'):
+    """
+    根据内容哈希计算分片后的相对路径
+    :param digest: sha256 十六进制摘要
+    :return: 相对于图片存储根目录的路径
+    """
+    return os.path.join(digest[:2], digest[2:4], digest + ext)
+
+
+def content_digest(filename):
+    """
+    判断 uploads 下的文件是否位于内容寻址存储中
+    :param filename: 相对于 uploads 目录的路径
+    :return: 内容哈希；其他文件返回 None
+    """
+    match = _BLOB.match(filename.replace('\\', '/'))
+    return match.group(3) if match else None
+
+
+def commit_blob(tmp_path, digest, folder):
+    """
+    将已写完的临时文件放入内容寻址存储，已存在相同内容时直接去重
+    :param tmp_path: 临时文件路径
+    :param digest: 文件内容的 sha256 摘要
+    :param folder: 图片存储根目录（uploads/diagnosis）
+    :return: 相对于存储根目录的路径
+    """
+    relpath = shard_path(digest)
+    target = os.path.join(folder, relpath)
+    try:
+        # 已存在相同内容：刷新修改时间，防止垃圾回收在新记录提交前删掉它
+        os.utime(target)
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+    return relpath
+
+
+def ref_count(image_path):
+    """
+    统计引用某个图片的诊断记录数
+    :param image_path: Diagnose.image_path 中存储的相对路径
+    """
+    return Diagnose.query.filter_by(image_path=image_path).count()
+
+
+class ImageGarbageCollector:
+    """
+    后台回收不再被任何 Diagnose 引用的图片。
+    删除诊断记录时调用 schedule() 登记候选图片，由后台线程检查引用计数后删除；
+    每隔 IMAGE_GC_INTERVAL 秒（不论期间是否有登记）还会做一次全量扫描，
+    清理遗留的孤立图片、掩码和上传临时文件，宽限期内跳过的文件也在扫描时重试。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_GC_GRACE_SECONDS', 600)
+        app.config.setdefault('IMAGE_GC_INTERVAL', 3600)
+        self.app = app
+        app.extensions['image_gc'] = self
+        if app.config['IMAGE_GC_INTERVAL']:
+            # 定期全量扫描不依赖删除操作触发，应用加载时即启动后台线程；
+            # gunicorn 预加载时线程留在主进程，worker 在第一次 schedule() 时各自启动
+            self._ensure_started()
+
+    def schedule(self, image_path):
+        """登记一个可能已无引用的图片，由后台线程异步回收"""
+        if not image_path:
+            return
+        self._ensure_started()
+        self._queue.put(image_path)
+
+    def collect(self, image_path):
+        """
+        立即检查并回收单个图片
+        :return: 是否删除了文件
+        """
+        if ref_count(image_path) > 0:
+            return False
+        return self._remove_original(image_path)
+
+    def sweep(self, batch_size=500):
+        """
+        全量扫描分片目录和掩码目录，删除没有任何 Diagnose / SegmentationJob 引用的文件
+        :return: 删除的文件数
+        """
+        folder = os.path.join(self.app.config['UPLOAD_FOLDER'], 'diagnosis')
+        removed = 0
+        batch = []
+        for level1 in _shards(folder):
+            for level2 in _shards(os.path.join(folder, level1)):
+                shard_dir = os.path.join(folder, level1, level2)
+                for name in os.listdir(shard_dir):
+                    batch.append(os.path.join(STORE_PREFIX, level1, level2, name))
+                    if len(batch) >= batch_size:
+                        removed += self._sweep_batch(batch)
+                        batch = []
+        if batch:
+            removed += self._sweep_batch(batch)
+
+        mask_dir = self._abspath(MASK_PREFIX)
+        if os.path.isdir(mask_dir):
+            names = os.listdir(mask_dir)
+            for start in range(0, len(names), batch_size):
+                removed += self._sweep_masks([os.path.join(MASK_PREFIX, name) for name in names[start:start + batch_size]])
+
+        # 清理上传中断留下的临时文件
+        tmp_dir = os.path.join(folder, TMP_DIR)
+        if os.path.isdir(tmp_dir):
+            for name in os.listdir(tmp_dir):
+                removed += self._remove_if_stale(os.path.join(tmp_dir, name))
+        return removed
+
+    def _sweep_batch(self, image_paths):
+        referenced = {
+            row.image_path for row in
+            db.session.query(Diagnose.image_path).filter(Diagnose.image_path.in_(image_paths)).distinct()
+        }
+        return sum(
+            self._remove_original(path)
+            for path in image_paths if path not in referenced
+        )
+
+    def _sweep_masks(self, mask_paths):
+        referenced = {
+            row.mask_path for row in
+            db.session.query(SegmentationJob.mask_path).filter(SegmentationJob.mask_path.in_(mask_paths))
+        }
+        return sum(
+            self._remove_if_stale(self._abspath(path))
+            for path in mask_paths if path not in referenced
+        )
+
+    def _remove_original(self, image_path):
+        # 原图删除后，其缩略图和瓦片一并删除
+        if not self._remove_if_stale(self._abspath(image_path)):
+            return False
+        from .renditions import image_key, DERIVED_DIR
+        shutil.rmtree(os.path.join(self.app.config['UPLOAD_FOLDER'], DERIVED_DIR, image_key(image_path)), ignore_errors=True)
+        return True
+
+    def _abspath(self, image_path):
+        return os.path.join(os.path.dirname(self.app.config['UPLOAD_FOLDER']), image_path)
+
+    def _remove_if_stale(self, path):
+        # 宽限期内的文件可能属于尚未提交的新记录，暂不删除
+        try:
+            if time.time() - os.path.getmtime(path) < self.app.config['IMAGE_GC_GRACE_SECONDS']:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='image-gc', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        interval = self.app.config['IMAGE_GC_INTERVAL'] or None
+        # 按固定的截止时间扫描，登记的回收任务不会推迟全量扫描
+        next_sweep = time.monotonic() + interval if interval else None
+        while True:
+            timeout = None if next_sweep is None else max(0, next_sweep - time.monotonic())
+            try:
+                image_path = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                image_path = None
+
+            with self.app.app_context():
+                try:
+                    if image_path is not None:
+                        self.collect(image_path)
+                    if next_sweep is not None and time.monotonic() >= next_sweep:
+                        next_sweep = time.monotonic() + interval
+                        removed = self.sweep()
+                        self.app.logger.info(f"图片垃圾回收完成，删除 {removed} 个文件")
+                except Exception as e:
+                    self.app.logger.error(f"图片垃圾回收失败: {str(e)}")
+                finally:
+                    db.session.remove()
+
+
+def _shards(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name for name in os.listdir(folder) if _SHARD.match(name))
+
+
+image_gc = ImageGarbageCollector()
@@ -0,0 +1,77 @@
+import numpy as np
+
+# 分割模型输出的类别编号 -> 病灶类型（与训练配置中的 CLASSES 顺序一致，0 为背景）
+DEFAULT_CLASSES = ('background', 'EX', 'HE', 'SE', 'MA')
+
+
+def encode_mask(mask):
+    """
+    对病灶外接矩形内的二值掩码做游程编码
+    按行优先展开，游程从 0 值开始交替，每个游程长度用 LEB128 变长整数存储
+    :param mask: 二维 bool/uint8 数组（外接矩形内的裁剪）
+    :return: bytes
+    """
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return b''
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    runs = np.diff(np.concatenate(([0], changes, [flat.size])))
+    if flat[0]:
+        runs = np.concatenate(([0], runs))
+
+    out = bytearray()
+    for run in runs.tolist():
+        while run >= 0x80:
+            out.append((run & 0x7f) | 0x80)
+            run >>= 7
+        out.append(run)
+    return bytes(out)
+
+
+def decode_mask(data, height, width):
+    """
+    encode_mask 的逆过程
+    :return: 形状为 (height, width) 的 bool 数组
+    """
+    runs = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            runs.append(value)
+            value = shift = 0
+    values = np.arange(len(runs)) % 2 == 1
+    return np.repeat(values, runs).reshape(height, width)
+
+
+def extract_lesions(seg, classes=DEFAULT_CLASSES):
+    """
+    从分割结果中提取每个连通域的几何信息
+    :param seg: 二维 uint8 数组，像素值为类别编号
+    :param classes: 类别编号到病灶类型名的映射
+    :return: 病灶字典列表，可直接传给 add_lesions
+    """
+    import cv2
+
+    lesions = []
+    for class_id in np.unique(seg):
+        if class_id == 0 or class_id >= len(classes):
+            continue
+        binary = (seg == class_id).astype(np.uint8)
+        count, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+        for label in range(1, count):
+            x, y, w, h, area = (int(v) for v in stats[label])
+            lesions.append({
+                'lesion_type': classes[class_id],
+                'area': area,
+                'bbox_x': x,
+                'bbox_y': y,
+                'bbox_w': w,
+                'bbox_h': h,
+                'centroid_x': float(centroids[label][0]),
+                'centroid_y': float(centroids[label][1]),
+                'mask_rle': encode_mask(labels[y:y + h, x:x + w] == label)
+            })
+    return lesions
@@ -0,0 +1,200 @@
+import bisect
+import threading
+import time
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+from ..extensions import db
+
+# 延迟（秒）和响应大小（字节）直方图的桶边界
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Prometheus 风格的累计直方图，按标签分组"""
+
+    def __init__(self, name, help, buckets, label_names):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted(self._series.items())
+            for labels, (counts, total, count) in items:
+                base = _labels(self.label_names, labels)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    le = f'le="{bound}"'
+                    lines.append(f'{self.name}_bucket{{{base + "," if base else ""}{le}}} {cumulative}')
+                lines.append(f'{self.name}_sum{{{base}}} {total}')
+                lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, label_names):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{{{_labels(self.label_names, labels)}}} {value}')
+        return lines
+
+
+def _labels(names, values):
+    return ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in zip(names, values)
+    )
+
+
+class RequestMetrics:
+    """
+    请求级性能指标：每个路由的延迟、SQL 条数与耗时、响应大小。
+    指标保存在进程内，多 worker 部署时由 Prometheus 分别抓取各 worker 或在网关处汇总。
+    超过 SLOW_REQUEST_MS 的请求写入慢请求日志，附带其中最慢几条 SELECT 的执行计划。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.requests = Counter('dr_http_requests_total', '请求总数', ('method', 'route', 'status'))
+        self.latency = Histogram(
+            'dr_http_request_duration_seconds', '请求处理耗时', LATENCY_BUCKETS, ('method', 'route'))
+        self.response_size = Histogram(
+            'dr_http_response_size_bytes', '响应体大小', SIZE_BUCKETS, ('method', 'route'))
+        self.sql_statements = Histogram(
+            'dr_sql_statements_per_request', '每个请求执行的 SQL 条数', COUNT_BUCKETS, ('method', 'route'))
+        self.sql_duration = Histogram(
+            'dr_sql_duration_seconds_per_request', '每个请求的 SQL 总耗时', LATENCY_BUCKETS, ('method', 'route'))
+        self.slow_requests = Counter('dr_slow_requests_total', '慢请求数', ('method', 'route'))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_REQUEST_MS', 1000)       # 0 表示关闭慢请求日志
+        app.config.setdefault('SLOW_REQUEST_EXPLAIN', True)  # 慢请求日志是否附带执行计划
+        app.config.setdefault('SLOW_REQUEST_EXPLAIN_TOP', 3)
+        self.app = app
+        app.extensions['request_metrics'] = self
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', _after_cursor_execute)
+
+    def render(self):
+        lines = []
+        for metric in (self.requests, self.latency, self.response_size,
+                       self.sql_statements, self.sql_duration, self.slow_requests):
+            lines.extend(metric.render())
+        return lines
+
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._sql_count = 0
+        g._sql_seconds = 0.0
+        g._sql_statements = []
+
+    def _after_request(self, response):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        labels = (request.method, route)
+
+        # 取出本请求的 SQL 统计，之后（如获取执行计划）执行的语句不再计入
+        sql_count = g.pop('_sql_count')
+        sql_seconds = g.pop('_sql_seconds')
+        statements = g.pop('_sql_statements')
+
+        self.requests.inc((request.method, route, response.status_code))
+        self.latency.observe(labels, elapsed)
+        self.sql_statements.observe(labels, sql_count)
+        self.sql_duration.observe(labels, sql_seconds)
+        # 流式响应没有 Content-Length，不计入大小
+        if response.content_length is not None:
+            self.response_size.observe(labels, response.content_length)
+
+        threshold = self.app.config['SLOW_REQUEST_MS']
+        if threshold and elapsed * 1000 >= threshold:
+            self.slow_requests.inc(labels)
+            self._log_slow_request(route, elapsed, sql_count, sql_seconds, statements)
+        return response
+
+    def _log_slow_request(self, route, elapsed, sql_count, sql_seconds, statements):
+        statements = sorted(statements, key=lambda item: item[2], reverse=True)
+        lines = [
+            f"慢请求 {request.method} {request.full_path} (route={route}) "
+            f"{elapsed * 1000:.1f}ms, SQL {sql_count} 条 / {sql_seconds * 1000:.1f}ms"
+        ]
+        for statement, parameters, seconds in statements[:self.app.config['SLOW_REQUEST_EXPLAIN_TOP']]:
+            lines.append(f"  {seconds * 1000:.1f}ms: {' '.join(statement.split())}")
+            if self.app.config['SLOW_REQUEST_EXPLAIN'] and statement.lstrip().upper().startswith('SELECT'):
+                for plan_row in _explain(statement, parameters):
+                    lines.append(f"    {plan_row}")
+        self.app.logger.warning('\n'.join(lines))
+
+
+# 每个请求最多保存的 SQL 语句数（用于慢请求日志），计数不受此限制
+MAX_CAPTURED_STATEMENTS = 100
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context() or not conn.info.get('_query_start'):
+        return
+    seconds = time.perf_counter() - conn.info['_query_start'].pop()
+    if '_sql_count' not in g:
+        return
+    g._sql_count += 1
+    g._sql_seconds += seconds
+    if len(g._sql_statements) < MAX_CAPTURED_STATEMENTS:
+        g._sql_statements.append((statement, parameters, seconds))
+
+
+def _explain(statement, parameters):
+    """用单独的连接获取 SELECT 的执行计划，失败时返回错误信息而不影响请求"""
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    try:
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + statement, parameters).fetchall()
+        return [' | '.join(str(value) for value in row) for row in rows]
+    except Exception as e:
+        return [f'EXPLAIN 失败: {str(e)}']
+
+
+request_metrics = RequestMetrics()
@@ -0,0 +1,80 @@
+from datetime import date
+
+from sqlalchemy import and_, or_
+
+from ..models import Diagnose
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# 未传 limit 和 cursor 的旧接口最多返回的条数，只包含最新的记录
+LEGACY_MAX_ROWS = 500
+
+
+def filter_diagnoses(query, args):
+    """
+    将列表页的筛选条件下推到 SQL
+    :param query: 以 Diagnose 为主表的查询
+    :param args: 请求参数，支持 date_from / date_to（YYYY-MM-DD，含当天）和 confirmed（true/false）
+    """
+    date_from = args.get('date_from', type=date.fromisoformat)
+    date_to = args.get('date_to', type=date.fromisoformat)
+    confirmed = args.get('confirmed')
+
+    if date_from:
+        query = query.filter(Diagnose.diagnose_date >= date_from)
+    if date_to:
+        query = query.filter(Diagnose.diagnose_date <= date_to)
+    if confirmed == 'true':
+        query = query.filter(Diagnose.confirmed == True)
+    elif confirmed == 'false':
+        query = query.filter(Diagnose.confirmed == False)
+    return query
+
+
+def encode_cursor(diagnose_date, diagnosis_id):
+    return f"{diagnose_date.strftime('%Y-%m-%d')}_{diagnosis_id}"
+
+
+def decode_cursor(cursor):
+    """
+    :raise ValueError: 游标格式不正确
+    """
+    diagnose_date, diagnosis_id = cursor.split('_')
+    return date.fromisoformat(diagnose_date), int(diagnosis_id)
+
+
+def keyset_page(query, args, serialize, key=lambda row: (row.diagnose_date, row.diagnosis_id)):
+    """
+    按 (diagnose_date, diagnosis_id) 倒序做游标分页
+    :param query: 以 Diagnose 为主表的查询，不需要自带排序
+    :param args: 请求参数，limit 为每页条数（最多 MAX_PAGE_SIZE），cursor 为上一页返回的 next_cursor
+    :param serialize: 把一行结果转换为字典
+    :param key: 从一行结果中取出 (diagnose_date, diagnosis_id)
+    :return: 未传 limit 和 cursor 时保持旧接口，返回最新的至多 LEGACY_MAX_ROWS 条记录的列表；
+             否则返回 {'items': [...], 'next_cursor': ...}
+    :raise ValueError: 游标格式不正确
+    """
+    query = query.order_by(Diagnose.diagnose_date.desc(), Diagnose.diagnosis_id.desc())
+    if 'limit' not in args and 'cursor' not in args:
+        return [serialize(row) for row in query.limit(LEGACY_MAX_ROWS).all()]
+
+    limit = max(1, min(args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    cursor = args.get('cursor')
+    if cursor:
+        cursor_date, cursor_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Diagnose.diagnose_date < cursor_date,
+            and_(Diagnose.diagnose_date == cursor_date, Diagnose.diagnosis_id < cursor_id)
+        ))
+
+    # 多取一条用来判断是否还有下一页
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*key(rows[-1]))
+
+    return {
+        'items': [serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    }
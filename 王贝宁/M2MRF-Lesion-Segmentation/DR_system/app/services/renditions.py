@@ -0,0 +1,186 @@
+import math
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .image_store import shard_path
+
+# 上传图片的派生图：缩略图、中等预览图和 Deep Zoom 瓦片金字塔
+# 存放在 uploads/derived/<key>/ 下，key 为原图文件名（内容寻址存储中即 sha256）
+DERIVED_DIR = 'derived'
+VARIANTS = {
+    'thumbnail': 256,
+    'preview': 1024,
+}
+TILE_SIZE = 254
+TILE_OVERLAP = 1
+TILE_FORMAT = 'jpg'
+JPEG_QUALITY = 85
+
+_KEY = re.compile(r'^[0-9A-Za-z_-]+$')
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def image_key(image_path):
+    """
+    从 Diagnose.image_path 得到派生图使用的 key
+    """
+    if not image_path:
+        return None
+    return os.path.splitext(os.path.basename(image_path.replace('\\', '/')))[0]
+
+
+def valid_key(key):
+    return bool(key and _KEY.match(key))
+
+
+class RenditionService:
+    """
+    在后台线程池中为上传的图片生成派生图。
+    派生图由原图内容唯一决定，生成后不再变化，可以用强 ETag 和长期缓存。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RENDITION_WORKERS', 2)
+        self.app = app
+        app.extensions['renditions'] = self
+
+    def original_path(self, key):
+        """根据 key 找到原图的绝对路径（兼容旧的平铺文件名）"""
+        folder = os.path.join(self.app.config['UPLOAD_FOLDER'], 'diagnosis')
+        if _SHA256.match(key):
+            return os.path.join(folder, shard_path(key))
+        return os.path.join(folder, f"{key}.jpg")
+
+    def derived_dir(self, key):
+        return os.path.join(self.app.config['UPLOAD_FOLDER'], DERIVED_DIR, key)
+
+    def variant_path(self, key, variant):
+        return os.path.join(self.derived_dir(key), f"{variant}.jpg")
+
+    def dzi_path(self, key):
+        return os.path.join(self.derived_dir(key), f"{key}.dzi")
+
+    def tile_path(self, key, level, col, row):
+        return os.path.join(self.derived_dir(key), f"{key}_files", str(level), f"{col}_{row}.{TILE_FORMAT}")
+
+    def pyramid_ready(self, key):
+        return os.path.exists(self.dzi_path(key))
+
+    def schedule(self, key):
+        """登记一张图片，在后台生成全部派生图"""
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.app.config['RENDITION_WORKERS'],
+                    thread_name_prefix='renditions'
+                )
+        self._executor.submit(self._generate_all, key)
+
+    def ensure_variant(self, key, variant):
+        """
+        返回派生图路径，尚未生成时同步生成（旧图片或后台任务还没轮到时）
+        :return: 派生图路径；原图不存在时返回 None
+        """
+        path = self.variant_path(key, variant)
+        if os.path.exists(path):
+            return path
+        source = self.original_path(key)
+        if not os.path.exists(source):
+            return None
+        from PIL import Image
+        with Image.open(source) as image:
+            self._write_variant(image.convert('RGB'), path, VARIANTS[variant])
+        return path
+
+    def _generate_all(self, key):
+        try:
+            from PIL import Image
+            source = self.original_path(key)
+            with Image.open(source) as image:
+                image = image.convert('RGB')
+                for variant, size in VARIANTS.items():
+                    path = self.variant_path(key, variant)
+                    if not os.path.exists(path):
+                        self._write_variant(image, path, size)
+                if not self.pyramid_ready(key):
+                    self._write_pyramid(image, key)
+        except Exception as e:
+            self.app.logger.error(f"生成派生图失败 {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    @staticmethod
+    def _write_variant(image, path, size):
+        copy = image.copy()
+        copy.thumbnail((size, size))
+        _atomic_save(copy, path)
+
+    def _write_pyramid(self, image, key):
+        width, height = image.size
+        max_level = int(math.ceil(math.log2(max(width, height)))) if max(width, height) > 1 else 0
+        level_image = image
+        for level in range(max_level, -1, -1):
+            scale = 2 ** (max_level - level)
+            level_width = max(1, int(math.ceil(width / scale)))
+            level_height = max(1, int(math.ceil(height / scale)))
+            if level_image.size != (level_width, level_height):
+                # 由上一层缩小得到，避免每层都从原图重新缩放
+                level_image = level_image.resize((level_width, level_height))
+            for col in range(int(math.ceil(level_width / TILE_SIZE))):
+                for row in range(int(math.ceil(level_height / TILE_SIZE))):
+                    left = max(0, col * TILE_SIZE - TILE_OVERLAP)
+                    top = max(0, row * TILE_SIZE - TILE_OVERLAP)
+                    right = min(level_width, (col + 1) * TILE_SIZE + TILE_OVERLAP)
+                    bottom = min(level_height, (row + 1) * TILE_SIZE + TILE_OVERLAP)
+                    _atomic_save(level_image.crop((left, top, right, bottom)), self.tile_path(key, level, col, row))
+
+        # 描述文件最后写入，它的存在即表示金字塔已完整生成
+        dzi = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="{TILE_FORMAT}" Overlap="{TILE_OVERLAP}" TileSize="{TILE_SIZE}">'
+            f'<Size Width="{width}" Height="{height}"/></Image>\n'
+        )
+        _atomic_write(self.dzi_path(key), lambda f: f.write(dzi.encode('utf-8')))
+
+
+def _atomic_save(image, path):
+    _atomic_write(path, lambda f: image.save(f, format='JPEG', quality=JPEG_QUALITY))
+
+
+def _atomic_write(path, write):
+    """
+    先写入同目录下的唯一临时文件再原子替换，多个线程或 worker 同时生成同一文件时互不干扰
+    :param write: 接收二进制文件对象的写入函数
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        # mkstemp 创建的文件只有属主可读，改为与普通上传文件一致
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+renditions = RenditionService()
@@ -0,0 +1,170 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from ..extensions import db
+from ..models import SegmentationJob, JobStatus, add_lesions
+from .lesion_geometry import extract_lesions, DEFAULT_CLASSES
+from .events import event_broker, doctor_channel
+from .image_store import MASK_PREFIX
+
+# 每个工作进程各自持有的分割模型，只在进程启动时加载一次
+_segmentor = None
+
+
+def _init_worker(config, checkpoint, device):
+    """工作进程初始化：加载 mmseg 分割模型（fork 时已从父进程继承则跳过）"""
+    global _segmentor
+    if _segmentor is not None:
+        return
+    from mmseg.apis import init_segmentor
+    _segmentor = init_segmentor(config, checkpoint, device=device)
+
+
+def _run_inference(image_file, mask_file, classes):
+    """
+    在工作进程中执行分割推理
+    :param image_file: 眼底图片的绝对路径
+    :param mask_file: 分割结果 PNG 的保存路径
+    :param classes: 类别编号到病灶类型名的映射
+    :return: 病灶列表，每个病灶为一个连通域（含类型、面积、外接矩形和游程编码掩码）
+    """
+    import cv2
+    import numpy as np
+    from mmseg.apis import inference_segmentor
+
+    seg = inference_segmentor(_segmentor, image_file)[0].astype(np.uint8)
+    os.makedirs(os.path.dirname(mask_file), exist_ok=True)
+    cv2.imwrite(mask_file, seg)
+
+    # 在工作进程内完成连通域分析和编码，只把紧凑的结果传回主进程
+    return extract_lesions(seg, classes)
+
+
+class SegmentationQueue:
+    """
+    本地分割任务队列。
+    提交的任务交给 SEGMENT_WORKERS 个常驻工作进程执行，每个进程只加载一次模型；
+    任务状态保存在 SegmentationJob 表中，完成后把病灶写入 Lesion 表。
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEGMENT_CONFIG', os.getenv('SEGMENT_CONFIG'))
+        app.config.setdefault('SEGMENT_CHECKPOINT', os.getenv('SEGMENT_CHECKPOINT'))
+        app.config.setdefault('SEGMENT_DEVICE', os.getenv('SEGMENT_DEVICE', 'cpu'))
+        app.config.setdefault('SEGMENT_WORKERS', int(os.getenv('SEGMENT_WORKERS', 1)))
+        app.config.setdefault('SEGMENT_CLASSES', DEFAULT_CLASSES)
+        self.app = app
+        app.extensions['segment_queue'] = self
+
+    @property
+    def available(self):
+        return bool(self.app.config['SEGMENT_CONFIG'] and self.app.config['SEGMENT_CHECKPOINT'])
+
+    def preload(self):
+        """
+        在当前进程加载模型。由 gunicorn 主进程在 fork worker 之前调用，
+        之后 worker 及其分割进程以 fork 方式创建，按写时复制共享模型权重，不再各自加载
+        """
+        if not self.available:
+            return
+        config = self.app.config
+        _init_worker(config['SEGMENT_CONFIG'], config['SEGMENT_CHECKPOINT'], config['SEGMENT_DEVICE'])
+
+    def fail_stale_jobs(self):
+        """
+        服务启动时调用一次（gunicorn 主进程 fork worker 之前，或开发服务器启动时）：
+        上次运行留下的排队任务已没有进程处理，标记为失败，前端轮询时可提示重新提交。
+        旧进程仍在运行时（如 gunicorn USR2 平滑重启）不要调用，否则会把旧 worker 正在处理的任务标记为失败
+        :return: 标记为失败的任务数
+        """
+        with self.app.app_context():
+            count = SegmentationJob.query.filter(SegmentationJob.status == JobStatus.queued).update({
+                'status': JobStatus.failed,
+                'error': '服务重启，任务中断，请重新提交',
+                'finished_at': datetime.now()
+            }, synchronize_session=False)
+            db.session.commit()
+            db.session.remove()
+        return count
+
+    def submit(self, job):
+        """
+        将已入库的任务放入队列
+        :param job: SegmentationJob 记录（需已提交以获得 job_id）
+        """
+        root = os.path.dirname(self.app.config['UPLOAD_FOLDER'])
+        future = self._get_executor().submit(
+            _run_inference,
+            os.path.join(root, job.image_path),
+            os.path.join(root, job.mask_path),
+            tuple(self.app.config['SEGMENT_CLASSES'])
+        )
+        job_id = job.job_id
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                config = self.app.config
+                self._executor = ProcessPoolExecutor(
+                    max_workers=config['SEGMENT_WORKERS'],
+                    # 已预加载模型时必须用 fork 才能继承
+                    mp_context=multiprocessing.get_context('fork') if _segmentor is not None else None,
+                    initializer=_init_worker,
+                    initargs=(config['SEGMENT_CONFIG'], config['SEGMENT_CHECKPOINT'], config['SEGMENT_DEVICE'])
+                )
+            return self._executor
+
+    def _on_done(self, job_id, future):
+        with self.app.app_context():
+            try:
+                job = SegmentationJob.query.get(job_id)
+                if job is None:
+                    return
+                error = future.exception()
+                if error is not None:
+                    job.status = JobStatus.failed
+                    job.error = str(error)[:255]
+                else:
+                    add_lesions(job.diagnosis_id, future.result())
+                    job.status = JobStatus.done
+                    job.error = None
+                job.finished_at = datetime.now()
+                db.session.commit()
+                if job.status == JobStatus.done:
+                    diagnosis = job.diagnosis
+                    event_broker.publish(doctor_channel(diagnosis.doctor_id), 'updated', {
+                        'diagnosis_id': diagnosis.diagnosis_id,
+                        'lesion_count': diagnosis.lesion_count
+                    })
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f"分割任务 {job_id} 结果写入失败: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+def create_job(diagnosis):
+    """
+    为诊断记录创建分割任务，与诊断记录在同一事务中写入；由调用方提交事务后再调用 segment_queue.submit 入队
+    :param diagnosis: 已 flush（获得 diagnosis_id）的 Diagnose 记录
+    :return: SegmentationJob
+    """
+    job = SegmentationJob(diagnosis_id=diagnosis.diagnosis_id, image_path=diagnosis.image_path)
+    db.session.add(job)
+    db.session.flush()
+    job.mask_path = os.path.join(MASK_PREFIX, f"{job.job_id}.png")
+    return job
+
+
+segment_queue = SegmentationQueue()
@@ -0,0 +1,64 @@
+import base64
+import hashlib
+import os
+import uuid
+
+from .image_store import TMP_DIR, commit_blob
+
+# 每次读写的块大小，上传文件不会整体驻留在内存中
+CHUNK_SIZE = 64 * 1024
+
+
+def save_stream(stream, folder, chunk_size=CHUNK_SIZE):
+    """
+    将上传流分块写入磁盘，写入的同时计算 SHA-256
+    :param stream: 可读的文件对象（request.stream 或 FileStorage.stream）
+    :param folder: 图片存储根目录
+    :param chunk_size: 每次读取的字节数
+    :return: (相对于 folder 的路径, sha256 十六进制摘要, 字节数)
+    """
+    return _save_chunks(iter(lambda: stream.read(chunk_size), b''), folder)
+
+
+def save_base64(data_url, folder, chunk_size=CHUNK_SIZE):
+    """
+    兼容旧的 JSON 提交方式：分段解码 base64 字符串并写入磁盘
+    :param data_url: "data:image/jpeg;base64,..." 或纯 base64 字符串
+    :param folder: 图片存储根目录
+    :param chunk_size: 每次解码的字符数（会对齐到 4 的倍数）
+    :return: (相对于 folder 的路径, sha256 十六进制摘要, 字节数)
+    """
+    # 移除 "data:image/jpeg;base64," 前缀
+    start = data_url.find(',') + 1
+    step = max(4, chunk_size - chunk_size % 4)
+
+    def chunks():
+        for offset in range(start, len(data_url), step):
+            yield base64.b64decode(data_url[offset:offset + step], validate=True)
+
+    return _save_chunks(chunks(), folder)
+
+
+def _save_chunks(chunks, folder):
+    tmp_dir = os.path.join(folder, TMP_DIR)
+    os.makedirs(tmp_dir, exist_ok=True)
+    # 先写入临时文件，哈希算完后再放入内容寻址存储，避免留下半截图片
+    tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4()}.part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        if size == 0:
+            raise ValueError('图片内容为空')
+        relpath = commit_blob(tmp_path, digest.hexdigest(), folder)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return relpath, digest.hexdigest(), size
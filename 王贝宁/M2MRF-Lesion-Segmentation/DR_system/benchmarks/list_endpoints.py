@@ -0,0 +1,151 @@
+"""
+列表接口压测：对比「关联 Lesion + GROUP BY、无二级索引」的旧查询
+与「Diagnose.lesion_count + 复合索引」的新接口的 p50/p99 延迟。
+
+用法（在 DR_system 目录下）：
+    python -m benchmarks.list_endpoints --diagnoses 50000 --requests 200
+默认使用临时 SQLite 数据库，也可以用 --database-uri 指向一个空的 MySQL 库。
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import func, text
+
+from app import create_app
+from app.extensions import db
+from app.models import Diagnose, Doctor, Lesion, Patient
+from app.routes import auth_routes
+from benchmarks.seed import seed
+
+INDEXES = {
+    'idx_diagnose_doctor_confirmed_date': 'Diagnose (doctor_id, confirmed, diagnose_date, diagnosis_id)',
+    'idx_diagnose_patient_date': 'Diagnose (patient_id, diagnose_date, diagnosis_id)',
+}
+
+
+def percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100 * (len(samples) - 1))))]
+
+
+def measure(fn, ids, requests):
+    rng = random.Random(1)
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn(rng.choice(ids))
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 50), percentile(samples, 99)
+
+
+# 改造前的查询（关联 Lesion 计数）
+def legacy_history(doctor_id):
+    return (
+        db.session.query(
+            Patient.name, Diagnose.diagnosis_id, Diagnose.diagnose_date,
+            func.count(Lesion.lesion_id), Diagnose.confirmed
+        ).join(Patient, Diagnose.patient_id == Patient.patient_id)
+         .outerjoin(Lesion, Diagnose.diagnosis_id == Lesion.diagnosis_id)
+         .filter(Diagnose.doctor_id == doctor_id)
+         .group_by(Diagnose.diagnosis_id, Patient.name, Diagnose.diagnose_date, Diagnose.confirmed)
+         .order_by(Diagnose.diagnose_date.desc()).all()
+    )
+
+
+def legacy_pending(doctor_id):
+    return (
+        db.session.query(
+            Patient.name, Diagnose.diagnosis_id, Diagnose.diagnose_date,
+            func.count(Lesion.lesion_id), Diagnose.confirmed
+        ).join(Patient, Diagnose.patient_id == Patient.patient_id)
+         .outerjoin(Lesion, Diagnose.diagnosis_id == Lesion.diagnosis_id)
+         .filter(Diagnose.doctor_id == doctor_id, Diagnose.confirmed == False)
+         .group_by(Diagnose.diagnosis_id, Patient.name, Diagnose.diagnose_date, Diagnose.confirmed)
+         .order_by(Diagnose.diagnose_date.desc()).all()
+    )
+
+
+def legacy_reports(patient_id):
+    return (
+        db.session.query(
+            Diagnose.diagnose_date, func.count(Lesion.lesion_id), Diagnose.confirmed,
+            Doctor.name, Diagnose.image_path, Diagnose.diagnosis_id
+        ).outerjoin(Lesion, Diagnose.diagnosis_id == Lesion.diagnosis_id)
+         .join(Doctor, Diagnose.doctor_id == Doctor.doctor_id)
+         .filter(Diagnose.patient_id == patient_id)
+         .group_by(Diagnose.diagnosis_id, Diagnose.diagnose_date, Diagnose.confirmed, Doctor.name, Diagnose.image_path)
+         .order_by(Diagnose.diagnose_date.desc()).all()
+    )
+
+
+def legacy_stats(doctor_id):
+    base = Diagnose.query.filter(Diagnose.doctor_id == doctor_id)
+    base.filter(Diagnose.confirmed == True, func.date(Diagnose.diagnose_date) == func.current_date()).count()
+    base.filter(Diagnose.confirmed == False).count()
+    base.filter(Diagnose.confirmed == True).count()
+    base.filter(
+        Diagnose.confirmed == True,
+        Diagnose.diagnosis_id.in_(db.session.query(Lesion.diagnosis_id).distinct())
+    ).count()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DR_system 列表接口延迟对比')
+    parser.add_argument('--database-uri', help='默认使用临时 SQLite 文件')
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--diagnoses', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=200, help='每个接口的请求次数')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='dr_bench_')
+    uri = args.database_uri or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': uri, 'UPLOAD_FOLDER': os.path.join(workdir, 'uploads')})
+    client = app.test_client()
+
+    with app.app_context():
+        print(f'写入 {args.diagnoses} 条诊断记录 ...')
+        ids = seed(doctors=args.doctors, patients=args.patients, diagnoses=args.diagnoses)
+        doctor_ids, patient_ids = ids['doctor_ids'], ids['patient_ids']
+
+        # 改造前：去掉复合索引，用关联计数的旧查询
+        for name in INDEXES:
+            db.session.execute(text(f'DROP INDEX {name}' + ('' if uri.startswith('sqlite') else ' ON Diagnose')))
+        db.session.commit()
+        before = {
+            'history': measure(legacy_history, doctor_ids, args.requests),
+            'pending_cases': measure(legacy_pending, doctor_ids, args.requests),
+            'reports': measure(legacy_reports, patient_ids, args.requests),
+            'stats': measure(legacy_stats, doctor_ids, args.requests),
+        }
+
+        for name, columns in INDEXES.items():
+            db.session.execute(text(f'CREATE INDEX {name} ON {columns}'))
+        db.session.commit()
+
+    # 改造后：直接请求接口（包含 JSON 序列化开销），统计缓存每次清空以测量真实查询
+    def get(url):
+        def request(key):
+            auth_routes._stats_cache.clear()
+            return client.get(url.format(key))
+        return request
+
+    after = {
+        'history': measure(get('/api/doctor/history?doctor_id={}'), doctor_ids, args.requests),
+        'pending_cases': measure(get('/api/doctor/pending_cases?doctor_id={}'), doctor_ids, args.requests),
+        'reports': measure(get('/api/patient/reports?patient_id={}'), patient_ids, args.requests),
+        'stats': measure(get('/api/doctor/stats?doctor_id={}'), doctor_ids, args.requests),
+        'history (limit=20)': measure(get('/api/doctor/history?doctor_id={}&limit=20'), doctor_ids, args.requests),
+    }
+
+    print(f"\n{'endpoint':<22}{'before p50':>12}{'before p99':>12}{'after p50':>12}{'after p99':>12}  (ms)")
+    for name, (p50, p99) in after.items():
+        b50, b99 = before.get(name, (float('nan'), float('nan')))
+        print(f'{name:<22}{b50:>12.2f}{b99:>12.2f}{p50:>12.2f}{p99:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+离线并发压测：用 create_app 在临时数据库上建应用、写入合成数据，
+多线程并发执行登录、工作台、历史记录、提交诊断、审核五个场景，
+输出每个接口的吞吐量和延迟分位数，并与保存的基线比较，出现退化时以非零状态退出（可用于 CI）。
+不需要 MySQL，也不需要启动服务。
+
+用法（在 DR_system 目录下）：
+    python -m benchmarks.load_test                                  # 与 benchmarks/baseline.json 比较
+    python -m benchmarks.load_test --save-baseline                  # 在当前机器上重新生成基线
+    python -m benchmarks.load_test --scenarios history,confirm --concurrency 16
+基线与机器相关，更换 CI 机器后需要重新生成；比较时默认允许 50% 的波动（--tolerance）。
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import create_app
+from app.extensions import db
+from app.models import Diagnose
+from benchmarks.list_endpoints import percentile
+from benchmarks.seed import seed
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# 基线中保存的延迟分位数；p99 受线程调度影响波动大，只记录不比较
+LATENCY_METRICS = ('p50', 'p95', 'p99')
+COMPARED_LATENCY = ('p50', 'p95')
+
+
+class Context:
+    """各场景共享的测试数据，供多个线程同时取用"""
+
+    def __init__(self, doctor_ids, patient_ids, pending_ids, images, seed=0):
+        self.doctor_ids = doctor_ids
+        self.patient_ids = patient_ids
+        self.images = images
+        self._pending = iter(pending_ids)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seed = itertools.count(seed)
+
+    @property
+    def rng(self):
+        # 每个线程独立的随机数生成器，结果可复现且无需加锁
+        if not hasattr(self._local, 'rng'):
+            self._local.rng = random.Random(next(self._seed))
+        return self._local.rng
+
+    def next_pending(self):
+        # 每条待审核记录只审核一次
+        with self._lock:
+            return next(self._pending)
+
+
+def scenario_login(client, ctx):
+    if ctx.rng.random() < 0.5:
+        username = f'doctor{ctx.rng.randrange(len(ctx.doctor_ids))}'
+    else:
+        username = f'patient{ctx.rng.randrange(len(ctx.patient_ids))}'
+    return client.post('/api/auth/login', json={'username': username, 'password': 'bench'})
+
+
+def scenario_dashboard(client, ctx):
+    return client.get(f'/api/doctor/dashboard?doctor_id={ctx.rng.choice(ctx.doctor_ids)}')
+
+
+def scenario_history(client, ctx):
+    # 与前端一致，按页获取
+    return client.get(f'/api/doctor/history?doctor_id={ctx.rng.choice(ctx.doctor_ids)}&limit=20')
+
+
+def scenario_submit(client, ctx):
+    return client.post('/api/auth/submit_diagnosis', data={
+        'patient_id': str(ctx.rng.choice(ctx.patient_ids)),
+        'doctor_id': str(ctx.rng.choice(ctx.doctor_ids)),
+        'segment': 'false',
+        'image': (io.BytesIO(ctx.rng.choice(ctx.images)), 'fundus.jpg')
+    })
+
+
+def scenario_confirm(client, ctx):
+    return client.put(f'/api/auth/diagnosis/{ctx.next_pending()}/confirm')
+
+
+SCENARIOS = {
+    'login': scenario_login,
+    'dashboard': scenario_dashboard,
+    'history': scenario_history,
+    'submit': scenario_submit,
+    'confirm': scenario_confirm,
+}
+
+
+def make_images(count, size=512):
+    """生成若干张不同的 JPEG，提交时随机选用（相同图片按内容去重，与真实重复上传一致）"""
+    from PIL import Image
+
+    rng = random.Random(0)
+    images = []
+    for _ in range(count):
+        image = Image.new('RGB', (size, size), tuple(rng.randrange(256) for _ in range(3)))
+        image.putpixel((rng.randrange(size), rng.randrange(size)), (255, 255, 255))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def run_scenario(app, ctx, fn, requests, concurrency, warmup):
+    """
+    用 concurrency 个线程（各自一个 test client）共执行 requests 次请求
+    :return: dict，包含 requests、errors、throughput（次/秒）和 p50/p95/p99（毫秒）
+    """
+    for _ in range(warmup):
+        fn(app.test_client(), ctx)
+
+    counter = itertools.count()
+    samples = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        local_samples, local_errors = [], []
+        while next(counter) < requests:
+            start = time.perf_counter()
+            try:
+                status = fn(client, ctx).status_code
+            except Exception as e:
+                status = repr(e)
+            local_samples.append((time.perf_counter() - start) * 1000)
+            if not isinstance(status, int) or status >= 400:
+                local_errors.append(status)
+        with lock:
+            samples.extend(local_samples)
+            errors.extend(local_errors)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_samples': sorted(set(map(str, errors)))[:5],
+        'throughput': len(samples) / elapsed,
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线比较，返回退化描述列表；基线中没有的场景不比较
+    """
+    regressions = []
+    for name, result in results.items():
+        if result['errors']:
+            regressions.append(f"{name}: {result['errors']} 个请求失败 {result['error_samples']}")
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric in COMPARED_LATENCY:
+            limit = base[metric] * (1 + tolerance)
+            if result[metric] > limit:
+                regressions.append(f'{name}: {metric} {result[metric]:.2f}ms > {limit:.2f}ms（基线 {base[metric]:.2f}ms）')
+        limit = base['throughput'] * (1 - tolerance)
+        if result['throughput'] < limit:
+            regressions.append(
+                f"{name}: 吞吐量 {result['throughput']:.1f}/s < {limit:.1f}/s（基线 {base['throughput']:.1f}/s）")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DR_system 离线并发压测')
+    parser.add_argument('--database-uri', help='默认使用临时 SQLite 文件')
+    parser.add_argument('--doctors', type=int, default=20)
+    parser.add_argument('--patients', type=int, default=2000)
+    parser.add_argument('--diagnoses', type=int, default=20000)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔，可选: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=300, help='每个场景的请求次数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发线程数')
+    parser.add_argument('--warmup', type=int, default=10, help='每个场景不计入统计的预热请求数')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入基线文件')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='允许的相对退化幅度')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    workdir = tempfile.mkdtemp(prefix='dr_load_')
+    try:
+        uri = args.database_uri or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': uri,
+            'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+            'GPT_BACKEND': 'stub',
+            'SWAGGER_ENABLED': False,
+            'SLOW_REQUEST_MS': 0
+        })
+
+        with app.app_context():
+            print(f'写入 {args.diagnoses} 条诊断记录 ...')
+            ids = seed(doctors=args.doctors, patients=args.patients, diagnoses=args.diagnoses)
+            pending_ids = [row.diagnosis_id for row in db.session.query(Diagnose.diagnosis_id).filter(Diagnose.confirmed == False)]
+            random.Random(0).shuffle(pending_ids)
+        needed = (args.requests + args.warmup) if 'confirm' in names else 0
+        if len(pending_ids) < needed:
+            parser.error(f'待审核记录只有 {len(pending_ids)} 条，confirm 场景需要 {needed} 条，请增大 --diagnoses')
+
+        ctx = Context(ids['doctor_ids'], ids['patient_ids'], pending_ids, make_images(16))
+        results = {}
+        for name in names:
+            results[name] = run_scenario(app, ctx, SCENARIOS[name], args.requests, args.concurrency, args.warmup)
+
+        print(f"\n{'scenario':<12}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+        for name, r in results.items():
+            print(f"{name:<12}{r['requests']:>10}{r['errors']:>8}{r['throughput']:>10.1f}"
+                  f"{r['p50']:>10.2f}{r['p95']:>10.2f}{r['p99']:>10.2f}")
+
+        params = {key: getattr(args, key) for key in ('doctors', 'patients', 'diagnoses', 'requests', 'concurrency')}
+        if args.save_baseline:
+            baseline = {
+                'params': params,
+                'results': {
+                    name: {key: round(r[key], 3) for key in ('throughput',) + LATENCY_METRICS}
+                    for name, r in results.items()
+                }
+            }
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump(baseline, f, indent=2, ensure_ascii=False)
+                f.write('\n')
+            print(f'\n基线已写入 {args.baseline}')
+            return
+
+        if not os.path.exists(args.baseline):
+            print(f'\n没有基线文件 {args.baseline}，跳过比较（用 --save-baseline 生成）')
+            regressions = compare(results, {}, args.tolerance)
+        else:
+            with open(args.baseline, encoding='utf-8') as f:
+                baseline = json.load(f)
+            if baseline.get('params') != params:
+                print(f"\n注意：基线的数据规模与本次不同 {baseline.get('params')}，比较结果仅供参考")
+            regressions = compare(results, baseline['results'], args.tolerance)
+
+        if regressions:
+            print('\n性能退化：')
+            for line in regressions:
+                print('  ' + line)
+            sys.exit(1)
+        print('\n未发现性能退化')
+    finally:
+        # 种子数据库和上传文件只供本次压测使用
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+生成压测用的合成数据（医生、患者、诊断、病灶）。
+只使用批量 INSERT，几十万行在 SQLite 上也能在数秒内写完。
+"""
+import random
+from datetime import date, timedelta
+
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models import User, UserRole, Doctor, Patient, Diagnose, Lesion, LesionType
+
+BATCH = 5000
+
+
+def _insert(model, rows):
+    for i in range(0, len(rows), BATCH):
+        db.session.execute(insert(model), rows[i:i + BATCH])
+
+
+def seed(doctors=20, patients=2000, diagnoses=50000, max_lesions=6, days=365, seed=0):
+    """
+    写入合成数据，需在 app_context 中调用
+    :param doctors: 医生数
+    :param patients: 患者数
+    :param diagnoses: 诊断记录数（在医生、患者之间随机分配）
+    :param max_lesions: 每条诊断的最大病灶数，约一半诊断没有病灶
+    :param days: 诊断日期分布在最近多少天内
+    :return: dict，包含生成的 doctor_ids、patient_ids
+    """
+    rng = random.Random(seed)
+    today = date.today()
+
+    users = [
+        {'user_id': i + 1, 'username': f'doctor{i}', 'password': 'bench', 'role': UserRole.doctor}
+        for i in range(doctors)
+    ] + [
+        {'user_id': doctors + i + 1, 'username': f'patient{i}', 'password': 'bench', 'role': UserRole.patient}
+        for i in range(patients)
+    ]
+    _insert(User, users)
+    _insert(Doctor, [
+        {'doctor_id': i + 1, 'user_id': i + 1, 'name': f'医生{i}'} for i in range(doctors)
+    ])
+    _insert(Patient, [
+        {
+            'patient_id': i + 1,
+            'user_id': doctors + i + 1,
+            'name': f'患者{i}',
+            'gender': rng.choice(['male', 'female']),
+            'date_of_birth': date(1950, 1, 1) + timedelta(days=rng.randrange(20000))
+        } for i in range(patients)
+    ])
+
+    diagnose_rows = []
+    lesion_rows = []
+    for i in range(diagnoses):
+        diagnosis_id = i + 1
+        lesion_count = rng.randrange(max_lesions + 1) if rng.random() < 0.5 else 0
+        diagnose_rows.append({
+            'diagnosis_id': diagnosis_id,
+            'patient_id': rng.randrange(patients) + 1,
+            'doctor_id': rng.randrange(doctors) + 1,
+            'image_path': f'uploads/diagnosis/bench/{diagnosis_id}.jpg',
+            'confirmed': rng.random() < 0.8,
+            'diagnose_date': today - timedelta(days=rng.randrange(days)),
+            'lesion_count': lesion_count
+        })
+        lesion_rows.extend({
+            'diagnosis_id': diagnosis_id,
+            'lesion_type': rng.choice(list(LesionType)),
+            'area': rng.randrange(4, 5000)
+        } for _ in range(lesion_count))
+    _insert(Diagnose, diagnose_rows)
+    _insert(Lesion, lesion_rows)
+    db.session.commit()
+
+    return {
+        'doctor_ids': list(range(1, doctors + 1)),
+        'patient_ids': list(range(1, patients + 1))
+    }
@@ -0,0 +1,59 @@
+"""
+生产环境启动配置（gunicorn），替代 run.py 中的开发服务器。
+
+部署步骤（在 DR_system 目录下）：
+    DR_PROFILE=production python migrate.py          # 显式建表 / 执行迁移
+    DR_PROFILE=production gunicorn -c gunicorn.conf.py run:app
+
+平滑重启：
+    kill -HUP <master pid>    逐个替换 worker（配置变化生效，代码仍为主进程预加载的版本）
+    kill -USR2 <master pid>   启动加载新代码的新主进程，确认正常后 kill -QUIT 旧主进程，全程不中断服务
+"""
+import multiprocessing
+import os
+
+bind = os.getenv('DR_BIND', '0.0.0.0:5000')
+
+# 预先 fork 的 worker 进程，每个 worker 内用线程并发处理请求，单个慢请求不会阻塞其他用户
+workers = int(os.getenv('DR_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# 每个打开的事件流（/api/doctor/events）占用一个线程，最长 EVENT_STREAM_TIMEOUT 秒后由客户端重连；
+# 每个 worker 最多 EVENT_MAX_SUBSCRIBERS（默认 4）个事件流，超出时返回 503，其余线程留给普通请求。
+# 调整 DR_THREADS 时相应调整 EVENT_MAX_SUBSCRIBERS，使其小于线程数
+threads = int(os.getenv('DR_THREADS', 8))
+
+# 主进程加载应用（以及 SEGMENT_PRELOAD 时的分割模型）后再 fork，worker 按写时复制共享，启动只需几毫秒
+preload_app = True
+
+timeout = int(os.getenv('DR_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# 处理一定请求数后轮换 worker，抖动避免所有 worker 同时重启
+max_requests = int(os.getenv('DR_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # 主进程：应用已加载，在 fork 之前清理上次运行遗留的排队任务，并按需加载分割模型
+    from app.services.segment_service import segment_queue
+    # USR2 启动的新主进程由旧主进程通过 GUNICORN_PID 告知其 pid（server.master_pid），
+    # 此时旧 worker 仍在处理排队的任务，不做清理
+    if not server.master_pid:
+        stale = segment_queue.fail_stale_jobs()
+        if stale:
+            server.log.warning(f'{stale} 个上次运行未完成的分割任务已标记为失败')
+    if os.getenv('SEGMENT_PRELOAD', '').lower() in ('1', 'true', 'yes'):
+        segment_queue.preload()
+        server.log.info('分割模型已在主进程加载')
+
+
+def post_fork(server, worker):
+    # 连接池不能跨进程共享：丢弃从主进程继承的连接（不关闭，避免影响主进程），每个 worker 重新建立
+    from app.extensions import db
+    from run import app
+    with app.app_context():
+        db.engine.dispose(close=False)
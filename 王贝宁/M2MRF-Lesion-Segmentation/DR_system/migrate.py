@@ -0,0 +1,82 @@
+"""
+显式的数据库迁移步骤，部署时在启动 worker 之前执行一次：
+    DR_PROFILE=production python migrate.py
+
+- 新数据库：按模型建表，并把 migrations/ 下的脚本全部记为已执行
+- 已有数据库：补建缺少的表，再按文件名顺序执行尚未执行过的 migrations/*.sql（MySQL 语法）
+- 之前手工执行过迁移脚本的库，先用 --fake 只登记不执行
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import inspect
+
+from app import create_app
+from app.extensions import db
+from app.models import SchemaMigration
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def migration_files():
+    return sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith('.sql'))
+
+
+def split_statements(sql):
+    """去掉注释和 USE 语句（库名由连接串决定），按分号拆成单条语句"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    statements = [statement.strip() for statement in '\n'.join(lines).split(';')]
+    return [s for s in statements if s and not s.upper().startswith('USE ')]
+
+
+def mark_applied(names):
+    for name in names:
+        db.session.add(SchemaMigration(filename=name))
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DR_system 数据库迁移')
+    parser.add_argument('--profile', help='配置档，默认取 DR_PROFILE 环境变量')
+    parser.add_argument('--fake', action='store_true', help='只把待执行的脚本登记为已执行')
+    args = parser.parse_args()
+
+    app = create_app(profile=args.profile, config={'AUTO_CREATE_TABLES': False, 'SWAGGER_ENABLED': False})
+    with app.app_context():
+        fresh = not inspect(db.engine).has_table('Diagnose')
+        db.create_all()
+
+        applied = {row.filename for row in SchemaMigration.query}
+        pending = [name for name in migration_files() if name not in applied]
+        if not pending:
+            print('数据库已是最新')
+            return
+
+        if fresh or args.fake:
+            # 新建的表已包含全部迁移内容
+            mark_applied(pending)
+            print(f"已登记 {len(pending)} 个迁移脚本: {', '.join(pending)}")
+            return
+
+        if db.engine.dialect.name != 'mysql':
+            print(f"迁移脚本为 MySQL 语法，{db.engine.dialect.name} 数据库请重建或手工处理: {', '.join(pending)}")
+            sys.exit(1)
+
+        for name in pending:
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as f:
+                statements = split_statements(f.read())
+            try:
+                for statement in statements:
+                    db.session.execute(db.text(statement))
+                mark_applied([name])
+            except Exception as e:
+                # MySQL 的 DDL 会隐式提交，失败的脚本可能已部分执行，需要人工确认后再用 --fake 登记
+                db.session.rollback()
+                print(f'执行 {name} 失败: {str(e)}')
+                sys.exit(1)
+            print(f'已执行 {name}')
+
+
+if __name__ == '__main__':
+    main()
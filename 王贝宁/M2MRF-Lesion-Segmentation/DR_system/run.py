@@ -3,4 +3,7 @@ from app import create_app
 app = create_app()
 
 if __name__ == "__main__":
+    # 开发服务器；生产环境使用 gunicorn -c gunicorn.conf.py run:app
+    from app.services.segment_service import segment_queue
+    segment_queue.fail_stale_jobs()
     app.run(debug=True)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from app.services.lesion_geometry import decode_mask, encode_mask, extract_lesions
+
+
+@pytest.mark.parametrize('shape', [(1, 1), (3, 5), (17, 31), (64, 300)])
+def test_mask_round_trip(shape):
+    rng = np.random.default_rng(0)
+    mask = rng.random(shape) < 0.3
+    assert np.array_equal(decode_mask(encode_mask(mask), *shape), mask)
+
+
+def test_mask_long_runs():
+    # 超过 127 的游程需要多个字节
+    mask = np.zeros((40, 500), dtype=bool)
+    mask[10:30, 100:400] = True
+    data = encode_mask(mask)
+    assert any(byte & 0x80 for byte in data)
+    assert np.array_equal(decode_mask(data, 40, 500), mask)
+
+
+def test_mask_empty():
+    mask = np.zeros((4, 6), dtype=bool)
+    # 只有一个 0 值游程
+    assert encode_mask(mask) == bytes([24])
+    assert np.array_equal(decode_mask(encode_mask(mask), 4, 6), mask)
+    assert encode_mask(np.zeros((0, 5), dtype=bool)) == b''
+    assert decode_mask(b'', 0, 5).shape == (0, 5)
+
+
+def test_mask_full():
+    mask = np.ones((200, 3), dtype=np.uint8)
+    # 以长度为 0 的 0 值游程开头，600 用两个字节存储
+    assert encode_mask(mask) == bytes([0, 0xd8, 0x04])
+    assert np.array_equal(decode_mask(encode_mask(mask), 200, 3), mask.astype(bool))
+
+
+def test_extract_lesions():
+    pytest.importorskip('cv2')
+    seg = np.zeros((20, 30), dtype=np.uint8)
+    seg[2:5, 3:9] = 1
+    seg[10:18, 20:22] = 1
+    seg[16:18, 22:26] = 1
+    seg[12:14, 5:6] = 4
+    seg[0, 29] = 7  # 超出类别表的编号被忽略
+    lesions = extract_lesions(seg)
+    assert sorted((lesion['lesion_type'], lesion['area']) for lesion in lesions) == [
+        ('EX', 18), ('EX', 24), ('MA', 2)]
+    classes = {'EX': 1, 'MA': 4}
+    for lesion in lesions:
+        x, y, w, h = (lesion[k] for k in ('bbox_x', 'bbox_y', 'bbox_w', 'bbox_h'))
+        mask = decode_mask(lesion['mask_rle'], h, w)
+        expected = seg[y:y + h, x:x + w] == classes[lesion['lesion_type']]
+        assert np.array_equal(mask, expected)
+        assert mask.sum() == lesion['area']
@@ -43,13 +43,63 @@ CREATE TABLE Diagnose (
     image_path VARCHAR(255),
     confirmed BOOLEAN DEFAULT FALSE,
     diagnose_date DATE NOT NULL,
+    lesion_count INT NOT NULL DEFAULT 0,
+    version INT NOT NULL DEFAULT 1,
     FOREIGN KEY (patient_id) REFERENCES Patient(patient_id) ON DELETE CASCADE,
-    FOREIGN KEY (doctor_id) REFERENCES Doctor(doctor_id) ON DELETE CASCADE
+    FOREIGN KEY (doctor_id) REFERENCES Doctor(doctor_id) ON DELETE CASCADE,
+    INDEX idx_diagnose_image_path (image_path),
+    INDEX idx_diagnose_doctor_confirmed_date (doctor_id, confirmed, diagnose_date, diagnosis_id),
+    INDEX idx_diagnose_patient_date (patient_id, diagnose_date, diagnosis_id)
 );
 
 -- Create Lesion table
 CREATE TABLE Lesion (
     lesion_id INT PRIMARY KEY AUTO_INCREMENT,
     diagnosis_id INT NOT NULL,
+    lesion_type ENUM('EX', 'HE', 'SE', 'MA'),
+    area INT,
+    bbox_x INT,
+    bbox_y INT,
+    bbox_w INT,
+    bbox_h INT,
+    centroid_x FLOAT,
+    centroid_y FLOAT,
+    mask_rle MEDIUMBLOB,
+    FOREIGN KEY (diagnosis_id) REFERENCES Diagnose(diagnosis_id) ON DELETE CASCADE,
+    INDEX idx_lesion_diagnosis_type (diagnosis_id, lesion_type, area)
+);
+
+-- Create SegmentationJob table
+CREATE TABLE SegmentationJob (
+    job_id INT PRIMARY KEY AUTO_INCREMENT,
+    diagnosis_id INT NOT NULL,
+    status ENUM('queued', 'done', 'failed') NOT NULL DEFAULT 'queued',
+    image_path VARCHAR(255) NOT NULL,
+    mask_path VARCHAR(255),
+    error VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME,
     FOREIGN KEY (diagnosis_id) REFERENCES Diagnose(diagnosis_id) ON DELETE CASCADE
-);
\ No newline at end of file
+);
+
+-- Create HealthAdvice table (generated advice cached by normalized lesion profile)
+CREATE TABLE HealthAdvice (
+    profile_key CHAR(64) PRIMARY KEY,
+    profile VARCHAR(255) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    advice TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create SchemaMigration table (migration files already applied, maintained by DR_system/migrate.py)
+CREATE TABLE SchemaMigration (
+    filename VARCHAR(255) PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- This schema already includes every file under migrations/
+INSERT INTO SchemaMigration (filename) VALUES
+    ('001_diagnose_indexes_lesion_count.sql'),
+    ('002_diagnose_version.sql'),
+    ('003_health_advice.sql'),
+    ('004_lesion_geometry.sql');
@@ -17,6 +17,12 @@ export const login = async (username, password, role) => {
 }
 
 /* ========== Doctor ========== */
+// 医生首页数据：统计、待处理病例和今日最近诊断一次返回
+export const getDoctorDashboard = async (doctor_id) => {
+  const response = await dbApi.get('/doctor/dashboard', { params: { doctor_id } })
+  return response.data
+}
+
 // 医生统计
 export const getDoctorStats = async (doctor_id) => {
   const response = await dbApi.get('/doctor/stats', { params: { doctor_id } })
@@ -36,17 +42,19 @@ export const getDoctorRecentDiagnoses = async (doctor_id) => {
 }
 
 // 医生诊断历史
-export const getDoctorDiagnosisHistory = async (doctor_id, confirmed = null) => {
-  const params = { doctor_id }
+// page 可包含 limit / cursor / date_from / date_to，传入 limit 或 cursor 时返回 { items, next_cursor }
+// 不传时返回最新的至多 500 条记录的数组
+export const getDoctorDiagnosisHistory = async (doctor_id, confirmed = null, page = {}) => {
+  const params = { doctor_id, ...page }
   if (confirmed !== null) params.confirmed = confirmed
   const response = await dbApi.get('/doctor/history', { params })
   return response.data
 }
 
 /* ========== Patient ========== */
-// 患者报告
-export const getPatientReports = async (patient_id) => {
-  const response = await dbApi.get('/patient/reports', { params: { patient_id } })
+// 患者报告（page 参数同上）
+export const getPatientReports = async (patient_id, page = {}) => {
+  const response = await dbApi.get('/patient/reports', { params: { patient_id, ...page } })
   return response.data
 }
 
@@ -110,10 +118,19 @@ export const getDiagnosisReport = async (reportId) => {
   }
 }
 
-// 提交诊断报告
+// 提交诊断报告（image 为 Blob/File 时以 multipart 流式上传，否则按旧的 JSON 方式提交）
 export const submitDiagnosis = async (diagnosisData) => {
   try {
-    const response = await dbApi.post('/auth/submit_diagnosis', diagnosisData)
+    let body = diagnosisData
+    let config = {}
+    if (diagnosisData.image instanceof Blob) {
+      body = new FormData()
+      Object.entries(diagnosisData).forEach(([key, value]) => {
+        if (value !== null && value !== undefined) body.append(key, value)
+      })
+      config = { headers: { 'Content-Type': 'multipart/form-data' } }
+    }
+    const response = await dbApi.post('/auth/submit_diagnosis', body, config)
     return response.data
   } catch (error) {
     console.error('提交诊断报告失败:', error)
@@ -132,6 +149,18 @@ export const getDiagnosisDetail = async (diagnosisId) => {
   }
 }
 
+// 获取健康建议：建议尚在生成时返回 { status: 'pending' }（HTTP 202），
+// 最近生成失败时以 HTTP 503 返回 { status: 'failed', health_advice: 兜底建议 }
+export const getHealthAdvice = async (diagnosisId) => {
+  try {
+    const response = await dbApi.get(`/auth/diagnosis/${diagnosisId}/advice`)
+    return response.data
+  } catch (error) {
+    console.error('获取健康建议失败:', error)
+    throw error
+  }
+}
+
 // 修改诊断报告审核状态
 export const confirmDiagnosis = async (diagnosisId) => {
   try {
@@ -152,4 +181,74 @@ export const deleteDiagnosis = async (diagnosisId) => {
     console.error('退回诊断报告失败:', error)
     throw error
   }
-} 
\ No newline at end of file
+} 
+
+// 批量审核诊断报告
+export const bulkConfirmDiagnosis = async (diagnosisIds) => {
+  try {
+    const response = await dbApi.put('/auth/diagnosis/bulk_confirm', { diagnosis_ids: diagnosisIds })
+    return response.data
+  } catch (error) {
+    console.error('批量审核失败:', error)
+    throw error
+  }
+}
+
+// 批量退回诊断报告
+export const bulkReturnDiagnosis = async (diagnosisIds) => {
+  try {
+    const response = await dbApi.post('/auth/diagnosis/bulk_return', { diagnosis_ids: diagnosisIds })
+    return response.data
+  } catch (error) {
+    console.error('批量退回失败:', error)
+    throw error
+  }
+}
+
+/* ========== Segmentation Jobs ========== */
+// 查询后台分割任务状态（submitDiagnosis 传入 segment: true 时返回 job_id）
+export const getSegmentationJob = async (jobId) => {
+  const response = await dbApi.get(`/jobs/${jobId}`)
+  return response.data
+}
+
+// 获取分割结果掩码
+export const getSegmentationResult = async (jobId) => {
+  const response = await dbApi.get(`/jobs/${jobId}/result`, { responseType: 'blob' })
+  return response.data
+}
+
+/* ========== Doctor Events (SSE) ========== */
+// 订阅医生的病例事件流：created / confirmed / returned / updated / reset
+// handlers 以事件名为键，返回用于取消订阅的函数；断线后浏览器自动重连
+// 每次连接（含重连）建立时服务端先发送 reset，调用方应据此重新拉取数据
+// 服务端连接数已满时返回 503，浏览器不会自动重连，这里等待后重新建立连接
+const EVENTS_RETRY_MS = 10000
+export const subscribeDoctorEvents = (doctor_id, handlers) => {
+  let source = null
+  let timer = null
+  const connect = () => {
+    source = new EventSource(`${dbApi.defaults.baseURL}/doctor/events?doctor_id=${doctor_id}`)
+    Object.entries(handlers).forEach(([event, handler]) => {
+      source.addEventListener(event, (e) => handler(JSON.parse(e.data)))
+    })
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        timer = setTimeout(connect, EVENTS_RETRY_MS)
+      }
+    }
+  }
+  connect()
+  return () => {
+    clearTimeout(timer)
+    source.close()
+  }
+}
+
+/* ========== Export ========== */
+// 报告导出地址：服务端边查询边写出 ZIP，直接交给浏览器下载，不经过 axios 在内存中拼装
+// params: { doctor_id } 或 { patient_id }，可加 date_from / date_to / confirmed
+export const getReportsExportUrl = (params) => {
+  const query = new URLSearchParams(params).toString()
+  return `${dbApi.defaults.baseURL}/export/reports?${query}`
+}
@@ -0,0 +1,37 @@
+-- Add list-query indexes and the denormalized lesion_count column to an existing MedicalDB
+-- (new databases created from create_medical_database.sql already include them)
+USE MedicalDB;
+
+ALTER TABLE Diagnose
+    ADD COLUMN lesion_count INT NOT NULL DEFAULT 0;
+
+-- Backfill lesion_count from the Lesion table
+UPDATE Diagnose d
+    LEFT JOIN (
+        SELECT diagnosis_id, COUNT(*) AS cnt
+        FROM Lesion
+        GROUP BY diagnosis_id
+    ) l ON l.diagnosis_id = d.diagnosis_id
+SET d.lesion_count = COALESCE(l.cnt, 0);
+
+-- Doctor lists and stats: filter by doctor and status, order by date
+CREATE INDEX idx_diagnose_doctor_confirmed_date ON Diagnose (doctor_id, confirmed, diagnose_date, diagnosis_id);
+
+-- Patient report list
+CREATE INDEX idx_diagnose_patient_date ON Diagnose (patient_id, diagnose_date, diagnosis_id);
+
+-- Content-addressed image reference counting
+CREATE INDEX idx_diagnose_image_path ON Diagnose (image_path);
+
+-- SegmentationJob table for the background segmentation queue
+CREATE TABLE IF NOT EXISTS SegmentationJob (
+    job_id INT PRIMARY KEY AUTO_INCREMENT,
+    diagnosis_id INT NOT NULL,
+    status ENUM('queued', 'done', 'failed') NOT NULL DEFAULT 'queued',
+    image_path VARCHAR(255) NOT NULL,
+    mask_path VARCHAR(255),
+    error VARCHAR(255),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME,
+    FOREIGN KEY (diagnosis_id) REFERENCES Diagnose(diagnosis_id) ON DELETE CASCADE
+);
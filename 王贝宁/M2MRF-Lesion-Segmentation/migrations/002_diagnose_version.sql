@@ -0,0 +1,6 @@
+-- Add the per-diagnosis version counter used for ETags to an existing MedicalDB
+-- (new databases created from create_medical_database.sql already include it)
+USE MedicalDB;
+
+ALTER TABLE Diagnose
+    ADD COLUMN version INT NOT NULL DEFAULT 1;
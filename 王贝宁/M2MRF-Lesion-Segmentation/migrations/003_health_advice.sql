@@ -0,0 +1,11 @@
+-- Add the HealthAdvice cache table to an existing MedicalDB
+-- (new databases created from create_medical_database.sql already include it)
+USE MedicalDB;
+
+CREATE TABLE IF NOT EXISTS HealthAdvice (
+    profile_key CHAR(64) PRIMARY KEY,
+    profile VARCHAR(255) NOT NULL,
+    model VARCHAR(64) NOT NULL,
+    advice TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,17 @@
+-- Add per-lesion geometry (type, area, bbox, centroid, RLE mask) to an existing MedicalDB
+-- (new databases created from create_medical_database.sql already include it)
+USE MedicalDB;
+
+ALTER TABLE Lesion
+    ADD COLUMN lesion_type ENUM('EX', 'HE', 'SE', 'MA'),
+    ADD COLUMN area INT,
+    ADD COLUMN bbox_x INT,
+    ADD COLUMN bbox_y INT,
+    ADD COLUMN bbox_w INT,
+    ADD COLUMN bbox_h INT,
+    ADD COLUMN centroid_x FLOAT,
+    ADD COLUMN centroid_y FLOAT,
+    ADD COLUMN mask_rle MEDIUMBLOB;
+
+-- Per-type filtering and aggregation; the leading diagnosis_id also serves the foreign key
+CREATE INDEX idx_lesion_diagnosis_type ON Lesion (diagnosis_id, lesion_type, area);